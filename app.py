@@ -1,11 +1,24 @@
 import asyncio
 from contextlib import asynccontextmanager
-from fastapi import FastAPI
+from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import os
-from routes import generation_routes, user_routes
-from queue_manager import worker 
+from routes import generation_routes, user_routes, batch_routes
+from queue_manager import worker, job_janitor, resume_account_deletions
+from utils.cleanup_queue import cleanup_worker
 from config.global_init import initialize_hf_token
+from utils.cache_utils import cache
+from utils.job_metrics import job_metrics
+from utils.image_preprocessing import shutdown_preprocessing_pool
+from utils.model_conversion import conversion_cache_janitor
+from utils.http_client import close_http_client
+from utils.gradio_async_client import close_space_http_client
+from utils.scratch import scratch_janitor, disk_status
+from utils.webhooks import webhook_delivery_worker
+from utils.space_warmup import space_warmup, space_warmup_scheduler
+from utils.glb_variants import check_gltf_transform
+from middleware.upload_limits_middleware import UploadLimitMiddleware
+from middleware.auth_middleware_fastapi import require_metrics_token
 import logging
 
 NUM_WORKERS = 20 
@@ -15,6 +28,7 @@ async def lifespan(app: FastAPI):
     logging.info("Iniciando la aplicación...")
     
     initialize_hf_token()
+    check_gltf_transform()
     
     worker_tasks = []
     
@@ -22,6 +36,18 @@ async def lifespan(app: FastAPI):
     for i in range(NUM_WORKERS):
         task = asyncio.create_task(worker(worker_id=i + 1))
         worker_tasks.append(task)
+
+    worker_tasks.append(asyncio.create_task(cleanup_worker()))
+    worker_tasks.append(asyncio.create_task(conversion_cache_janitor()))
+    worker_tasks.append(asyncio.create_task(webhook_delivery_worker()))
+    worker_tasks.append(asyncio.create_task(space_warmup_scheduler()))
+    worker_tasks.append(asyncio.create_task(scratch_janitor()))
+    worker_tasks.append(asyncio.create_task(job_janitor()))
+
+    try:
+        await resume_account_deletions()
+    except Exception as e:
+        logging.error(f"No se pudieron retomar las purgas de cuentas pendientes: {e}", exc_info=True)
     
     yield 
     
@@ -35,6 +61,10 @@ async def lifespan(app: FastAPI):
     except asyncio.CancelledError:
         logging.info("Los workers han sido cancelados durante el apagado.")
 
+    shutdown_preprocessing_pool()
+    await close_http_client()
+    await close_space_http_client()
+
 app = FastAPI(
     lifespan=lifespan,
     title="Instant3D Backend",
@@ -46,6 +76,9 @@ origins = [
     os.environ.get("FRONTEND_URL", "http://localhost:5173"),
 ]
 
+# Se registra antes que CORS para que sus respuestas 413 también lleven las cabeceras CORS.
+app.add_middleware(UploadLimitMiddleware)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -54,6 +87,7 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+app.include_router(batch_routes.router)
 app.include_router(generation_routes.router)
 app.include_router(user_routes.router)
 
@@ -61,6 +95,22 @@ app.include_router(user_routes.router)
 def read_root():
     return {"message": "Bienvenido a la API de CubeAI v2 con FastAPI y Pool de Workers"}
 
+@app.get("/metrics/cache", dependencies=[Depends(require_metrics_token)])
+def read_cache_metrics():
+    return cache.info()
+
+@app.get("/metrics/jobs", dependencies=[Depends(require_metrics_token)])
+def read_job_metrics():
+    return job_metrics.snapshot()
+
+@app.get("/metrics/scratch", dependencies=[Depends(require_metrics_token)])
+def read_scratch_metrics():
+    return disk_status()
+
+@app.get("/metrics/spaces", dependencies=[Depends(require_metrics_token)])
+def read_space_metrics():
+    return space_warmup.snapshot()
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.environ.get("PORT", 8000))
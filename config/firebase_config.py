@@ -1,30 +1,41 @@
 import os
 from dotenv import load_dotenv
-import firebase_admin
-from firebase_admin import credentials, firestore, storage
 
 load_dotenv()
 
-cred_dict = {
-    "type": os.getenv('FIREBASE_TYPE'),
-    "project_id": os.getenv('FIREBASE_PROJECT_ID'),
-    "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
-    "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
-    "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
-    "client_id": os.getenv('FIREBASE_CLIENT_ID'),
-    "auth_uri": os.getenv('FIREBASE_AUTH_URI'),
-    "token_uri": os.getenv('FIREBASE_TOKEN_URI'),
-    "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL'),
-    "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL'),
-    "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN')
-}
-
 storage_bucket = os.getenv('FIREBASE_STORAGE_BUCKET')
 
-cred = credentials.Certificate(cred_dict)
-firebase_admin.initialize_app(cred, {
-    'storageBucket': storage_bucket
-})
+# FIREBASE_BACKEND=fake sustituye Firestore, Storage y Auth por los simulados en
+# memoria de fakes/firebase.py (pruebas de carga sin credenciales ni red).
+FIREBASE_BACKEND = os.getenv('FIREBASE_BACKEND', 'firebase').lower()
+
+if FIREBASE_BACKEND == 'fake':
+    from fakes.firebase import FakeBucket, fake_auth as auth, fake_firestore as firestore
+
+    db = firestore.client()
+    bucket = FakeBucket(storage_bucket or 'instant3d-fake.appspot.com')
+else:
+    import firebase_admin
+    from firebase_admin import auth, credentials, firestore, storage
+
+    cred_dict = {
+        "type": os.getenv('FIREBASE_TYPE'),
+        "project_id": os.getenv('FIREBASE_PROJECT_ID'),
+        "private_key_id": os.getenv('FIREBASE_PRIVATE_KEY_ID'),
+        "private_key": os.getenv('FIREBASE_PRIVATE_KEY').replace('\\n', '\n'),
+        "client_email": os.getenv('FIREBASE_CLIENT_EMAIL'),
+        "client_id": os.getenv('FIREBASE_CLIENT_ID'),
+        "auth_uri": os.getenv('FIREBASE_AUTH_URI'),
+        "token_uri": os.getenv('FIREBASE_TOKEN_URI'),
+        "auth_provider_x509_cert_url": os.getenv('FIREBASE_AUTH_PROVIDER_X509_CERT_URL'),
+        "client_x509_cert_url": os.getenv('FIREBASE_CLIENT_X509_CERT_URL'),
+        "universe_domain": os.getenv('FIREBASE_UNIVERSE_DOMAIN')
+    }
+
+    cred = credentials.Certificate(cred_dict)
+    firebase_admin.initialize_app(cred, {
+        'storageBucket': storage_bucket
+    })
 
-db = firestore.client()
-bucket = storage.bucket()
\ No newline at end of file
+    db = firestore.client()
+    bucket = storage.bucket()
@@ -1,15 +1,145 @@
 from dotenv import load_dotenv
+import asyncio
+import copy
+import logging
 import os
+import threading
 import gradio_client
+from utils.gradio_schema_cache import gradio_schema_cache
+from utils.gradio_async_client import (
+    AsyncSpaceClient, ExecutorSpaceClient, SUPPORTED_PROTOCOLS, get_space_http_client
+)
+from utils.space_warmup import resolve_space_url, space_base_url
+from utils.scratch import current_workspace
 
 load_dotenv()
 
-def create_hf_client(url):
+# Revalidaciones de esquema en segundo plano del cliente asíncrono.
+_refresh_tasks = set()
+
+class CachedSchemaClient(gradio_client.Client):
+    """
+    Cliente Gradio que toma el config y la información de la API de la caché de
+    esquemas en lugar de descargarlos. Si el Space ya no tiene un endpoint pedido,
+    el esquema guardado se considera obsoleto y se invalida.
+
+    Sobrescribe métodos privados de gradio_client (_get_config, _get_api_info,
+    _infer_fn_index): la versión está fijada en requirements.txt por ese motivo.
+    """
+    def __init__(self, url, cached_schema=None, **kwargs):
+        self._schema_url = url
+        self._cached_schema = cached_schema
+        super().__init__(cached_schema["src"] if cached_schema else url, **kwargs)
+
+    def _get_config(self):
+        if self._cached_schema is not None:
+            return copy.deepcopy(self._cached_schema["config"])
+        return super()._get_config()
+
+    def _get_api_info(self):
+        if self._cached_schema is not None:
+            return copy.deepcopy(self._cached_schema["api_info"])
+        return super()._get_api_info()
+
+    def _infer_fn_index(self, api_name, fn_index):
+        try:
+            return super()._infer_fn_index(api_name, fn_index)
+        except ValueError:
+            if self._cached_schema is not None:
+                logging.warning(f"El esquema en caché de {self._schema_url} no coincide con la API ({api_name}). Se invalida.")
+                gradio_schema_cache.invalidate(self._schema_url)
+            raise
+
+def _hf_headers():
+    return {"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"}
+
+def _fetch_schema(url, **client_kwargs):
+    client = CachedSchemaClient(url, headers=_hf_headers(), **client_kwargs)
+    gradio_schema_cache.put(url, client.src, client.config, client._info)
+    return client
+
+def _refresh_schema(url):
+    try:
+        client = _fetch_schema(url)
+        close = getattr(client, "close", None)
+        if close:
+            close()
+    except Exception as e:
+        logging.warning(f"No se pudo revalidar el esquema Gradio de {url}: {e}")
+    finally:
+        gradio_schema_cache.end_refresh(url)
+
+def create_hf_client(url, download_dir=None):
+    url = resolve_space_url(url)
     try:
-        return gradio_client.Client(
-            url,
-            headers={"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"}  # <-- Añade esto
-        )
+        cached_schema = gradio_schema_cache.get(url)
+        client_kwargs = {"download_files": download_dir} if download_dir else {}
+        if cached_schema is None:
+            return _fetch_schema(url, **client_kwargs)
+
+        try:
+            client = CachedSchemaClient(url, cached_schema, headers=_hf_headers(), **client_kwargs)
+        except Exception as e:
+            logging.warning(f"El esquema en caché de {url} no sirvió para crear el cliente ({e}). Se descarga de nuevo.")
+            gradio_schema_cache.invalidate(url)
+            return _fetch_schema(url, **client_kwargs)
+
+        if gradio_schema_cache.is_stale(cached_schema) and gradio_schema_cache.begin_refresh(url):
+            threading.Thread(target=_refresh_schema, args=(url,), daemon=True).start()
+        return client
+    except Exception as e:
+        logging.error(f"Error al crear cliente HF para {url}: {e}", exc_info=True)
+        raise
+
+async def _fetch_schema_async(url):
+    src = f"{space_base_url(url)}/"
+    http_client = get_space_http_client()
+    response = await http_client.get(f"{src}config", headers=_hf_headers())
+    response.raise_for_status()
+    config = response.json()
+    api_prefix = config.get("api_prefix", "").strip("/")
+    response = await http_client.get(f"{src}{api_prefix + '/' if api_prefix else ''}info", headers=_hf_headers())
+    response.raise_for_status()
+    api_info = response.json()
+    gradio_schema_cache.put(url, src, config, api_info)
+    return gradio_schema_cache.get(url)
+
+async def _refresh_schema_async(url):
+    try:
+        await _fetch_schema_async(url)
     except Exception as e:
-        print(f"Error al crear cliente HF para {url}: {e}")
-        raise
\ No newline at end of file
+        logging.warning(f"No se pudo revalidar el esquema Gradio de {url}: {e}")
+    finally:
+        gradio_schema_cache.end_refresh(url)
+
+async def _reload_schema_async(url):
+    # El Space rechazó los datos con el esquema en caché: se descarta y se descarga de nuevo.
+    gradio_schema_cache.invalidate(url)
+    return await _fetch_schema_async(url)
+
+async def create_async_hf_client(url):
+    """
+    Cliente asíncrono para un Space. Con un protocolo de cola que no sea SSE se
+    usa gradio_client desde el executor, con la misma interfaz.
+    """
+    url = resolve_space_url(url)
+    loop = asyncio.get_running_loop()
+    try:
+        schema = await loop.run_in_executor(None, gradio_schema_cache.get, url)
+        if schema is None:
+            schema = await _fetch_schema_async(url)
+        elif gradio_schema_cache.is_stale(schema) and gradio_schema_cache.begin_refresh(url):
+            task = asyncio.create_task(_refresh_schema_async(url))
+            _refresh_tasks.add(task)
+            task.add_done_callback(_refresh_tasks.discard)
+    except Exception as e:
+        logging.error(f"Error al crear cliente HF para {url}: {e}", exc_info=True)
+        raise
+
+    if schema["config"].get("protocol") not in SUPPORTED_PROTOCOLS:
+        return ExecutorSpaceClient(await loop.run_in_executor(None, create_hf_client, url, current_workspace()))
+    return AsyncSpaceClient(
+        schema["src"], schema["config"], schema["api_info"],
+        headers=_hf_headers(),
+        refresh_schema=lambda: _reload_schema_async(url),
+    )
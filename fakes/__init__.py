@@ -0,0 +1,4 @@
+"""
+Sustitutos locales de los servicios externos (Firebase y los Spaces de Hugging
+Face) para ejecutar la aplicación completa sin conexión, p. ej. en pruebas de carga.
+"""
@@ -0,0 +1,666 @@
+"""
+Firestore, Cloud Storage y Firebase Auth en memoria, con la parte de la API de
+firebase_admin que usa la aplicación. Se activan con FIREBASE_BACKEND=fake (ver
+config/firebase_config.py); los datos se pierden al reiniciar el proceso.
+
+Autenticación: cualquier token con el formato de un UID (letras, dígitos, '-' y
+'_') se acepta y ese es el UID del usuario. Los tokens que empiezan por
+"expired-" se rechazan como caducados.
+"""
+import copy
+import datetime
+import functools
+import re
+import threading
+import uuid
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+from google.api_core import exceptions as gcloud_exceptions
+
+DOCUMENT_ID = "__name__"
+_UID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,128}$")
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+# --- Firestore ---------------------------------------------------------------
+
+class Increment:
+    def __init__(self, value):
+        self.value = value
+
+class _Sentinel:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+SERVER_TIMESTAMP = _Sentinel("SERVER_TIMESTAMP")
+DELETE_FIELD = _Sentinel("DELETE_FIELD")
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+    def __init__(self, db: "FakeFirestore", path: str, filters=(), orders=(), projection=None,
+                 cursor=None, limit_count=None):
+        self._db = db
+        self._path = path
+        self._filters = tuple(filters)
+        self._orders = tuple(orders)
+        self._projection = projection
+        self._cursor = cursor
+        self._limit = limit_count
+
+    def _copy(self, **changes) -> "Query":
+        params = {
+            "filters": self._filters, "orders": self._orders, "projection": self._projection,
+            "cursor": self._cursor, "limit_count": self._limit,
+        }
+        params.update(changes)
+        return Query(self._db, self._path, **params)
+
+    def where(self, field_path: str, op_string: str, value: Any) -> "Query":
+        if op_string not in _OPERATORS:
+            raise ValueError(f"Operador no soportado por el Firestore simulado: {op_string}")
+        return self._copy(filters=self._filters + ((field_path, op_string, value),))
+
+    def order_by(self, field_path: str, direction: str = ASCENDING) -> "Query":
+        return self._copy(orders=self._orders + ((field_path, direction),))
+
+    def select(self, field_paths: Iterable[str]) -> "Query":
+        return self._copy(projection=list(field_paths))
+
+    def start_after(self, document_fields) -> "Query":
+        if isinstance(document_fields, DocumentSnapshot):
+            values = document_fields.to_dict() or {}
+            values[DOCUMENT_ID] = document_fields.id
+        else:
+            values = dict(document_fields)
+        return self._copy(cursor=values)
+
+    def limit(self, count: int) -> "Query":
+        return self._copy(limit_count=count)
+
+    def _orderings(self) -> List[Tuple[str, str]]:
+        # Firestore ordena siempre por el ID del documento para desempatar.
+        orders = list(self._orders)
+        if not any(field == DOCUMENT_ID for field, _ in orders):
+            orders.append((DOCUMENT_ID, orders[-1][1] if orders else Query.ASCENDING))
+        return orders
+
+    def _sort_key(self, values: Dict[str, Any], orders) -> Tuple:
+        return tuple(_OrderValue(values.get(field), direction) for field, direction in orders)
+
+    def stream(self, transaction=None):
+        orders = self._orderings()
+        rows = []
+        for doc_id, document in self._db._documents_in(self._path):
+            data = document["data"]
+            if not all(_matches(_field_value(data, doc_id, field), op, value) for field, op, value in self._filters):
+                continue
+            # Igual que en Firestore, los documentos sin el campo de ordenación quedan fuera.
+            if any(field != DOCUMENT_ID and _field_value(data, doc_id, field, _MISSING) is _MISSING for field, _ in self._orders):
+                continue
+            values = {field: _field_value(data, doc_id, field) for field, _ in orders}
+            rows.append((self._sort_key(values, orders), doc_id, document))
+
+        rows.sort(key=lambda row: row[0])
+        if self._cursor is not None:
+            cursor_key = self._sort_key(self._cursor, orders)
+            rows = [row for row in rows if row[0] > cursor_key]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+
+        for _, doc_id, document in rows:
+            data = document["data"]
+            if self._projection is not None:
+                data = _project(data, self._projection)
+            yield DocumentSnapshot(DocumentReference(self._db, f"{self._path}/{doc_id}"), data, document)
+
+    def get(self, transaction=None) -> List["DocumentSnapshot"]:
+        return list(self.stream(transaction=transaction))
+
+class CollectionReference(Query):
+    def __init__(self, db: "FakeFirestore", path: str):
+        super().__init__(db, path)
+
+    @property
+    def id(self) -> str:
+        return self._path.rsplit("/", 1)[-1]
+
+    def document(self, document_id: Optional[str] = None) -> "DocumentReference":
+        return DocumentReference(self._db, f"{self._path}/{document_id or uuid.uuid4().hex[:20]}")
+
+    def list_documents(self, page_size: Optional[int] = None):
+        return [self.document(doc_id) for doc_id, _ in self._db._documents_in(self._path)]
+
+class DocumentReference:
+    def __init__(self, db: "FakeFirestore", path: str):
+        self._db = db
+        self.path = path
+
+    @property
+    def id(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    def __eq__(self, other):
+        return isinstance(other, DocumentReference) and other.path == self.path
+
+    def __hash__(self):
+        return hash(self.path)
+
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self._db, f"{self.path}/{collection_id}")
+
+    def collections(self) -> List[CollectionReference]:
+        return [self.collection(name) for name in self._db._subcollections(self.path)]
+
+    def get(self, field_paths=None, transaction=None) -> "DocumentSnapshot":
+        with self._db._lock:
+            document = self._db._documents.get(self.path)
+            data = copy.deepcopy(document["data"]) if document else None
+        if data is not None and field_paths is not None:
+            data = _project(data, field_paths)
+        return DocumentSnapshot(self, data, document)
+
+    def set(self, document_data: Dict[str, Any], merge: bool = False):
+        self._db._apply([("set", self, document_data, merge)])
+
+    def update(self, field_updates: Dict[str, Any]):
+        self._db._apply([("update", self, field_updates, False)])
+
+    def delete(self):
+        self._db._apply([("delete", self, None, False)])
+
+class DocumentSnapshot:
+    def __init__(self, reference: DocumentReference, data: Optional[dict], document: Optional[dict]):
+        self.reference = reference
+        self._data = data
+        self.create_time = document["create_time"] if document else None
+        self.update_time = document["update_time"] if document else None
+
+    @property
+    def id(self) -> str:
+        return self.reference.id
+
+    @property
+    def exists(self) -> bool:
+        return self._data is not None
+
+    def to_dict(self) -> Optional[dict]:
+        return copy.deepcopy(self._data)
+
+    def get(self, field_path: str):
+        value = _field_value(self._data or {}, self.id, field_path, _MISSING)
+        if value is _MISSING:
+            raise KeyError(f"'{field_path}' no está en el documento {self.reference.path}")
+        return copy.deepcopy(value)
+
+class WriteBatch:
+    def __init__(self, db: "FakeFirestore"):
+        self._db = db
+        self._writes = []
+
+    def set(self, reference: DocumentReference, document_data: Dict[str, Any], merge: bool = False):
+        self._writes.append(("set", reference, document_data, merge))
+
+    def update(self, reference: DocumentReference, field_updates: Dict[str, Any]):
+        self._writes.append(("update", reference, field_updates, False))
+
+    def delete(self, reference: DocumentReference):
+        self._writes.append(("delete", reference, None, False))
+
+    def commit(self):
+        writes, self._writes = self._writes, []
+        self._db._apply(writes)
+        return writes
+
+class Transaction(WriteBatch):
+    """Las transacciones se serializan con el bloqueo global del Firestore simulado."""
+
+def transactional(to_wrap):
+    @functools.wraps(to_wrap)
+    def wrapper(transaction: Transaction, *args, **kwargs):
+        with transaction._db._lock:
+            result = to_wrap(transaction, *args, **kwargs)
+            transaction.commit()
+        return result
+    return wrapper
+
+class FieldPath:
+    @staticmethod
+    def document_id() -> str:
+        return DOCUMENT_ID
+
+class FakeFirestore:
+    def __init__(self):
+        self._documents: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+
+    def collection(self, collection_id: str) -> CollectionReference:
+        return CollectionReference(self, collection_id)
+
+    def document(self, document_path: str) -> DocumentReference:
+        return DocumentReference(self, document_path)
+
+    def collections(self) -> List[CollectionReference]:
+        with self._lock:
+            names = {path.split("/", 1)[0] for path in self._documents}
+        return [self.collection(name) for name in sorted(names)]
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch(self)
+
+    def transaction(self, **kwargs) -> Transaction:
+        return Transaction(self)
+
+    def get_all(self, references: Iterable[DocumentReference], field_paths=None, transaction=None):
+        for reference in references:
+            yield reference.get(field_paths=field_paths)
+
+    def _documents_in(self, collection_path: str):
+        prefix = f"{collection_path}/"
+        with self._lock:
+            items = [
+                (path[len(prefix):], {**document, "data": copy.deepcopy(document["data"])})
+                for path, document in self._documents.items()
+                if path.startswith(prefix) and "/" not in path[len(prefix):]
+            ]
+        return sorted(items, key=lambda item: item[0])
+
+    def _subcollections(self, document_path: str) -> List[str]:
+        prefix = f"{document_path}/"
+        with self._lock:
+            return sorted({path[len(prefix):].split("/", 1)[0] for path in self._documents if path.startswith(prefix)})
+
+    def _apply(self, writes):
+        """Aplica las escrituras de forma atómica: o todas o ninguna."""
+        with self._lock:
+            staged = {}
+            for kind, reference, payload, merge in writes:
+                current = staged[reference.path] if reference.path in staged else self._documents.get(reference.path)
+                if kind == "delete":
+                    staged[reference.path] = None
+                    continue
+                if kind == "update" and current is None:
+                    raise gcloud_exceptions.NotFound(f"No existe el documento {reference.path}")
+                base = copy.deepcopy(current["data"]) if current is not None and (merge or kind == "update") else {}
+                staged[reference.path] = {
+                    "data": _apply_fields(base, payload, nested=(kind == "update")),
+                    "create_time": current["create_time"] if current is not None else None,
+                }
+
+            timestamp = _now()
+            for path, document in staged.items():
+                if document is None:
+                    self._documents.pop(path, None)
+                    continue
+                document["create_time"] = document["create_time"] or timestamp
+                document["update_time"] = timestamp
+                self._documents[path] = document
+
+_MISSING = object()
+
+def _field_value(data: dict, doc_id: str, field_path: str, default=None):
+    if field_path == DOCUMENT_ID:
+        return doc_id
+    value = data
+    for part in field_path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return default
+        value = value[part]
+    return value
+
+def _project(data: dict, field_paths: Iterable[str]) -> dict:
+    projected = {}
+    for field_path in field_paths:
+        value = _field_value(data, "", field_path, _MISSING)
+        if value is _MISSING:
+            continue
+        target = projected
+        *parents, leaf = field_path.split(".")
+        for part in parents:
+            target = target.setdefault(part, {})
+        target[leaf] = copy.deepcopy(value)
+    return projected
+
+def _resolve(value, previous):
+    if isinstance(value, Increment):
+        return (previous if isinstance(previous, (int, float)) else 0) + value.value
+    if value is SERVER_TIMESTAMP:
+        return _now()
+    if isinstance(value, dict):
+        return {key: _resolve(item, None) for key, item in value.items() if item is not DELETE_FIELD}
+    return copy.deepcopy(value)
+
+def _apply_fields(base: dict, payload: dict, nested: bool) -> dict:
+    """
+    Aplica `payload` sobre `base`. En update las claves con puntos son rutas de
+    campo anidadas; en set(merge=True) los diccionarios se combinan recursivamente.
+    """
+    for key, value in payload.items():
+        parts = key.split(".") if nested else [key]
+        target = base
+        for part in parts[:-1]:
+            if not isinstance(target.get(part), dict):
+                target[part] = {}
+            target = target[part]
+        leaf = parts[-1]
+        if value is DELETE_FIELD:
+            target.pop(leaf, None)
+        elif isinstance(value, dict) and not nested and isinstance(target.get(leaf), dict):
+            target[leaf] = _apply_fields(target[leaf], value, nested=False)
+        else:
+            target[leaf] = _resolve(value, target.get(leaf))
+    return base
+
+# Orden de tipos de Firestore: null < bool < números < fechas < cadenas < bytes < resto.
+def _type_rank(value) -> int:
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, datetime.datetime):
+        return 3
+    if isinstance(value, str):
+        return 4
+    if isinstance(value, bytes):
+        return 5
+    return 6
+
+@functools.total_ordering
+class _OrderValue:
+    def __init__(self, value, direction: str):
+        self.value = value
+        self.descending = direction == Query.DESCENDING
+
+    def _key(self):
+        rank = _type_rank(self.value)
+        return (rank, self.value if rank in (1, 2, 3, 4, 5) else repr(self.value))
+
+    def __eq__(self, other):
+        return self._key() == other._key()
+
+    def __lt__(self, other):
+        return self._key() > other._key() if self.descending else self._key() < other._key()
+
+def _compare(a, b, predicate) -> bool:
+    if _type_rank(a) != _type_rank(b):
+        return False
+    try:
+        return predicate(a, b)
+    except TypeError:
+        return False
+
+_OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a is not None and a != b,
+    "<": lambda a, b: _compare(a, b, lambda x, y: x < y),
+    "<=": lambda a, b: _compare(a, b, lambda x, y: x <= y),
+    ">": lambda a, b: _compare(a, b, lambda x, y: x > y),
+    ">=": lambda a, b: _compare(a, b, lambda x, y: x >= y),
+    "in": lambda a, b: a in b,
+    "not-in": lambda a, b: a is not None and a not in b,
+    "array_contains": lambda a, b: isinstance(a, list) and b in a,
+    "array_contains_any": lambda a, b: isinstance(a, list) and any(item in a for item in b),
+}
+
+def _matches(field_value, op_string: str, value) -> bool:
+    return _OPERATORS[op_string](field_value, value)
+
+class _FirestoreModule:
+    """Sustituto del módulo firebase_admin.firestore."""
+    Query = Query
+    FieldPath = FieldPath
+    Increment = Increment
+    SERVER_TIMESTAMP = SERVER_TIMESTAMP
+    DELETE_FIELD = DELETE_FIELD
+    transactional = staticmethod(transactional)
+
+    def __init__(self):
+        self._client = FakeFirestore()
+
+    def client(self, app=None) -> FakeFirestore:
+        return self._client
+
+fake_firestore = _FirestoreModule()
+
+# --- Cloud Storage -----------------------------------------------------------
+
+class FakeBlob:
+    def __init__(self, bucket: "FakeBucket", name: str):
+        self.bucket = bucket
+        self.name = name
+        self.cache_control = None
+        self.content_type = None
+        self.chunk_size = None
+        self._load(bucket._objects.get(name))
+
+    def _load(self, stored: Optional[dict]):
+        self.size = stored["size"] if stored else None
+        self.generation = stored["generation"] if stored else None
+        self.time_created = stored["time_created"] if stored else None
+        self.updated = stored["updated"] if stored else None
+        if stored:
+            self.cache_control = stored["cache_control"]
+            self.content_type = stored["content_type"]
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{quote(self.name)}"
+
+    def exists(self, client=None) -> bool:
+        return self.name in self.bucket._objects
+
+    def reload(self, client=None):
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise gcloud_exceptions.NotFound(f"No existe el objeto {self.name}")
+        self._load(stored)
+
+    def _store(self, data: bytes, content_type: Optional[str]):
+        with self.bucket._lock:
+            previous = self.bucket._objects.get(self.name)
+            now = _now()
+            stored = {
+                "data": data,
+                "size": len(data),
+                "generation": self.bucket._next_generation(),
+                "time_created": now,
+                "updated": now,
+                "cache_control": self.cache_control,
+                "content_type": content_type or self.content_type or "application/octet-stream",
+                "public": previous["public"] if previous else False,
+            }
+            self.bucket._objects[self.name] = stored
+        self._load(stored)
+
+    def upload_from_filename(self, filename: str, content_type: Optional[str] = None, **kwargs):
+        with open(filename, "rb") as f:
+            self._store(f.read(), content_type)
+
+    def upload_from_file(self, file_obj, content_type: Optional[str] = None, **kwargs):
+        self._store(file_obj.read(), content_type)
+
+    def upload_from_string(self, data, content_type: str = "text/plain", **kwargs):
+        self._store(data.encode("utf-8") if isinstance(data, str) else data, content_type)
+
+    def download_to_filename(self, filename: str, **kwargs):
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise gcloud_exceptions.NotFound(f"No existe el objeto {self.name}")
+        with open(filename, "wb") as f:
+            f.write(stored["data"])
+
+    def download_as_bytes(self, start: Optional[int] = None, end: Optional[int] = None, **kwargs) -> bytes:
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise gcloud_exceptions.NotFound(f"No existe el objeto {self.name}")
+        # Igual que GCS, `end` es inclusivo.
+        return stored["data"][start or 0:None if end is None else end + 1]
+
+    def make_public(self, client=None):
+        stored = self.bucket._objects.get(self.name)
+        if stored is None:
+            raise gcloud_exceptions.NotFound(f"No existe el objeto {self.name}")
+        stored["public"] = True
+
+    def delete(self, client=None, if_generation_match: Optional[int] = None):
+        self.bucket._delete(self.name, if_generation_match)
+
+    def generate_signed_url(self, expiration=None, method: str = "GET", **kwargs) -> str:
+        # No hay servidor detrás: la URL solo sirve para comprobar el formato de la respuesta.
+        return f"{self.public_url}?X-Goog-Signature=fake&X-Goog-Method={method}"
+
+class _BlobIterator:
+    """Imita el HTTPIterator de list_blobs, incluidos `pages` y `prefixes`."""
+    def __init__(self, blobs: List[FakeBlob], prefixes: set):
+        self._blobs = blobs
+        self.prefixes = prefixes
+
+    def __iter__(self):
+        return iter(self._blobs)
+
+    @property
+    def pages(self):
+        yield self
+
+class _BatchResponse:
+    def __init__(self, status_code: int):
+        self.status_code = status_code
+
+class _Batch:
+    """Como en google-cloud-storage, guarda en `_responses` el resultado de cada operación."""
+    def __init__(self, bucket: "FakeBucket", raise_exception: bool):
+        self._bucket = bucket
+        self._raise_exception = raise_exception
+        self._responses: List[_BatchResponse] = []
+
+    def __enter__(self):
+        self._bucket._batch_state.batch = self
+        return self
+
+    def __exit__(self, *exc_info):
+        self._bucket._batch_state.batch = None
+        if exc_info[0] is None and self._raise_exception:
+            failed = next((response for response in self._responses if not 200 <= response.status_code < 300), None)
+            if failed is not None:
+                raise gcloud_exceptions.NotFound("Una operación del lote falló.")
+        return False
+
+class _StorageClient:
+    def __init__(self, bucket: "FakeBucket"):
+        self._bucket = bucket
+
+    def batch(self, raise_exception: bool = True) -> _Batch:
+        return _Batch(self._bucket, raise_exception)
+
+class FakeBucket:
+    def __init__(self, name: str):
+        self.name = name
+        self.client = _StorageClient(self)
+        self._objects: Dict[str, dict] = {}
+        self._lock = threading.RLock()
+        self._generation = 0
+        self._batch_state = threading.local()
+
+    def _next_generation(self) -> int:
+        self._generation += 1
+        return self._generation
+
+    def blob(self, blob_name: str, chunk_size: Optional[int] = None) -> FakeBlob:
+        blob = FakeBlob(self, blob_name)
+        blob.chunk_size = chunk_size
+        return blob
+
+    def get_blob(self, blob_name: str, **kwargs) -> Optional[FakeBlob]:
+        return FakeBlob(self, blob_name) if blob_name in self._objects else None
+
+    def list_blobs(self, prefix: Optional[str] = None, delimiter: Optional[str] = None, fields=None, **kwargs):
+        prefix = prefix or ""
+        with self._lock:
+            names = sorted(name for name in self._objects if name.startswith(prefix))
+        blobs, prefixes = [], set()
+        for name in names:
+            rest = name[len(prefix):]
+            if delimiter and delimiter in rest:
+                prefixes.add(prefix + rest.split(delimiter, 1)[0] + delimiter)
+            else:
+                blobs.append(FakeBlob(self, name))
+        return _BlobIterator(blobs, prefixes)
+
+    def delete_blob(self, blob_name: str, if_generation_match: Optional[int] = None, **kwargs):
+        batch = getattr(self._batch_state, "batch", None)
+        if batch is None:
+            self._delete(blob_name, if_generation_match)
+            return
+        # Dentro de un lote los errores no se lanzan: quedan en las respuestas.
+        try:
+            self._delete(blob_name, if_generation_match)
+            batch._responses.append(_BatchResponse(204))
+        except gcloud_exceptions.NotFound:
+            batch._responses.append(_BatchResponse(404))
+        except gcloud_exceptions.PreconditionFailed:
+            batch._responses.append(_BatchResponse(412))
+
+    def _delete(self, blob_name: str, if_generation_match: Optional[int]):
+        with self._lock:
+            stored = self._objects.get(blob_name)
+            if stored is None:
+                raise gcloud_exceptions.NotFound(f"No existe el objeto {blob_name}")
+            if if_generation_match is not None and stored["generation"] != if_generation_match:
+                raise gcloud_exceptions.PreconditionFailed(f"La generación de {blob_name} no coincide")
+            del self._objects[blob_name]
+
+    def clear(self):
+        with self._lock:
+            self._objects.clear()
+
+# --- Auth --------------------------------------------------------------------
+
+class _AuthModule:
+    """Sustituto del módulo firebase_admin.auth."""
+
+    class InvalidIdTokenError(ValueError):
+        pass
+
+    class ExpiredIdTokenError(InvalidIdTokenError):
+        pass
+
+    class UserNotFoundError(ValueError):
+        pass
+
+    def __init__(self):
+        self._deleted = set()
+
+    def verify_id_token(self, id_token: str, app=None, check_revoked: bool = False) -> Dict[str, Any]:
+        if id_token.startswith("expired-"):
+            raise self.ExpiredIdTokenError("El token simulado ha expirado.")
+        if not _UID_PATTERN.match(id_token) or id_token in self._deleted:
+            raise self.InvalidIdTokenError("Token simulado no válido.")
+        return {
+            "uid": id_token,
+            "user_id": id_token,
+            "email": f"{id_token}@fake.instant3d.local",
+            "email_verified": True,
+            "auth_time": int(_now().timestamp()),
+        }
+
+    def delete_user(self, uid: str, app=None):
+        if not _UID_PATTERN.match(uid):
+            raise self.UserNotFoundError(f"No existe el usuario {uid}")
+        self._deleted.add(uid)
+
+fake_auth = _AuthModule()
+
+def reset_fake_backends(bucket: Optional[FakeBucket] = None):
+    """Borra todos los datos simulados entre dos ejecuciones de una prueba."""
+    with fake_firestore.client()._lock:
+        fake_firestore.client()._documents.clear()
+    fake_auth._deleted.clear()
+    if bucket is not None:
+        bucket.clear()
@@ -0,0 +1,581 @@
+"""
+Servidor local que imita un Space de Gradio 5 (protocolo de cola sse_v3) con los
+endpoints que usan los servicios de generación. Devuelve GLB, PNG y MP4 válidos
+del tamaño configurado tras una latencia aleatoria, y falla con la probabilidad
+indicada. Uso:
+
+    python -m fakes.gradio_space --port 7861
+
+y en la aplicación HF_SPACE_OVERRIDE_URL=http://127.0.0.1:7861 para que todos
+los servicios hablen con él.
+
+Perfil (FAKE_SPACE_PROFILE, JSON): por endpoint o "*" para todos,
+    {"*": {"error_rate": 0.02},
+     "image_to_3d": {"latency": "lognormal:20,0.4", "glb_bytes": 12000000}}
+Latencias: "fixed:s", "uniform:min,max", "normal:media,desv",
+"lognormal:mediana,sigma" o "exponential:media", en segundos.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import math
+import os
+import random
+import shutil
+import struct
+import tempfile
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from fastapi import FastAPI, File, HTTPException, Request, UploadFile
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+
+load_dotenv()
+
+FAKE_SPACE_DIR = os.getenv("FAKE_SPACE_DIR", os.path.join(tempfile.gettempdir(), "instant3d_fake_space"))
+FAKE_SPACE_PROFILE = os.getenv("FAKE_SPACE_PROFILE")
+# Multiplica todas las latencias (p. ej. 0.01 para pruebas rápidas).
+FAKE_SPACE_LATENCY_SCALE = float(os.getenv("FAKE_SPACE_LATENCY_SCALE", "1"))
+# Predicciones simultáneas; el resto espera en cola como en un Space con GPU.
+FAKE_SPACE_CONCURRENCY = int(os.getenv("FAKE_SPACE_CONCURRENCY", "4"))
+# Con más eventos pendientes que esto queue/join responde 503 (0 = sin límite).
+FAKE_SPACE_MAX_QUEUE = int(os.getenv("FAKE_SPACE_MAX_QUEUE", "0"))
+FAKE_SPACE_FILE_TTL_SECONDS = float(os.getenv("FAKE_SPACE_FILE_TTL_SECONDS", "900"))
+FAKE_SPACE_SEED = os.getenv("FAKE_SPACE_SEED")
+HEARTBEAT_SECONDS = 15
+PROGRESS_STEPS = 10
+
+OUTPUT_DIR = os.path.join(FAKE_SPACE_DIR, "outputs")
+UPLOAD_DIR = os.path.join(FAKE_SPACE_DIR, "uploads")
+
+DEFAULT_PROFILE = {
+    "latency": "fixed:0.05",
+    "error_rate": float(os.getenv("FAKE_SPACE_ERROR_RATE", "0")),
+    "glb_bytes": int(os.getenv("FAKE_SPACE_GLB_BYTES", str(8 * 1024 * 1024))),
+    "image_bytes": int(os.getenv("FAKE_SPACE_IMAGE_BYTES", str(400 * 1024))),
+    "video_bytes": int(os.getenv("FAKE_SPACE_VIDEO_BYTES", str(1500 * 1024))),
+}
+
+# Latencias aproximadas de los Spaces reales con la GPU ya asignada.
+DEFAULT_LATENCIES = {
+    "preprocess_image": "lognormal:2,0.3",
+    "preprocess_images": "lognormal:4,0.3",
+    "image_to_3d": "lognormal:25,0.3",
+    "text_to_3d": "lognormal:30,0.3",
+    "extract_glb": "lognormal:15,0.3",
+    "generate_texture": "lognormal:40,0.3",
+    "generate3dv2": "lognormal:60,0.3",
+    "generate_flux_image": "lognormal:8,0.3",
+}
+
+_random = random.Random(FAKE_SPACE_SEED)
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value.strip()]
+    samplers = {
+        "fixed": lambda: values[0],
+        "uniform": lambda: _random.uniform(values[0], values[1]),
+        "normal": lambda: _random.gauss(values[0], values[1]),
+        "lognormal": lambda: _random.lognormvariate(math.log(values[0]), values[1]),
+        "exponential": lambda: _random.expovariate(1 / values[0]),
+    }
+    if kind not in samplers:
+        raise ValueError(f"Distribución de latencia desconocida: {spec}")
+    sampler = samplers[kind]
+    sampler()
+    return lambda: max(0.0, sampler())
+
+def load_profile(path: Optional[str]) -> Dict[str, dict]:
+    overrides = {}
+    if path:
+        with open(path, "r", encoding="utf-8") as f:
+            overrides = json.load(f)
+    profile = {}
+    for name in ENDPOINTS:
+        settings = {**DEFAULT_PROFILE, "latency": DEFAULT_LATENCIES.get(name, DEFAULT_PROFILE["latency"])}
+        settings.update(overrides.get("*", {}))
+        settings.update(overrides.get(name, {}))
+        settings["sample_latency"] = parse_latency(settings["latency"])
+        profile[name] = settings
+    return profile
+
+# --- Archivos de salida -------------------------------------------------------
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data) & 0xFFFFFFFF)
+
+@lru_cache(maxsize=32)
+def _png_body(width: int, height: int) -> bytes:
+    row = b"\x00" + bytes([200, 200, 200, 255]) * width
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", header) + _png_chunk(b"IDAT", zlib.compress(row * height, 9))
+
+def make_png(event_id: str, size: int, width: int = 512, height: int = 512) -> bytes:
+    body = _png_body(width, height)
+    marker = _png_chunk(b"tEXt", b"instant3d-fake\x00" + event_id.encode("ascii"))
+    # El relleno va en un chunk auxiliar que los lectores ignoran.
+    padding = max(0, size - len(body) - len(marker) - 24)
+    return body + marker + (_png_chunk(b"fkPd", bytes(padding)) if padding else b"") + _png_chunk(b"IEND", b"")
+
+@lru_cache(maxsize=8)
+def _random_block(size: int) -> bytes:
+    return os.urandom(size)
+
+def make_glb(event_id: str, size: int) -> bytes:
+    """GLB válido con un tetraedro; el buffer binario se rellena hasta `size`."""
+    positions = struct.pack("<12f", 0, 0, 0, 1, 0, 0, 0, 1, 0, 0, 0, 1)
+    indices = struct.pack("<12H", 0, 2, 1, 0, 1, 3, 0, 3, 2, 1, 2, 3)
+    gltf = {
+        "asset": {"version": "2.0", "generator": "instant3d-fake-space", "extras": {"event_id": event_id}},
+        "scene": 0,
+        "scenes": [{"nodes": [0]}],
+        "nodes": [{"mesh": 0}],
+        "meshes": [{"primitives": [{"attributes": {"POSITION": 0}, "indices": 1}]}],
+        "accessors": [
+            {"bufferView": 0, "componentType": 5126, "count": 4, "type": "VEC3", "min": [0, 0, 0], "max": [1, 1, 1]},
+            {"bufferView": 1, "componentType": 5123, "count": 12, "type": "SCALAR"},
+        ],
+        "bufferViews": [
+            {"buffer": 0, "byteOffset": 0, "byteLength": len(positions), "target": 34962},
+            {"buffer": 0, "byteOffset": len(positions), "byteLength": len(indices), "target": 34963},
+        ],
+        "buffers": [{"byteLength": 0}],
+    }
+    json_length = len(json.dumps(gltf, separators=(",", ":")).encode("utf-8")) + 16
+    binary_length = max(len(positions) + len(indices), size - 28 - json_length)
+    binary_length += -binary_length % 4
+    gltf["buffers"][0]["byteLength"] = binary_length
+    json_chunk = json.dumps(gltf, separators=(",", ":")).encode("utf-8")
+    json_chunk += b" " * (-len(json_chunk) % 4)
+    binary_chunk = positions + indices
+    binary_chunk += _random_block(binary_length - len(binary_chunk))
+    total = 12 + 8 + len(json_chunk) + 8 + len(binary_chunk)
+    return (
+        struct.pack("<III", 0x46546C67, 2, total)
+        + struct.pack("<II", len(json_chunk), 0x4E4F534A) + json_chunk
+        + struct.pack("<II", len(binary_chunk), 0x004E4942) + binary_chunk
+    )
+
+def make_mp4(event_id: str, size: int) -> bytes:
+    ftyp = struct.pack(">I", 24) + b"ftypisom" + struct.pack(">I", 512) + b"isomiso2"
+    payload = event_id.encode("ascii")
+    mdat_size = max(8 + len(payload), size - len(ftyp))
+    return ftyp + struct.pack(">I", mdat_size) + b"mdat" + payload + _random_block(mdat_size - 8 - len(payload))
+
+def _file_data(path: str, mime_type: str) -> dict:
+    return {
+        "path": path,
+        "url": f"/gradio_api/file={path}",
+        "orig_name": os.path.basename(path),
+        "size": os.path.getsize(path),
+        "mime_type": mime_type,
+        "is_stream": False,
+        "meta": {"_type": "gradio.FileData"},
+    }
+
+def write_output(event_id: str, filename: str, content: bytes, mime_type: str) -> dict:
+    directory = os.path.join(OUTPUT_DIR, event_id)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, filename)
+    with open(path, "wb") as f:
+        f.write(content)
+    return _file_data(path, mime_type)
+
+# --- Endpoints ------------------------------------------------------------------
+
+class FakeSpaceError(Exception):
+    pass
+
+@dataclass
+class Call:
+    event_id: str
+    session: "Session"
+    values: Dict[str, Any]
+    settings: dict
+
+    def image(self, name: str = "image.png", width: int = 512, height: int = 512) -> dict:
+        content = make_png(self.event_id, self.settings["image_bytes"], int(width), int(height))
+        return write_output(self.event_id, name, content, "image/png")
+
+    def glb(self, name: str = "model.glb") -> dict:
+        return write_output(self.event_id, name, make_glb(self.event_id, self.settings["glb_bytes"]), "model/gltf-binary")
+
+    def video(self, name: str = "preview.mp4") -> dict:
+        return write_output(self.event_id, name, make_mp4(self.event_id, self.settings["video_bytes"]), "video/mp4")
+
+def _require_files(*values):
+    for value in values:
+        if not (isinstance(value, dict) and isinstance(value.get("path"), str) and os.path.exists(value["path"])):
+            raise FakeSpaceError(f"Archivo de entrada no válido: {value}")
+
+def _start_session(call: Call):
+    call.session.state.clear()
+    return []
+
+def _end_session(call: Call):
+    call.session.state.clear()
+    return []
+
+def _seed(call: Call):
+    if call.values.get("randomize_seed"):
+        return [_random.randint(0, 2 ** 31 - 1)]
+    return [int(call.values.get("seed") or 0)]
+
+def _preprocess_image(call: Call):
+    _require_files(call.values.get("image"))
+    return [call.image("preprocessed.png", 518, 518)]
+
+def _preprocess_images(call: Call):
+    images = call.values.get("images") or []
+    _require_files(*(item.get("image") if isinstance(item, dict) else item for item in images))
+    return [[{"image": call.image(f"preprocessed_{index}.png", 518, 518), "caption": None} for index in range(len(images))]]
+
+def _to_3d(call: Call):
+    if "prompt" in call.values:
+        if not call.values["prompt"]:
+            raise FakeSpaceError("Prompt vacío.")
+    else:
+        files = [value for value in (call.values.get("image"), call.values.get("image_path")) if value is not None]
+        files += [item.get("image") for item in call.values.get("multiimages") or []]
+        if not files:
+            raise FakeSpaceError("Falta la imagen de entrada.")
+        _require_files(*files)
+    call.session.state["model"] = call.event_id
+    return [{"video": call.video(), "subtitles": None}]
+
+def _extract_glb(call: Call):
+    # Igual que en TRELLIS, el modelo generado vive en el State de la sesión.
+    if "model" not in call.session.state:
+        raise FakeSpaceError("No hay ningún modelo generado en esta sesión.")
+    glb = call.glb()
+    return [glb, glb]
+
+def _generate_texture(call: Call):
+    _require_files(call.values.get("input_image_path"), call.values.get("input_mesh_path"))
+    return [call.glb("textured.glb")]
+
+def _generate3dv2(call: Call):
+    _require_files(call.values.get("preview_img"))
+    return [call.glb("unique3d.glb"), call.video()]
+
+def _generate_flux_image(call: Call):
+    return [call.image("flux.png", call.values.get("width") or 1024, call.values.get("height") or 1024)]
+
+@dataclass
+class Endpoint:
+    handler: Callable[[Call], list]
+    inputs: List[tuple]
+    outputs: List[str]
+
+_TRELLIS_PARAMS = [("seed", 0), ("ss_guidance_strength", 7.5), ("ss_sampling_steps", 12),
+                   ("slat_guidance_strength", 3), ("slat_sampling_steps", 12)]
+
+# Entradas (nombre, valor por defecto) y tipos de las salidas; "state" ocupa una
+# posición en los datos pero no aparece en la API, como en los Spaces reales.
+# Un mismo servidor atiende a todos los servicios, así que cada endpoint acepta
+# la unión de los parámetros con los que lo llaman.
+ENDPOINTS: Dict[str, Endpoint] = {
+    "start_session": Endpoint(_start_session, [], []),
+    "end_session": Endpoint(_end_session, [], []),
+    "get_seed": Endpoint(_seed, [("randomize_seed", True), ("seed", 0)], ["number"]),
+    "get_random_seed": Endpoint(_seed, [("randomize_seed", True), ("seed", 0)], ["number"]),
+    "preprocess_image": Endpoint(_preprocess_image, [
+        ("image", None), ("prompt", ""), ("negative_prompt", ""), ("style_name", "3D Model"),
+        ("num_steps", 8), ("guidance_scale", 5), ("controlnet_conditioning_scale", 0.85),
+    ], ["image"]),
+    "preprocess_images": Endpoint(_preprocess_images, [("images", [])], ["gallery"]),
+    "image_to_3d": Endpoint(_to_3d, [
+        ("image", None), ("image_path", None), ("multiimages", []), *_TRELLIS_PARAMS,
+        ("multiimage_algo", "stochastic"),
+    ], ["state", "video"]),
+    "text_to_3d": Endpoint(_to_3d, [("prompt", ""), *_TRELLIS_PARAMS], ["state", "video"]),
+    "extract_glb": Endpoint(_extract_glb, [("state", None), ("mesh_simplify", 0.95), ("texture_size", 1024)],
+                            ["model3d", "file"]),
+    "generate_texture": Endpoint(_generate_texture, [
+        ("input_image_path", None), ("input_mesh_path", None), ("guidance_scale", 3),
+        ("inference_steps", 50), ("seed", 0), ("reference_conditioning_scale", 1),
+    ], ["model3d"]),
+    "generate3dv2": Endpoint(_generate3dv2, [
+        ("preview_img", None), ("input_processing", True), ("seed", -1), ("render_video", False),
+        ("do_refine", True), ("expansion_weight", 0.1), ("init_type", "std"),
+    ], ["model3d", "video"]),
+    "generate_flux_image": Endpoint(_generate_flux_image, [
+        ("prompt", ""), ("seed", 42), ("randomize_seed", True), ("width", 1024), ("height", 1024),
+        ("guidance_scale", 3.5),
+    ], ["image"]),
+}
+
+def build_schema():
+    """Config y /info del Space, con IDs de componente consecutivos."""
+    components, dependencies, named_endpoints = [], [], {}
+    next_id = 0
+
+    def component(kind: str) -> int:
+        nonlocal next_id
+        next_id += 1
+        components.append({"id": next_id, "type": kind, "props": {}})
+        return next_id
+
+    for index, (name, endpoint) in enumerate(ENDPOINTS.items()):
+        trigger = component("button")
+        inputs = [component("state" if param == "state" else "textbox") for param, _ in endpoint.inputs]
+        outputs = [component(kind) for kind in endpoint.outputs]
+        dependencies.append({
+            "id": index, "api_name": name, "inputs": inputs, "outputs": outputs,
+            "targets": [[trigger, "click"]], "backend_fn": True, "queue": True,
+        })
+        named_endpoints[f"/{name}"] = {
+            "parameters": [
+                {"parameter_name": param, "parameter_has_default": True, "parameter_default": default,
+                 "label": param, "type": {}, "python_type": {"type": "Any"}, "component": "Textbox"}
+                for param, default in endpoint.inputs if param != "state"
+            ],
+            "returns": [{"label": kind, "type": {}, "python_type": {"type": "Any"}, "component": kind}
+                        for kind in endpoint.outputs if kind != "state"],
+        }
+
+    config = {
+        "version": "5.0.0",
+        "mode": "blocks",
+        "protocol": "sse_v3",
+        "api_prefix": "/gradio_api",
+        "title": "Instant3D fake Space",
+        "components": components,
+        "dependencies": dependencies,
+    }
+    return config, {"named_endpoints": named_endpoints, "unnamed_endpoints": {}}
+
+# --- Cola -------------------------------------------------------------------------
+
+@dataclass
+class Session:
+    messages: asyncio.Queue = field(default_factory=asyncio.Queue)
+    pending: set = field(default_factory=set)
+    state: dict = field(default_factory=dict)
+    last_seen: float = field(default_factory=time.monotonic)
+
+CONFIG, API_INFO = build_schema()
+PROFILE = load_profile(FAKE_SPACE_PROFILE)
+_components = {component["id"]: component for component in CONFIG["components"]}
+_sessions: Dict[str, Session] = {}
+_events: Dict[str, asyncio.Task] = {}
+_gpu: Optional[asyncio.Semaphore] = None
+_waiting = 0
+_stats = {name: {"calls": 0, "errors": 0, "cancelled": 0} for name in ENDPOINTS}
+
+def _session(session_hash: str) -> Session:
+    session = _sessions.setdefault(session_hash, Session())
+    session.last_seen = time.monotonic()
+    return session
+
+def _api_values(endpoint: Endpoint, dependency: dict, data: list) -> Dict[str, Any]:
+    values = {}
+    inputs = dependency["inputs"]
+    for (param, default), component_id, value in zip(endpoint.inputs, inputs, data + [None] * len(inputs)):
+        if _components[component_id]["type"] != "state":
+            values[param] = default if value is None else value
+    return values
+
+def _with_state_slots(dependency: dict, outputs: list) -> list:
+    remaining = iter(outputs)
+    return [None if _components[component_id]["type"] == "state" else next(remaining, None)
+            for component_id in dependency["outputs"]]
+
+async def _process(event_id: str, session: Session, name: str, dependency: dict, data: list):
+    global _waiting
+    endpoint, settings = ENDPOINTS[name], PROFILE[name]
+    send = session.messages.put_nowait
+    started = time.monotonic()
+    if len(data) < len(dependency["inputs"]):
+        # Mismo error que Gradio cuando el cliente usa un esquema antiguo del endpoint.
+        _stats[name]["errors"] += 1
+        send({"msg": "process_completed", "event_id": event_id, "success": False, "output": {
+            "error": f"An event handler ({name}) didn't receive enough input values "
+                     f"(needed: {len(dependency['inputs'])}, got: {len(data)}).",
+        }})
+        _events.pop(event_id, None)
+        return
+    try:
+        if _gpu.locked():
+            _waiting += 1
+            send({"msg": "estimation", "event_id": event_id, "rank": _waiting - 1,
+                  "queue_size": _waiting, "rank_eta": None})
+            try:
+                await _gpu.acquire()
+            finally:
+                _waiting -= 1
+        else:
+            await _gpu.acquire()
+        try:
+            latency = settings["sample_latency"]() * FAKE_SPACE_LATENCY_SCALE
+            send({"msg": "process_starts", "event_id": event_id, "eta": latency})
+            steps = PROGRESS_STEPS if latency >= 1 else 1
+            for step in range(steps):
+                await asyncio.sleep(latency / steps)
+                if steps > 1:
+                    send({"msg": "progress", "event_id": event_id, "progress_data": [
+                        {"index": step + 1, "length": steps, "unit": "steps", "progress": None, "desc": None}
+                    ]})
+            if _random.random() < settings["error_rate"]:
+                raise FakeSpaceError(f"Error simulado en /{name}.")
+            call = Call(event_id, session, _api_values(endpoint, dependency, data), settings)
+            outputs = await asyncio.get_running_loop().run_in_executor(None, endpoint.handler, call)
+        finally:
+            _gpu.release()
+        send({"msg": "process_completed", "event_id": event_id, "success": True, "output": {
+            "data": _with_state_slots(dependency, outputs), "is_generating": False,
+            "duration": time.monotonic() - started,
+        }})
+    except asyncio.CancelledError:
+        _stats[name]["cancelled"] += 1
+        session.pending.discard(event_id)
+        send(None)
+        raise
+    except Exception as e:
+        _stats[name]["errors"] += 1
+        send({"msg": "process_completed", "event_id": event_id, "success": False,
+              "output": {"error": str(e) if isinstance(e, FakeSpaceError) else repr(e)}})
+    finally:
+        _events.pop(event_id, None)
+
+async def _stream(session: Session):
+    while True:
+        if not session.pending and session.messages.empty():
+            yield f"data: {json.dumps({'msg': 'close_stream', 'event_id': None})}\n\n"
+            return
+        try:
+            message = await asyncio.wait_for(session.messages.get(), timeout=HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            yield f"data: {json.dumps({'msg': 'heartbeat'})}\n\n"
+            continue
+        if message is None:
+            continue
+        session.last_seen = time.monotonic()
+        yield f"data: {json.dumps(message)}\n\n"
+        if message["msg"] == "process_completed":
+            session.pending.discard(message["event_id"])
+
+def _cleanup():
+    """Borra salidas, subidas y sesiones inactivas más antiguas que FAKE_SPACE_FILE_TTL_SECONDS."""
+    now = time.time()
+    for directory in (OUTPUT_DIR, UPLOAD_DIR):
+        for entry in os.scandir(directory):
+            try:
+                if now - entry.stat().st_mtime > FAKE_SPACE_FILE_TTL_SECONDS:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+            except OSError:
+                continue
+    idle_limit = time.monotonic() - FAKE_SPACE_FILE_TTL_SECONDS
+    for session_hash, session in list(_sessions.items()):
+        if not session.pending and session.last_seen < idle_limit:
+            _sessions.pop(session_hash, None)
+
+async def _janitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(60)
+        await loop.run_in_executor(None, _cleanup)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global _gpu
+    os.makedirs(OUTPUT_DIR, exist_ok=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    _gpu = asyncio.Semaphore(FAKE_SPACE_CONCURRENCY)
+    janitor = asyncio.create_task(_janitor())
+    logging.info(f"Space simulado listo: {len(ENDPOINTS)} endpoints, concurrencia {FAKE_SPACE_CONCURRENCY}.")
+    yield
+    janitor.cancel()
+
+app = FastAPI(title="Instant3D fake Gradio Space", lifespan=lifespan)
+
+@app.get("/config")
+async def get_config():
+    return CONFIG
+
+@app.get("/gradio_api/info")
+async def get_info():
+    return API_INFO
+
+@app.post("/gradio_api/upload")
+async def upload(files: List[UploadFile] = File(...)):
+    paths = []
+    for upload_file in files:
+        directory = os.path.join(UPLOAD_DIR, uuid.uuid4().hex)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, os.path.basename(upload_file.filename or "upload"))
+        with open(path, "wb") as f:
+            shutil.copyfileobj(upload_file.file, f)
+        paths.append(path)
+    return paths
+
+@app.post("/gradio_api/queue/join")
+async def queue_join(request: Request):
+    body = await request.json()
+    fn_index = body.get("fn_index")
+    if not isinstance(fn_index, int) or not 0 <= fn_index < len(CONFIG["dependencies"]):
+        raise HTTPException(status_code=422, detail=f"fn_index no válido: {fn_index}")
+    if FAKE_SPACE_MAX_QUEUE and len(_events) >= FAKE_SPACE_MAX_QUEUE:
+        return JSONResponse(status_code=503, content={"detail": "Queue is full."})
+
+    dependency = CONFIG["dependencies"][fn_index]
+    session = _session(body.get("session_hash") or uuid.uuid4().hex)
+    event_id = uuid.uuid4().hex
+    session.pending.add(event_id)
+    _stats[dependency["api_name"]]["calls"] += 1
+    _events[event_id] = asyncio.create_task(
+        _process(event_id, session, dependency["api_name"], dependency, list(body.get("data") or []))
+    )
+    return {"event_id": event_id}
+
+@app.get("/gradio_api/queue/data")
+async def queue_data(session_hash: str):
+    session = _sessions.get(session_hash)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sesión desconocida.")
+    return StreamingResponse(_stream(session), media_type="text/event-stream")
+
+@app.post("/gradio_api/cancel")
+async def cancel(request: Request):
+    body = await request.json()
+    task = _events.get(body.get("event_id"))
+    if task is not None:
+        task.cancel()
+    return {"success": task is not None}
+
+@app.get("/gradio_api/file={path:path}")
+async def get_file(path: str):
+    real_path = os.path.realpath(path)
+    allowed = any(real_path.startswith(os.path.realpath(root) + os.sep) for root in (OUTPUT_DIR, UPLOAD_DIR))
+    if not allowed or not os.path.isfile(real_path):
+        raise HTTPException(status_code=404, detail="Archivo no encontrado.")
+    return FileResponse(real_path)
+
+@app.get("/metrics")
+async def metrics():
+    return {
+        "in_flight": len(_events),
+        "waiting": _waiting,
+        "sessions": len(_sessions),
+        "endpoints": _stats,
+    }
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Space de Gradio simulado para pruebas de carga.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=7861)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
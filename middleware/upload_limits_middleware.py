@@ -0,0 +1,198 @@
+import os
+import re
+from typing import Dict, Optional, Tuple
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from dotenv import load_dotenv
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    from multipart.multipart import MultipartParser, parse_options_header
+
+load_dotenv()
+
+MB = 1024 * 1024
+MAX_IMAGE_BYTES = int(float(os.getenv("UPLOAD_MAX_IMAGE_MB", "15")) * MB)
+MAX_MODEL_BYTES = int(float(os.getenv("UPLOAD_MAX_MODEL_MB", "100")) * MB)
+# Campos de texto del formulario (generationName, description...).
+MAX_FORM_FIELD_BYTES = 64 * 1024
+# Margen para cabeceras y delimitadores del multipart.
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+SNIFF_BYTES = 12
+IMAGE_FORMATS = frozenset({"png", "jpeg", "webp"})
+MODEL_FORMATS = frozenset({"glb"})
+ARCHIVE_FORMATS = frozenset({"zip"})
+MAX_ARCHIVE_BYTES = int(float(os.getenv("UPLOAD_MAX_ARCHIVE_MB", "200")) * MB)
+
+# Límite y formatos aceptados por campo de archivo en cada ruta. Las rutas PUT de
+# regeneración comparten reglas con la POST equivalente.
+UPLOAD_RULES: Dict[str, Dict[str, Tuple[int, Optional[frozenset]]]] = {
+    r"/generation/(Imagen3D|Unico3D|Boceto3D)(/[^/]+)?": {
+        "image": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+    r"/generation/MultiImagen3D(/[^/]+)?": {
+        "frontal": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        "lateral": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        "trasera": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+    r"/generation/Retexturize3D(/[^/]+)?": {
+        "model": (MAX_MODEL_BYTES, MODEL_FORMATS),
+        "texture": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+    r"/generation/batch": {
+        "archive": (MAX_ARCHIVE_BYTES, ARCHIVE_FORMATS),
+        # El manifiesto es un campo de texto, pero un lote grande supera el límite general.
+        "manifest": (1 * MB, None),
+    },
+    r"/generation/preview": {
+        "preview": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+    r"/user/update/profile-picture": {
+        "profile_picture": (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+}
+
+_COMPILED_RULES = [(re.compile(f"^{pattern}$"), fields) for pattern, fields in UPLOAD_RULES.items()]
+
+def sniff_format(head: bytes) -> Optional[str]:
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "png"
+    if head.startswith(b"\xff\xd8\xff"):
+        return "jpeg"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    if head.startswith(b"glTF"):
+        return "glb"
+    if head.startswith(b"PK\x03\x04"):
+        return "zip"
+    return None
+
+def _rules_for(path: str):
+    for pattern, fields in _COMPILED_RULES:
+        if pattern.match(path):
+            return fields
+    return None
+
+class _MultipartGuard:
+    """
+    Recorre el cuerpo multipart a medida que llega y comprueba el tamaño de cada
+    campo y los bytes mágicos del primer fragmento de cada archivo, sin guardar
+    el contenido.
+    """
+    def __init__(self, boundary: bytes, rules: Dict[str, Tuple[int, frozenset]]):
+        self.rules = rules
+        self.error: Optional[HTTPException] = None
+        self._header_field = b""
+        self._header_value = b""
+        self._reset_part()
+        self._parser = MultipartParser(boundary, {
+            "on_part_begin": self._reset_part,
+            "on_header_field": self._on_header_field,
+            "on_header_value": self._on_header_value,
+            "on_header_end": self._on_header_end,
+            "on_part_data": self._on_part_data,
+            "on_part_end": self._on_part_end,
+        })
+
+    def _reset_part(self):
+        self._field_name = None
+        self._is_file = False
+        self._size = 0
+        self._head = b""
+        self._sniffed = False
+
+    def _on_header_field(self, data: bytes, start: int, end: int):
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def _on_header_end(self):
+        if self._header_field.lower() == b"content-disposition":
+            _, options = parse_options_header(self._header_value)
+            self._field_name = options.get(b"name", b"").decode("utf-8", errors="replace")
+            self._is_file = b"filename" in options
+        self._header_field = b""
+        self._header_value = b""
+
+    def _limits(self) -> Tuple[int, Optional[frozenset]]:
+        if self._field_name in self.rules:
+            return self.rules[self._field_name]
+        return MAX_FORM_FIELD_BYTES, None
+
+    def _fail(self, status_code: int, detail: str):
+        if self.error is None:
+            self.error = HTTPException(status_code=status_code, detail=detail)
+
+    def _check_format(self):
+        self._sniffed = True
+        _, formats = self._limits()
+        if formats is None or not self._head:
+            return
+        detected = sniff_format(self._head)
+        if detected not in formats:
+            self._fail(415, f"El archivo '{self._field_name}' no tiene un formato admitido ({', '.join(sorted(formats))}).")
+
+    def _on_part_data(self, data: bytes, start: int, end: int):
+        self._size += end - start
+        max_bytes, _ = self._limits()
+        if self._size > max_bytes:
+            self._fail(413, f"El campo '{self._field_name}' supera el tamaño máximo de {max_bytes // 1024} KB.")
+            return
+        if self._is_file and not self._sniffed:
+            self._head += data[start:min(end, start + SNIFF_BYTES - len(self._head))]
+            if len(self._head) >= SNIFF_BYTES:
+                self._check_format()
+
+    def _on_part_end(self):
+        if self._is_file and not self._sniffed:
+            self._check_format()
+
+    def feed(self, chunk: bytes):
+        if chunk and self.error is None:
+            self._parser.write(chunk)
+        if self.error is not None:
+            raise self.error
+
+class UploadLimitMiddleware:
+    """
+    Middleware ASGI que aplica los límites de UPLOAD_RULES mientras el cuerpo se
+    recibe. Un archivo demasiado grande o con un formato no admitido corta la
+    petición en cuanto se detecta, en lugar de esperar a que FastAPI lo lea entero.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] not in ("POST", "PUT"):
+            return await self.app(scope, receive, send)
+
+        rules = _rules_for(scope["path"])
+        if rules is None:
+            return await self.app(scope, receive, send)
+
+        headers = dict(scope["headers"])
+        content_type, options = parse_options_header(headers.get(b"content-type", b""))
+        if content_type != b"multipart/form-data" or b"boundary" not in options:
+            return await self.app(scope, receive, send)
+
+        max_body = sum(limit for limit, _ in rules.values()) + MULTIPART_OVERHEAD_BYTES
+        content_length = headers.get(b"content-length")
+        if content_length and content_length.isdigit() and int(content_length) > max_body:
+            response = JSONResponse(
+                status_code=413,
+                content={"detail": f"La petición supera el tamaño máximo de {max_body // MB} MB."},
+            )
+            return await response(scope, receive, send)
+
+        guard = _MultipartGuard(options[b"boundary"], rules)
+
+        async def guarded_receive():
+            message = await receive()
+            if message["type"] == "http.request":
+                guard.feed(message.get("body", b""))
+            return message
+
+        await self.app(scope, guarded_receive, send)
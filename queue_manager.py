@@ -1,18 +1,35 @@
 import asyncio
+import os
+import time
 import uuid
-from typing import Dict, Any, Coroutine
+from typing import Dict, Any, Coroutine, List, Optional
 from services import (
     text3d_service, img3d_service, textimg3d_service, 
     unico3d_service, multiimg3d_service, boceto3d_service,
-    retexturize3d_service
+    retexturize3d_service, user_service
 )
+from utils.cleanup_queue import schedule_blob_cleanup
+from utils.job_metrics import job_metrics
+from utils.webhooks import notify_job_finished
+from utils.space_warmup import space_warmup
+from utils.scratch import (
+    create_job_workspace, release_job_workspace, set_current_workspace, reset_current_workspace, wait_for_disk_space
+)
+from dotenv import load_dotenv
 import logging
 
+load_dotenv()
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Los trabajos y lotes terminados se conservan este tiempo para consultar su estado.
+JOB_RETENTION_SECONDS = float(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+JOB_EVICTION_INTERVAL_SECONDS = float(os.getenv("JOB_EVICTION_INTERVAL_SECONDS", "60"))
+
 task_queue = asyncio.Queue()
 
 jobs: Dict[str, Dict[str, Any]] = {}
+batches: Dict[str, Dict[str, Any]] = {}
 
 SERVICE_MAP: Dict[str, Coroutine] = {
     'Texto3D': text3d_service.create_text3d,
@@ -23,6 +40,7 @@ SERVICE_MAP: Dict[str, Coroutine] = {
     'MultiImagen3D': multiimg3d_service.create_multiimg3d,
     'Boceto3D': boceto3d_service.create_boceto3d,
     'Retexturize3D': retexturize3d_service.create_retexture3d,
+    'EliminarCuenta': user_service.purge_user_data,
 }
 
 SEMAPHORES: Dict[str, asyncio.Semaphore] = {
@@ -34,9 +52,22 @@ SEMAPHORES: Dict[str, asyncio.Semaphore] = {
     'MultiImagen3D': asyncio.Semaphore(10),
     'Boceto3D': asyncio.Semaphore(10),
     'Retexturize3D': asyncio.Semaphore(10),
+    'EliminarCuenta': asyncio.Semaphore(2),
 }
 
-def create_job(job_type: str, user_id: str, data: Dict[str, Any]) -> str:
+# Referencias a las notificaciones en curso para que no se recojan antes de terminar.
+_notification_tasks = set()
+
+# Trabajos que ya esperaron a que su Space despertara; no se vuelven a aplazar.
+_warmup_deferred = set()
+# Referencias a las esperas de arranque en curso, como en _notification_tasks.
+_warmup_tasks = set()
+
+# Tipos de trabajo cuyo servicio acepta un `progress_callback` para informar avances.
+PROGRESS_JOB_TYPES = {'EliminarCuenta', 'TextoImagen2D'}
+
+def create_job(job_type: str, user_id: str, data: Dict[str, Any], cleanup_paths: Optional[List[str]] = None,
+               batch_id: Optional[str] = None) -> str:
     if job_type not in SEMAPHORES:
         logging.error(f"Intento de crear un trabajo para un tipo no configurado en SEMAPHORES: {job_type}")
         raise ValueError(f"El tipo de trabajo '{job_type}' no tiene un semáforo configurado.")
@@ -48,14 +79,113 @@ def create_job(job_type: str, user_id: str, data: Dict[str, Any]) -> str:
         "user_id": user_id,
         "data": data,
         "result": None,
-        "error": None
+        "error": None,
+        "progress": None,
+        "version": 0,
+        # Blobs temporales (p. ej. subidas directas) que se borran al terminar el trabajo.
+        "cleanup_paths": cleanup_paths or [],
+        "batch_id": batch_id,
+        # URL de notificación propia del trabajo (POST /generation/status/{job_id}/webhook).
+        "webhook_url": None,
+        "finished_at": None
     }
+    space_warmup.record_demand(job_type)
     logging.info(f"Nuevo trabajo '{job_type}' creado con ID: {job_id} para el usuario {user_id}")
     return job_id
 
+def create_batch(user_id: str, batch_jobs: List[Dict[str, Any]]) -> str:
+    """
+    Crea y encola todos los trabajos de un lote sin ceder el event loop entre
+    ellos, de modo que o entran todos en la cola o no entra ninguno.
+    Cada elemento de `batch_jobs` es {"job_type", "data", "cleanup_paths"}.
+    """
+    unknown = [job["job_type"] for job in batch_jobs if job["job_type"] not in SEMAPHORES]
+    if unknown:
+        raise ValueError(f"Tipos de trabajo sin semáforo configurado: {', '.join(unknown)}")
+
+    batch_id = str(uuid.uuid4())
+    job_ids = [
+        create_job(job["job_type"], user_id, job["data"], job.get("cleanup_paths"), batch_id=batch_id)
+        for job in batch_jobs
+    ]
+    batches[batch_id] = {"batch_id": batch_id, "user_id": user_id, "job_ids": job_ids}
+    for job_id in job_ids:
+        task_queue.put_nowait(job_id)
+
+    logging.info(f"Lote {batch_id} encolado con {len(job_ids)} trabajos para el usuario {user_id}")
+    return batch_id
+
+def update_job(job_id: str, **changes):
+    # Cada cambio visible incrementa la versión, que se usa como ETag en /generation/status.
+    job = jobs[job_id]
+    job.update(changes)
+    job["version"] += 1
+
+def _report_progress(job_id: str, progress: Dict[str, Any]):
+    update_job(job_id, progress=progress)
+
+def _progress_reporter(job_id: str):
+    # Los servicios informan también desde hilos del executor; `jobs` solo se modifica en el loop.
+    loop = asyncio.get_running_loop()
+    return lambda progress: loop.call_soon_threadsafe(_report_progress, job_id, progress)
+
+def _notify_finished(job_id: str, job_info: Dict[str, Any]):
+    task = asyncio.create_task(notify_job_finished(job_id, job_info, job_info["webhook_url"]))
+    _notification_tasks.add(task)
+    task.add_done_callback(_notification_tasks.discard)
+
+async def _requeue_when_awake(job_id: str, job_type: str):
+    # El trabajo sigue en "pending" mientras el Space arranca, sin ocupar worker ni semáforo.
+    await space_warmup.wait_until_awake(job_type)
+    task_queue.put_nowait(job_id)
+
+def evict_finished_jobs(now: Optional[float] = None) -> int:
+    """
+    Quita de memoria los trabajos terminados hace más de JOB_RETENTION_SECONDS. Los
+    de un lote se quitan junto con el lote cuando han terminado todos.
+    """
+    cutoff = (time.time() if now is None else now) - JOB_RETENTION_SECONDS
+
+    def expired(job_id: str) -> bool:
+        job = jobs.get(job_id)
+        return job is None or (job["finished_at"] is not None and job["finished_at"] < cutoff)
+
+    evicted = 0
+    for batch_id, batch in list(batches.items()):
+        if all(expired(job_id) for job_id in batch["job_ids"]):
+            for job_id in batch["job_ids"]:
+                if jobs.pop(job_id, None) is not None:
+                    evicted += 1
+            del batches[batch_id]
+    for job_id, job in list(jobs.items()):
+        if job["batch_id"] is None and expired(job_id):
+            del jobs[job_id]
+            evicted += 1
+    return evicted
+
+async def job_janitor():
+    logging.info(f"Limpieza de trabajos terminados iniciada (retención de {JOB_RETENTION_SECONDS:.0f}s).")
+    while True:
+        await asyncio.sleep(JOB_EVICTION_INTERVAL_SECONDS)
+        evicted = evict_finished_jobs()
+        if evicted:
+            logging.info(f"Se quitaron de memoria {evicted} trabajos terminados.")
+
+async def resume_account_deletions():
+    """Vuelve a encolar las purgas de cuentas que quedaron a medias en un reinicio."""
+    loop = asyncio.get_running_loop()
+    user_uids = await loop.run_in_executor(None, user_service.pending_account_deletions)
+    for user_uid in user_uids:
+        job_id = create_job(job_type='EliminarCuenta', user_id=user_uid, data={})
+        task_queue.put_nowait(job_id)
+    if user_uids:
+        logging.info(f"Se retoman {len(user_uids)} purgas de cuentas pendientes.")
+
 async def worker(worker_id: int):
     logging.info(f"Worker-{worker_id} ha iniciado.")
     while True:
+        # Con el volumen de scratch casi lleno los trabajos esperan en la cola.
+        await wait_for_disk_space()
         job_id = await task_queue.get()
         job_info = jobs.get(job_id)
 
@@ -67,11 +197,25 @@ async def worker(worker_id: int):
         job_type = job_info['job_type']
         semaphore = SEMAPHORES.get(job_type)
 
+        if job_id not in _warmup_deferred and not space_warmup.is_awake(job_type):
+            logging.info(f"Worker-{worker_id} aplaza el trabajo {job_id}: el Space de {job_type} está despertando.")
+            _warmup_deferred.add(job_id)
+            task = asyncio.create_task(_requeue_when_awake(job_id, job_type))
+            _warmup_tasks.add(task)
+            task.add_done_callback(_warmup_tasks.discard)
+            task_queue.task_done()
+            continue
+        _warmup_deferred.discard(job_id)
+
         logging.info(f"Worker-{worker_id} ha tomado el trabajo {job_id} ({job_type}). Esperando semáforo...")
         
         async with semaphore:
             logging.info(f"Worker-{worker_id} ha adquirido el semáforo para {job_type}. Procesando trabajo {job_id}.")
-            jobs[job_id]["status"] = "processing"
+            update_job(job_id, status="processing")
+            started = time.perf_counter()
+            # Los archivos intermedios del trabajo van a su propio directorio, que se borra al terminar.
+            workspace = create_job_workspace(job_id)
+            workspace_token = set_current_workspace(workspace)
             
             try:
                 service_function = SERVICE_MAP.get(job_type)
@@ -82,18 +226,27 @@ async def worker(worker_id: int):
                     "user_uid": job_info['user_id'],
                     **job_info['data'] 
                 }
+                if job_type in PROGRESS_JOB_TYPES:
+                    service_args["progress_callback"] = _progress_reporter(job_id)
                 
                 result_data = await service_function(**service_args)
                 
-                jobs[job_id]["status"] = "completed"
-                jobs[job_id]["result"] = result_data
+                update_job(job_id, status="completed", result=result_data, finished_at=time.time())
+                space_warmup.record_awake(job_type)
+                job_metrics.record_job(job_type, True, time.perf_counter() - started)
                 logging.info(f"Worker-{worker_id} completó exitosamente el trabajo {job_id}.")
 
             except Exception as e:
                 logging.error(f"Worker-{worker_id} encontró un error procesando el trabajo {job_id}: {e}", exc_info=True)
-                jobs[job_id]["status"] = "failed"
-                jobs[job_id]["error"] = str(e)
+                update_job(job_id, status="failed", error=str(e), finished_at=time.time())
+                job_metrics.record_job(job_type, False, time.perf_counter() - started)
             
             finally:
+                reset_current_workspace(workspace_token)
+                await release_job_workspace(workspace)
+                # Los bytes de entrada ya no hacen falta mientras el estado sigue en memoria.
+                job_info["data"] = {key: value for key, value in job_info["data"].items() if not isinstance(value, (bytes, bytearray))}
+                schedule_blob_cleanup(job_info["cleanup_paths"])
+                _notify_finished(job_id, job_info)
                 logging.info(f"Worker-{worker_id} ha liberado el semáforo para {job_type}.")
                 task_queue.task_done()
\ No newline at end of file
@@ -0,0 +1,296 @@
+import asyncio
+import json
+import os
+import uuid
+import zipfile
+from fastapi import APIRouter, Depends, HTTPException, Form, UploadFile, File, Request
+from typing import Dict, Any, Optional
+from queue_manager import create_batch, batches, jobs
+from middleware.auth_middleware_fastapi import get_current_user
+from middleware.upload_limits_middleware import (
+    sniff_format, MAX_IMAGE_BYTES, MAX_MODEL_BYTES, IMAGE_FORMATS, MODEL_FORMATS
+)
+from config.firebase_config import db, bucket
+from services import SERVICE_INSTANCE_MAP
+from routes.generation_routes import UPLOAD_SLOTS, _resolve_staged_uploads, _staged_upload_path
+from utils.storage_utils import delete_blobs
+from utils.cleanup_queue import schedule_blob_cleanup
+from services.textimg3d_service import TEXT2D_MAX_CANDIDATES, validate_image_url
+from utils.http_utils import compute_etag, conditional_response
+import logging
+
+router = APIRouter(
+    prefix="/generation",
+    tags=["Batch"]
+)
+
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "50"))
+
+# Por tipo de trabajo: campos del manifiesto -> argumento del servicio, valores por
+# defecto, obligatorios y archivos (entrada -> argumento con los bytes, argumento
+# con el nombre del archivo, límite y formatos).
+BATCH_JOB_SPECS = {
+    'Texto3D': {
+        "fields": {"prompt": "prompt", "selectedStyle": "selected_style"},
+        "required": ["prompt", "selectedStyle"],
+    },
+    'TextoImagen2D': {
+        "fields": {"prompt": "prompt", "selectedStyle": "selected_style", "candidates": "candidates"},
+        "defaults": {"selected_style": "none", "candidates": 1},
+        "required": ["prompt"],
+    },
+    'TextImg3D': {
+        "fields": {"prompt": "prompt", "selectedStyle": "selected_style", "imageUrl": "image_url", "fused": "fused"},
+        "defaults": {"selected_style": "none", "image_url": None, "fused": False},
+        "required": ["prompt"],
+    },
+    'Imagen3D': {
+        "files": {"image": ("image_bytes", "image_filename", MAX_IMAGE_BYTES, IMAGE_FORMATS)},
+    },
+    'Unico3D': {
+        "files": {"image": ("image_bytes", "image_filename", MAX_IMAGE_BYTES, IMAGE_FORMATS)},
+    },
+    'Boceto3D': {
+        "fields": {"description": "description"},
+        "defaults": {"description": ""},
+        "files": {"image": ("image_bytes", "image_filename", MAX_IMAGE_BYTES, IMAGE_FORMATS)},
+    },
+    'MultiImagen3D': {
+        "files": {
+            "frontal": ("frontal_bytes", None, MAX_IMAGE_BYTES, IMAGE_FORMATS),
+            "lateral": ("lateral_bytes", None, MAX_IMAGE_BYTES, IMAGE_FORMATS),
+            "trasera": ("trasera_bytes", None, MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        },
+    },
+    'Retexturize3D': {
+        "files": {
+            "model": ("model_bytes", "model_filename", MAX_MODEL_BYTES, MODEL_FORMATS),
+            "texture": ("texture_bytes", "texture_filename", MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        },
+    },
+}
+
+# TextoImagen2D guarda su resultado en la colección de TextImg3D.
+BATCH_COLLECTION_TYPES = {'TextoImagen2D': 'TextImg3D'}
+# Nombres para las entradas subidas con /generation/uploads, que no conservan el original.
+STAGED_FILENAMES = {"model": "model.glb", "texture": "texture.png"}
+
+def _check_archive_member(archive: Optional[zipfile.ZipFile], member: Any, max_bytes: int, formats) -> zipfile.ZipInfo:
+    if archive is None:
+        raise ValueError("el manifiesto referencia archivos pero no se envió 'archive'")
+    if not isinstance(member, str):
+        raise ValueError("las referencias a archivos deben ser nombres dentro del archivo zip")
+    try:
+        info = archive.getinfo(member)
+    except KeyError:
+        raise ValueError(f"'{member}' no está en el archivo zip")
+    if info.file_size == 0:
+        raise ValueError(f"'{member}' está vacío")
+    if info.file_size > max_bytes:
+        raise ValueError(f"'{member}' supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB")
+
+    with archive.open(info) as f:
+        head = f.read(12)
+    if sniff_format(head) not in formats:
+        raise ValueError(f"'{member}' no tiene un formato admitido ({', '.join(sorted(formats))})")
+    return info
+
+def _stage_archive_members(user_uid: str, batch_jobs: list, archive: zipfile.ZipFile) -> list:
+    """
+    Copia a Storage, como si se hubieran subido con /generation/uploads, los archivos
+    del zip que usa cada trabajo; los datos del trabajo guardan solo la ruta y no los
+    bytes. Devuelve las rutas creadas.
+    """
+    staged = []
+    try:
+        for job in batch_jobs:
+            members = job.pop("archive_members", None)
+            if not members:
+                continue
+            upload_id = uuid.uuid4().hex
+            for slot, (bytes_argument, info) in members.items():
+                blob_path = _staged_upload_path(user_uid, upload_id, slot)
+                with archive.open(info) as source:
+                    bucket.blob(blob_path).upload_from_file(source, size=info.file_size)
+                staged.append(blob_path)
+                job["data"][bytes_argument] = {"storage_path": blob_path}
+                job["cleanup_paths"].append(blob_path)
+    except Exception:
+        delete_blobs(staged)
+        raise
+    return staged
+
+def _build_job(user_uid: str, entry: Any, archive: Optional[zipfile.ZipFile]) -> Dict[str, Any]:
+    if not isinstance(entry, dict):
+        raise ValueError("cada trabajo debe ser un objeto")
+    job_type = entry.get("type")
+    spec = BATCH_JOB_SPECS.get(job_type)
+    if spec is None:
+        raise ValueError(f"tipo de trabajo no válido: {job_type}")
+    if not entry.get("generationName"):
+        raise ValueError("falta generationName")
+
+    missing = [field for field in spec.get("required", []) if not entry.get(field)]
+    if missing:
+        raise ValueError(f"faltan campos requeridos: {', '.join(missing)}")
+
+    data = {"generation_name": entry["generationName"], **spec.get("defaults", {})}
+    for manifest_field, argument in spec.get("fields", {}).items():
+        if entry.get(manifest_field) is not None:
+            data[argument] = entry[manifest_field]
+
+    if job_type == 'TextoImagen2D':
+        candidates = data["candidates"]
+        if not isinstance(candidates, int) or isinstance(candidates, bool) or not 1 <= candidates <= TEXT2D_MAX_CANDIDATES:
+            raise ValueError(f"'candidates' debe ser un entero entre 1 y {TEXT2D_MAX_CANDIDATES}")
+    if job_type == 'TextImg3D' and not data["fused"]:
+        if not data["image_url"]:
+            raise ValueError("falta imageUrl (o fused: true)")
+        validate_image_url(user_uid, data["image_url"])
+
+    cleanup_paths = []
+    files = spec.get("files", {})
+    if files and entry.get("uploadId") and job_type in UPLOAD_SLOTS:
+        # Entradas subidas antes con /generation/uploads.
+        try:
+            staged = _resolve_staged_uploads(user_uid, entry["uploadId"], job_type)
+        except HTTPException as e:
+            raise ValueError(e.detail)
+        for slot, (bytes_argument, filename_argument, _, _) in files.items():
+            data[bytes_argument] = staged[slot]
+            if filename_argument:
+                data[filename_argument] = STAGED_FILENAMES[slot]
+        cleanup_paths = [source["storage_path"] for source in staged.values()]
+    else:
+        # Los archivos del zip se suben a Storage después de validar todo el lote.
+        archive_members = {}
+        for slot, (bytes_argument, filename_argument, max_bytes, formats) in files.items():
+            member = entry.get(slot)
+            if not member:
+                raise ValueError(f"falta el archivo '{slot}'")
+            archive_members[slot] = (bytes_argument, _check_archive_member(archive, member, max_bytes, formats))
+            if filename_argument:
+                data[filename_argument] = os.path.basename(member)
+        if archive_members:
+            return {"job_type": job_type, "data": data, "cleanup_paths": cleanup_paths, "archive_members": archive_members}
+
+    return {"job_type": job_type, "data": data, "cleanup_paths": cleanup_paths}
+
+def _existing_names(user_uid: str, batch_jobs: list) -> list:
+    refs = []
+    for job in batch_jobs:
+        service_instance = SERVICE_INSTANCE_MAP[BATCH_COLLECTION_TYPES.get(job["job_type"], job["job_type"])]
+        refs.append(service_instance._doc_ref(user_uid, job["data"]["generation_name"]))
+    # Una sola llamada para todos los documentos del lote.
+    existing = {snapshot.reference.path for snapshot in db.get_all(refs) if snapshot.exists}
+    return [index for index, ref in enumerate(refs) if ref.path in existing]
+
+@router.post("/batch")
+async def enqueue_generation_batch(
+    manifest: str = Form(...),
+    archive: Optional[UploadFile] = File(None),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    try:
+        entries = json.loads(manifest).get("jobs")
+    except (ValueError, AttributeError):
+        raise HTTPException(status_code=400, detail="El manifiesto no es un JSON válido con una lista 'jobs'.")
+    if not isinstance(entries, list) or not entries:
+        raise HTTPException(status_code=400, detail="El manifiesto no contiene trabajos.")
+    if len(entries) > BATCH_MAX_JOBS:
+        raise HTTPException(status_code=400, detail=f"Un lote admite como máximo {BATCH_MAX_JOBS} trabajos.")
+
+    zip_file = None
+    if archive is not None:
+        try:
+            zip_file = zipfile.ZipFile(archive.file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="El archivo adjunto no es un zip válido.")
+
+    loop = asyncio.get_running_loop()
+    errors = []
+    batch_jobs = []
+    seen_names = set()
+    try:
+        for index, entry in enumerate(entries):
+            try:
+                job = await loop.run_in_executor(None, _build_job, user["uid"], entry, zip_file)
+            except ValueError as e:
+                errors.append({"index": index, "error": str(e)})
+                continue
+            key = (job["job_type"], job["data"]["generation_name"])
+            if key in seen_names:
+                errors.append({"index": index, "error": "nombre de generación repetido en el lote"})
+                continue
+            seen_names.add(key)
+            batch_jobs.append((index, job))
+
+        if errors:
+            raise HTTPException(status_code=400, detail={"message": "El lote contiene trabajos no válidos.", "errors": errors})
+
+        conflicts = await loop.run_in_executor(None, _existing_names, user["uid"], [job for _, job in batch_jobs])
+        if conflicts:
+            raise HTTPException(status_code=409, detail={
+                "message": "Algunos nombres de generación ya existen.",
+                "errors": [{"index": batch_jobs[i][0], "error": "El nombre de la generación ya existe."} for i in conflicts],
+            })
+
+        try:
+            staged = await loop.run_in_executor(None, _stage_archive_members, user["uid"], [job for _, job in batch_jobs], zip_file)
+        except Exception as e:
+            logging.error(f"Error al preparar los archivos del lote para {user['uid']}: {e}", exc_info=True)
+            raise HTTPException(status_code=500, detail=f"Error interno al preparar los archivos del lote: {e}")
+    finally:
+        if zip_file is not None:
+            zip_file.close()
+
+    try:
+        batch_id = create_batch(user["uid"], [job for _, job in batch_jobs])
+    except Exception as e:
+        logging.error(f"Error al encolar el lote para {user['uid']}: {e}", exc_info=True)
+        schedule_blob_cleanup(staged)
+        raise HTTPException(status_code=500, detail=f"Error interno al encolar el lote: {e}")
+
+    return {"batch_id": batch_id, "job_ids": batches[batch_id]["job_ids"]}
+
+@router.get("/batch/{batch_id}")
+async def get_batch_status(batch_id: str, request: Request, user: Dict[str, Any] = Depends(get_current_user)):
+    batch = batches.get(batch_id)
+    if not batch:
+        raise HTTPException(status_code=404, detail="Lote no encontrado")
+    if batch["user_id"] != user["uid"]:
+        raise HTTPException(status_code=403, detail="No tienes permiso para ver este lote")
+
+    batch_jobs = [(job_id, jobs[job_id]) for job_id in batch["job_ids"]]
+    etag = compute_etag([batch_id, *(job["version"] for _, job in batch_jobs)])
+
+    counts = {"queued": 0, "processing": 0, "completed": 0, "failed": 0}
+    items = []
+    for job_id, job in batch_jobs:
+        status = "queued" if job["status"] == "pending" else job["status"]
+        counts[status] += 1
+        item = {
+            "job_id": job_id,
+            "job_type": job["job_type"],
+            "generation_name": job["data"]["generation_name"],
+            "status": status,
+        }
+        if job["progress"] is not None:
+            item["progress"] = job["progress"]
+        if job["status"] == "completed":
+            item["result"] = job["result"]
+        elif job["status"] == "failed":
+            item["error"] = job["error"]
+        items.append(item)
+
+    total = len(batch_jobs)
+    finished = counts["completed"] + counts["failed"]
+    response = {
+        "batch_id": batch_id,
+        "status": "completed" if finished == total else ("processing" if finished or counts["processing"] else "queued"),
+        "total": total,
+        "counts": counts,
+        "progress": round(finished / total, 4),
+        "jobs": items,
+    }
+    return conditional_response(request, etag, response)
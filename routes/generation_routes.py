@@ -1,20 +1,31 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, Form, UploadFile, File
-from typing import Dict, Any, Optional
+import asyncio
+from functools import partial
+from fastapi import APIRouter, Depends, HTTPException, Body, Form, UploadFile, File, Query, Request
+from typing import Dict, Any, Optional, List
+import uuid
+import os
 from queue_manager import task_queue, create_job, jobs
 from middleware.auth_middleware_fastapi import get_current_user
-from services import SERVICE_INSTANCE_MAP
+from services import SERVICE_INSTANCE_MAP, gallery_service
 import logging
-from config.firebase_config import db
-import datetime
+from utils.query_utils import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, parse_fields
+from utils.http_utils import compute_etag, conditional_response
+from utils.storage_utils import generate_resumable_upload_url, content_length_range, blob_head, blob_path_from_url
+from middleware.upload_limits_middleware import (
+    MAX_IMAGE_BYTES, MAX_MODEL_BYTES, IMAGE_FORMATS, MODEL_FORMATS, SNIFF_BYTES, sniff_format
+)
+from utils.model_conversion import get_converted_model, ConversionUnavailableError
+from services.textimg3d_service import TEXT2D_MAX_CANDIDATES, validate_image_url
+from utils import webhooks
 
 router = APIRouter(
     prefix="/generation",  
     tags=["Generation"]      
 )
 
-async def enqueue_job(job_type: str, user_uid: str, job_data: Dict[str, Any]):
+async def enqueue_job(job_type: str, user_uid: str, job_data: Dict[str, Any], cleanup_paths: Optional[List[str]] = None):
     try:
-        job_id = create_job(job_type=job_type, user_id=user_uid, data=job_data)
+        job_id = create_job(job_type=job_type, user_id=user_uid, data=job_data, cleanup_paths=cleanup_paths)
         await task_queue.put(job_id)
         
         return {
@@ -29,6 +40,79 @@ async def enqueue_job(job_type: str, user_uid: str, job_data: Dict[str, Any]):
         logging.error(f"Error interno al encolar trabajo '{job_type}' para el usuario {user_uid}: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error interno al encolar el trabajo: {e}")
 
+# Entradas que pueden subirse directamente a Storage con URLs firmadas, con el
+# mismo límite y formatos que la subida multipart equivalente.
+UPLOAD_SLOTS = {
+    'Retexturize3D': {
+        'model': (MAX_MODEL_BYTES, MODEL_FORMATS),
+        'texture': (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+    'MultiImagen3D': {
+        'frontal': (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        'lateral': (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+        'trasera': (MAX_IMAGE_BYTES, IMAGE_FORMATS),
+    },
+}
+
+def _staged_upload_path(user_uid: str, upload_id: str, slot: str) -> str:
+    return f"users/{user_uid}/uploads/{upload_id}/{slot}"
+
+def _resolve_staged_uploads(user_uid: str, upload_id: Any, job_type: str) -> Dict[str, Dict[str, str]]:
+    if not isinstance(upload_id, str):
+        raise HTTPException(status_code=400, detail="El uploadId no es válido.")
+    try:
+        upload_id = uuid.UUID(hex=upload_id).hex
+    except ValueError:
+        raise HTTPException(status_code=400, detail="El uploadId no es válido.")
+
+    # La URL firmada ya limita el tamaño, pero se vuelve a comprobar junto con los
+    # bytes mágicos porque el cliente controla lo que sube.
+    staged = {}
+    for slot, (max_bytes, formats) in UPLOAD_SLOTS[job_type].items():
+        blob_path = _staged_upload_path(user_uid, upload_id, slot)
+        head = blob_head(blob_path, SNIFF_BYTES)
+        if not head or not head[0]:
+            raise HTTPException(status_code=400, detail=f"No se encontró el archivo subido para '{slot}' o está vacío.")
+        size, first_bytes = head
+        if size > max_bytes:
+            raise HTTPException(status_code=413, detail=f"El archivo '{slot}' supera el tamaño máximo de {max_bytes // 1024} KB.")
+        if sniff_format(first_bytes) not in formats:
+            raise HTTPException(status_code=415, detail=f"El archivo '{slot}' no tiene un formato admitido ({', '.join(sorted(formats))}).")
+        staged[slot] = {"storage_path": blob_path}
+    return staged
+
+@router.post("/uploads")
+async def create_direct_uploads(
+    payload: Dict[str, Any] = Body(...),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    job_type = payload.get("jobType")
+    slots = UPLOAD_SLOTS.get(job_type) if isinstance(job_type, str) else None
+    if not slots:
+        raise HTTPException(status_code=400, detail=f"El tipo de trabajo no admite subidas directas: {job_type}")
+
+    content_types = payload.get("contentTypes") or {}
+    if not isinstance(content_types, dict) or not all(isinstance(value, str) for value in content_types.values()):
+        raise HTTPException(status_code=400, detail="contentTypes debe ser un objeto con tipos MIME por archivo.")
+    upload_id = uuid.uuid4().hex
+    try:
+        uploads = {}
+        for slot, (max_bytes, _) in slots.items():
+            content_type = content_types.get(slot)
+            headers = {"x-goog-resumable": "start", "x-goog-content-length-range": content_length_range(max_bytes)}
+            if content_type:
+                headers["Content-Type"] = content_type
+            uploads[slot] = {
+                "url": generate_resumable_upload_url(_staged_upload_path(user["uid"], upload_id, slot), max_bytes, content_type),
+                "method": "POST",
+                "headers": headers,
+            }
+    except Exception as e:
+        logging.error(f"Error al generar URLs de subida para el usuario {user['uid']}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error interno al preparar la subida: {e}")
+
+    return {"upload_id": upload_id, "uploads": uploads}
+
 @router.post("/Texto3D")
 async def enqueue_text3d_generation(
     payload: Dict[str, Any] = Body(...),
@@ -87,11 +171,16 @@ async def enqueue_text_to_2d_image_generation(
 
     if not all([generation_name, prompt]):
          raise HTTPException(status_code=400, detail="Faltan los campos 'generationName' y 'prompt'.")
+
+    candidates = payload.get("candidates", 1)
+    if not isinstance(candidates, int) or isinstance(candidates, bool) or not 1 <= candidates <= TEXT2D_MAX_CANDIDATES:
+        raise HTTPException(status_code=400, detail=f"'candidates' debe ser un entero entre 1 y {TEXT2D_MAX_CANDIDATES}.")
     
     job_data = {
         "generation_name": generation_name,
         "prompt": prompt,
         "selected_style": selected_style or "none",
+        "candidates": candidates,
     }
     
     return await enqueue_job('TextoImagen2D', user["uid"], job_data)
@@ -105,15 +194,28 @@ async def enqueue_textimg3d_generation(
     image_url = payload.get("imageUrl")
     prompt = payload.get("prompt")
     selected_style = payload.get("selectedStyle")
-
-    if not all([generation_name, image_url, prompt, selected_style]):
+    # Modo en un solo trabajo: la imagen 2D se genera y se usa sin pasar por Storage.
+    fused = bool(payload.get("fused"))
+
+    if fused:
+        if not all([generation_name, prompt]):
+            raise HTTPException(status_code=400, detail="Faltan campos requeridos: generationName y prompt.")
+        if SERVICE_INSTANCE_MAP.get('TextImg3D')._generation_exists(user["uid"], generation_name):
+            raise HTTPException(status_code=409, detail="El nombre de la generación ya existe.")
+    elif not all([generation_name, image_url, prompt, selected_style]):
         raise HTTPException(status_code=400, detail="Faltan campos requeridos: generationName, imageUrl, prompt, y selectedStyle.")
+    else:
+        try:
+            validate_image_url(user["uid"], image_url)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
 
     job_data = { 
         "generation_name": generation_name, 
         "image_url": image_url,
         "prompt": prompt,
-        "selected_style": selected_style
+        "selected_style": selected_style or "none",
+        "fused": fused
     }
     
     return await enqueue_job('TextImg3D', user["uid"], job_data)
@@ -224,6 +326,55 @@ async def enqueue_retexturize_3d_generation(
 
     return await enqueue_job('Retexturize3D', user["uid"], job_data)
 
+@router.post("/Retexturize3D/from-upload")
+async def enqueue_retexturize_3d_from_upload(
+    payload: Dict[str, Any] = Body(...),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    generation_name = payload.get("generationName")
+    if not generation_name:
+        raise HTTPException(status_code=400, detail="Falta el campo requerido: generationName")
+
+    service_instance = SERVICE_INSTANCE_MAP.get('Retexturize3D')
+    if service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=409, detail="El nombre de la generación ya existe.")
+
+    staged = _resolve_staged_uploads(user["uid"], payload.get("uploadId"), 'Retexturize3D')
+    job_data = {
+        "generation_name": generation_name,
+        "model_bytes": staged["model"],
+        "model_filename": os.path.basename(payload.get("modelFilename") or "") or "model.glb",
+        "texture_bytes": staged["texture"],
+        "texture_filename": os.path.basename(payload.get("textureFilename") or "") or "texture.png"
+    }
+
+    cleanup_paths = [source["storage_path"] for source in staged.values()]
+    return await enqueue_job('Retexturize3D', user["uid"], job_data, cleanup_paths=cleanup_paths)
+
+@router.post("/MultiImagen3D/from-upload")
+async def enqueue_multi_image_3d_from_upload(
+    payload: Dict[str, Any] = Body(...),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    generation_name = payload.get("generationName")
+    if not generation_name:
+        raise HTTPException(status_code=400, detail="Falta el campo requerido: generationName")
+
+    service_instance = SERVICE_INSTANCE_MAP.get('MultiImagen3D')
+    if service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=409, detail="El nombre de la generación ya existe.")
+
+    staged = _resolve_staged_uploads(user["uid"], payload.get("uploadId"), 'MultiImagen3D')
+    job_data = {
+        "generation_name": generation_name,
+        "frontal_bytes": staged["frontal"],
+        "lateral_bytes": staged["lateral"],
+        "trasera_bytes": staged["trasera"],
+    }
+
+    cleanup_paths = [source["storage_path"] for source in staged.values()]
+    return await enqueue_job('MultiImagen3D', user["uid"], job_data, cleanup_paths=cleanup_paths)
+
 @router.put("/Texto3D/{generation_name}")
 async def regenerate_text_to_3d(
     generation_name: str,
@@ -232,14 +383,9 @@ async def regenerate_text_to_3d(
 ):
     prediction_type = "Texto3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)    
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
 
     job_data = {
         "generation_name": generation_name,
@@ -257,14 +403,9 @@ async def regenerate_image_to_3d(
 ):
     prediction_type = "Imagen3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
     
     image_bytes = await image.read()
     if not image_bytes:
@@ -287,14 +428,9 @@ async def regenerate_unico_to_3d(
     prediction_type = "Unico3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
 
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
     
     image_bytes = await image.read()
     if not image_bytes:
@@ -319,14 +455,9 @@ async def regenerate_multi_image_to_3d(
     prediction_type = "MultiImagen3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
 
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
     
     frontal_bytes = await frontal.read()
     lateral_bytes = await lateral.read()
@@ -354,14 +485,9 @@ async def regenerate_boceto_to_3d(
     prediction_type = "Boceto3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
 
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
     
     image_bytes = await image.read()
     if not image_bytes:
@@ -385,14 +511,13 @@ async def regenerate_text_image_to_3d(
     prediction_type = "TextImg3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
     
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
+    try:
+        validate_image_url(user["uid"], payload.get("imageUrl"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     job_data = {
         "generation_name": generation_name,
         "image_url": payload.get("imageUrl"),
@@ -412,14 +537,9 @@ async def regenerate_retexture_3d(
     prediction_type = "Retexturize3D"
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
 
-    success = service_instance.clear_generation_storage(user_uid=user["uid"], generation_name=generation_name)
-    if not success:
-        raise HTTPException(status_code=500, detail="Error al limpiar la generación anterior.")
-
-    doc_ref = db.collection('predictions').document(user["uid"]).collection(prediction_type).document(generation_name)
-    doc_ref.update({
-        "modelUrl": None, "previewImageUrl": None, "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat()
-    })
+    # La versión anterior se conserva hasta que la nueva termina; su limpieza es diferida.
+    if not service_instance._generation_exists(user["uid"], generation_name):
+        raise HTTPException(status_code=404, detail="No se encontró la generación a regenerar.")
     
     model_bytes = await model.read()
     texture_bytes = await texture.read()
@@ -438,7 +558,7 @@ async def regenerate_retexture_3d(
     return await enqueue_job(prediction_type, user["uid"], job_data)
 
 @router.get("/status/{job_id}")
-async def get_generation_status(job_id: str, user: Dict[str, Any] = Depends(get_current_user)):
+async def get_generation_status(job_id: str, request: Request, user: Dict[str, Any] = Depends(get_current_user)):
     job = jobs.get(job_id)
 
     if not job:
@@ -447,29 +567,104 @@ async def get_generation_status(job_id: str, user: Dict[str, Any] = Depends(get_
     if job["user_id"] != user["uid"]:
         raise HTTPException(status_code=403, detail="No tienes permiso para ver este trabajo")
 
+    etag = compute_etag([job_id, job["version"]])
+
     status_to_report = job["status"]
     if status_to_report == "pending":
         status_to_report = "queued"
 
     response = {"status": status_to_report}
+    if job["progress"] is not None:
+        response["progress"] = job["progress"]
     
     if job["status"] == "completed":
         response["result"] = job["result"]
     elif job["status"] == "failed":
         response["error"] = job["error"]
         
-    return response
+    return conditional_response(request, etag, response)
+
+@router.post("/status/{job_id}/webhook")
+async def register_job_webhook(
+    job_id: str,
+    payload: Dict[str, Any],
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    job = jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job["user_id"] != user["uid"]:
+        raise HTTPException(status_code=403, detail="No tienes permiso para ver este trabajo")
+
+    loop = asyncio.get_running_loop()
+    try:
+        # La validación resuelve el host, así que no se hace en el event loop.
+        url = await loop.run_in_executor(None, webhooks.validate_webhook_url, payload.get("url"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Los envíos se firman con el secreto del usuario; se crea si aún no tiene uno.
+    webhook = await loop.run_in_executor(None, webhooks.get_webhook, user["uid"])
+    if not webhook:
+        webhook = await loop.run_in_executor(None, webhooks.register_webhook, user["uid"], None)
+
+    job["webhook_url"] = url
+    if job["status"] in ("completed", "failed"):
+        # El trabajo ya terminó: se notifica solo a la nueva URL.
+        await webhooks.notify_job_finished(job_id, job, url, include_user_url=False)
+
+    return {"job_id": job_id, "url": url, "secret": webhook["secret"]}
+
+@router.get("/history")
+async def get_all_user_generations(
+    request: Request,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    summary: bool = False,
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    try:
+        selected_fields = parse_fields(fields, summary)
+        entry = await gallery_service.get_all_generations_entry(
+            user_uid=user["uid"],
+            limit=limit,
+            cursor=cursor,
+            fields=selected_fields
+        )
+        return conditional_response(request, entry["etag"], entry["data"])
+    except ValueError as ve:
+        raise HTTPException(status_code=400, detail=str(ve))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error al obtener el historial: {e}")
 
 @router.get("/history/{generation_type}")
 async def get_user_generations(
     generation_type: str,
+    request: Request,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    fields: Optional[str] = None,
+    summary: bool = False,
     user: Dict[str, Any] = Depends(get_current_user)
 ):
     service_instance = SERVICE_INSTANCE_MAP.get(generation_type)
     if service_instance:
         try:
-            generations = service_instance.get_generations(user_uid=user["uid"])
-            return generations
+            selected_fields = parse_fields(fields, summary)
+            # Sin parámetros de paginación se mantiene la respuesta clásica (lista completa).
+            if limit is None and cursor is None:
+                entry = service_instance.get_generations_entry(user_uid=user["uid"], fields=selected_fields)
+            else:
+                entry = service_instance.get_generations_page_entry(
+                    user_uid=user["uid"],
+                    limit=limit or DEFAULT_PAGE_SIZE,
+                    cursor=cursor,
+                    fields=selected_fields
+                )
+            return conditional_response(request, entry["etag"], entry["data"])
+        except ValueError as ve:
+            raise HTTPException(status_code=400, detail=str(ve))
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Error al obtener el historial: {e}")
     else:
@@ -485,11 +680,13 @@ async def upload_generation_preview(
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type_api)
     if service_instance:
         try:
-            updated_doc = service_instance.add_preview_image(
-                user_uid=user["uid"], 
-                generation_name=generation_name, 
+            add_preview = partial(
+                service_instance.add_preview_image,
+                user_uid=user["uid"],
+                generation_name=generation_name,
                 preview_file=preview.file
             )
+            updated_doc = await asyncio.get_running_loop().run_in_executor(None, add_preview)
             return updated_doc
         except ValueError as ve:
             raise HTTPException(status_code=404, detail=str(ve))
@@ -498,6 +695,40 @@ async def upload_generation_preview(
     else:
         raise HTTPException(status_code=400, detail=f"Tipo de predicción no válido: {prediction_type_api}")
 
+@router.get("/{generation_type}/{generation_name}/download")
+async def download_generation_model(
+    generation_type: str,
+    generation_name: str,
+    format: str = Query("glb"),
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    service_instance = SERVICE_INSTANCE_MAP.get(generation_type)
+    if not service_instance:
+        raise HTTPException(status_code=400, detail=f"Tipo de generación no válido: {generation_type}")
+
+    loop = asyncio.get_running_loop()
+    snapshot = await loop.run_in_executor(None, service_instance._doc_ref(user["uid"], generation_name).get)
+    if not snapshot.exists:
+        raise HTTPException(status_code=404, detail="Generación no encontrada.")
+
+    # Las generaciones 2D (y las antiguas sin modelo) no tienen modelUrl.
+    model_url = (snapshot.to_dict() or {}).get("modelUrl")
+    if not model_url:
+        raise HTTPException(status_code=409, detail="La generación no tiene un modelo 3D disponible.")
+    requested_format = format.lower()
+    if requested_format == "glb":
+        return {"format": "GLB", "url": model_url}
+    if blob_path_from_url(model_url) is None:
+        raise HTTPException(status_code=409, detail="El modelo de la generación no está en el almacenamiento y no se puede convertir.")
+
+    try:
+        return await get_converted_model(user["uid"], model_url, requested_format)
+    except ConversionUnavailableError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        logging.error(f"Error al convertir {generation_name} a {requested_format}: {e}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"Error interno al convertir el modelo: {e}")
+
 @router.delete("/{prediction_type}/{generation_name}")
 async def delete_specific_generation(
     prediction_type: str,
@@ -507,7 +738,8 @@ async def delete_specific_generation(
     service_instance = SERVICE_INSTANCE_MAP.get(prediction_type)
     if service_instance:
         try:
-            success = service_instance.delete_generation(user_uid=user["uid"], generation_name=generation_name)
+            delete_func = partial(service_instance.delete_generation, user_uid=user["uid"], generation_name=generation_name)
+            success = await asyncio.get_running_loop().run_in_executor(None, delete_func)
             if success:
                 return {"success": True, "message": "Generación eliminada correctamente."}
             else:
@@ -1,7 +1,11 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Request
 from typing import Dict, Any, Optional
 from services import user_service
+from queue_manager import task_queue, create_job
 from middleware.auth_middleware_fastapi import get_current_user
+from utils.http_utils import conditional_response
+from utils import webhooks
 
 router = APIRouter(
     prefix="/user",
@@ -26,11 +30,11 @@ async def register_user(
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
 @router.get("/data")
-async def get_user_data(user: Dict[str, Any] = Depends(get_current_user)):
+async def get_user_data(request: Request, user: Dict[str, Any] = Depends(get_current_user)):
     try:
-        user_data = user_service.get_user_data(user["uid"])
-        if user_data:
-            return user_data
+        entry = user_service.get_user_data_entry(user["uid"])
+        if entry["data"]:
+            return conditional_response(request, entry["etag"], entry["data"])
         else:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
     except Exception as e:
@@ -62,15 +66,50 @@ async def update_profile_picture(
         raise HTTPException(status_code=400, detail="No se seleccionó ningún archivo")
 
     try:
-        profile_picture_url = user_service.update_profile_picture(user["uid"], profile_picture)
+        profile_picture_url = await asyncio.get_running_loop().run_in_executor(
+            None, user_service.update_profile_picture, user["uid"], profile_picture
+        )
         return {"profile_picture": profile_picture_url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
+@router.post("/webhook")
+async def register_webhook(
+    payload: Dict[str, Any],
+    user: Dict[str, Any] = Depends(get_current_user)
+):
+    try:
+        webhook = await asyncio.get_running_loop().run_in_executor(None, webhooks.register_webhook, user["uid"], payload.get("url"))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
+    # El secreto solo se muestra al registrar; sirve para verificar la cabecera de firma.
+    return {"url": webhook["url"], "secret": webhook["secret"]}
+
+@router.get("/webhook")
+async def get_webhook(user: Dict[str, Any] = Depends(get_current_user)):
+    webhook = webhooks.get_webhook(user["uid"])
+    if not webhook:
+        raise HTTPException(status_code=404, detail="No hay ningún webhook registrado")
+    return {"url": webhook["url"], "updated_at": webhook["updated_at"]}
+
+@router.delete("/webhook")
+async def delete_webhook(user: Dict[str, Any] = Depends(get_current_user)):
+    try:
+        webhooks.delete_webhook(user["uid"])
+        return {"success": True}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
+
 @router.delete("/delete")
 async def delete_user(user: Dict[str, Any] = Depends(get_current_user)):
     try:
         user_service.delete_user(user["uid"])
-        return {"success": True}
+        # La limpieza de archivos y generaciones puede tardar; se delega a un worker.
+        # La solicitud ya está registrada en Firestore y se retoma si el proceso se reinicia.
+        job_id = create_job(job_type='EliminarCuenta', user_id=user["uid"], data={})
+        await task_queue.put(job_id)
+        return {"success": True, "job_id": job_id}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
\ No newline at end of file
@@ -1,6 +1,45 @@
+import asyncio
 import logging
+import os
+import shutil
+import uuid
+from typing import Optional, List, Tuple
+from config.firebase_config import firestore
 from config.firebase_config import db, bucket
-from utils.storage_utils import upload_to_storage
+from utils.storage_utils import upload_immutable, delete_blobs, delete_prefix
+from utils.query_utils import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor, is_valid_position, project_fields
+from utils.cache_utils import get_or_load, generations_prefix, invalidate_generations
+from utils.http_utils import snapshots_etag
+from utils.cleanup_queue import schedule_cleanup, schedule_blob_cleanup
+from utils.input_store import acquire_input, release_inputs
+from utils.glb_variants import build_glb_variants, glb_variants_available
+from utils.glb_inspector import inspect_glb
+from utils.scratch import create_job_workspace, release_job_workspace
+from utils.model_conversion import delete_user_conversions
+from functools import partial
+
+# Referencias a las tareas de variantes GLB en curso para que no se recojan antes de terminar.
+_variant_tasks = set()
+
+@firestore.transactional
+def _attach_glb_variants(transaction, doc_ref, model_url: str, downloads: list, blob_paths: list) -> list:
+    """
+    Añade las variantes al documento si sigue apuntando al mismo modelo. Devuelve
+    las rutas que no han quedado referenciadas y deben borrarse.
+    """
+    snapshot = doc_ref.get(transaction=transaction)
+    if not snapshot.exists:
+        return blob_paths
+    data = snapshot.to_dict()
+    manifest = data.get("storage_manifest") or []
+    if data.get("modelUrl") != model_url:
+        # La generación se regeneró mientras tanto: las variantes ya no le corresponden.
+        return [path for path in blob_paths if path not in manifest]
+    transaction.update(doc_ref, {
+        "downloads": data.get("downloads", []) + downloads,
+        "storage_manifest": manifest + [path for path in blob_paths if path not in manifest],
+    })
+    return []
 
 class BaseGenerationService:
     def __init__(self, collection_name: str, readable_name: str):
@@ -13,9 +52,249 @@ class BaseGenerationService:
         doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
         return doc_ref.get().exists
 
-    def get_generations(self, user_uid: str) -> list:
-        generations_ref = db.collection('predictions').document(user_uid).collection(self.collection_name)
-        return [gen.to_dict() for gen in generations_ref.stream()]
+    def _doc_ref(self, user_uid: str, generation_name: str):
+        return db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
+
+    def _generation_folder(self, user_uid: str, generation_name: str) -> str:
+        return f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
+
+    def save_generation(self, user_uid: str, generation_name: str, data: dict):
+        """
+        Guarda el resultado y, si reemplaza a una versión anterior, encola el borrado
+        diferido de los archivos que ya no están en el nuevo manifiesto.
+        """
+        doc_ref = self._doc_ref(user_uid, generation_name)
+        new_manifest = set(data.get("storage_manifest", []))
+
+        previous = doc_ref.get()
+        try:
+            doc_ref.set(data)
+        except Exception:
+            schedule_blob_cleanup(new_manifest)
+            self._schedule_input_release(user_uid, data.get("input_manifest", []))
+            raise
+        invalidate_generations(user_uid, self.collection_name)
+
+        if previous.exists:
+            previous_data = previous.to_dict()
+            self._schedule_input_release(user_uid, previous_data.get("input_manifest", []))
+            previous_manifest = previous_data.get("storage_manifest")
+            if previous_manifest is None:
+                # Versión anterior sin manifiesto: se listan sus archivos en la carpeta base.
+                base_folder = self._generation_folder(user_uid, generation_name)
+                previous_manifest = [
+                    blob.name for blob in bucket.list_blobs(prefix=f"{base_folder}/")
+                ]
+            schedule_blob_cleanup([path for path in previous_manifest if path not in new_manifest])
+
+    def _upload_generation_file(self, file_source, generation_folder: str, filename: str, storage_manifest: list) -> str:
+        # El nombre final lleva el hash del contenido, así que una regeneración nunca
+        # reutiliza una ruta con contenido distinto. Cada archivo subido queda en el
+        # manifiesto del documento para poder borrarlo sin listar la carpeta.
+        public_url, blob_path = upload_immutable(file_source, generation_folder, filename)
+        if blob_path not in storage_manifest:
+            storage_manifest.append(blob_path)
+        return public_url
+
+    async def _upload_model(self, glb_path: str, generation_folder: str, storage_manifest: list) -> Tuple[str, list]:
+        """
+        Sube el GLB generado. Devuelve la URL del original y la lista `downloads`
+        con su tamaño; las variantes se añaden después con schedule_glb_variants.
+        """
+        glb_url = await asyncio.get_running_loop().run_in_executor(
+            None, self._upload_generation_file, glb_path, generation_folder, 'model.glb', storage_manifest
+        )
+        downloads = [{"format": "GLB", "variant": "original", "url": glb_url, "size": os.path.getsize(glb_path)}]
+        return glb_url, downloads
+
+    def schedule_glb_variants(self, user_uid: str, generation_name: str, glb_path: str, model_url: str):
+        """
+        Genera y publica las variantes comprimidas/LOD en segundo plano, una vez
+        guardada la generación, para no retener al worker ni el semáforo del Space.
+        """
+        if not glb_variants_available():
+            return
+        # El GLB se copia a un workspace propio porque el del trabajo se borra al terminar.
+        workspace = create_job_workspace(f"glb_variants_{uuid.uuid4().hex}")
+        source_path = os.path.join(workspace, "source.glb")
+        shutil.copyfile(glb_path, source_path)
+        task = asyncio.create_task(self._publish_glb_variants(user_uid, generation_name, source_path, model_url, workspace))
+        _variant_tasks.add(task)
+        task.add_done_callback(_variant_tasks.discard)
+
+    async def _publish_glb_variants(self, user_uid: str, generation_name: str, glb_path: str, model_url: str, workspace: str):
+        generation_folder = self._generation_folder(user_uid, generation_name)
+        uploaded = []
+        try:
+            variants = await build_glb_variants(glb_path, workspace)
+            if not variants:
+                return
+            loop = asyncio.get_running_loop()
+            urls = await asyncio.gather(*(
+                loop.run_in_executor(
+                    None,
+                    partial(self._upload_generation_file, variant["path"], generation_folder, f"model.{variant['variant']}.glb", uploaded)
+                )
+                for variant in variants
+            ))
+            downloads = [
+                {"format": "GLB", "variant": variant["variant"], "url": url, "size": variant["size"]}
+                for variant, url in zip(variants, urls)
+            ]
+        except Exception as e:
+            logging.error(f"No se pudieron generar las variantes GLB de {generation_name}: {e}", exc_info=True)
+            schedule_blob_cleanup(uploaded)
+            return
+        finally:
+            await release_job_workspace(workspace)
+
+        try:
+            orphaned = await loop.run_in_executor(
+                None, _attach_glb_variants, db.transaction(), self._doc_ref(user_uid, generation_name), model_url, downloads, uploaded
+            )
+        except Exception as e:
+            # Si la transacción llegó a confirmarse, los archivos están referenciados; los
+            # que no lo estén los recoge el reconciliador de Storage.
+            logging.error(f"No se pudieron registrar las variantes GLB de {generation_name}: {e}", exc_info=True)
+            return
+        if orphaned:
+            logging.info(f"La generación {generation_name} cambió antes de publicar sus variantes GLB; se descartan.")
+            schedule_blob_cleanup(orphaned)
+            return
+        invalidate_generations(user_uid, self.collection_name)
+        logging.info(f"Variantes GLB publicadas para {generation_name}: {[d['variant'] for d in downloads]}")
+
+    async def _inspect_model(self, glb_path: str) -> Optional[dict]:
+        # Las estadísticas son informativas: un GLB que no se puede leer no hace fallar el trabajo.
+        try:
+            mesh_stats = await asyncio.get_running_loop().run_in_executor(None, inspect_glb, glb_path)
+        except Exception as e:
+            logging.warning(f"No se pudieron obtener las estadísticas del GLB {glb_path}: {e}")
+            return None
+        if mesh_stats["degenerate"]:
+            logging.warning(f"El GLB generado en {glb_path} parece degenerado: {mesh_stats}")
+        return mesh_stats
+
+    def _store_input_file(self, user_uid: str, file_source: str, input_manifest: list) -> str:
+        # Las entradas se guardan una sola vez por usuario (por hash) con conteo de
+        # referencias; input_manifest guarda las que usa esta generación.
+        public_url, blob_path = acquire_input(user_uid, file_source)
+        input_manifest.append(blob_path)
+        return public_url
+
+    def _schedule_input_release(self, user_uid: str, input_manifest: list):
+        # Una tarea por entrada: si una falla, el reintento no vuelve a restar las demás.
+        for blob_path in input_manifest:
+            schedule_cleanup(
+                partial(release_inputs, user_uid, [blob_path]),
+                f"liberación de la entrada {blob_path} de {user_uid}"
+            )
+
+    def _delete_generation_files(self, user_uid: str, generation_name: str, doc_data: dict) -> int:
+        """
+        Borra las salidas y libera las entradas. Lo que no se pueda borrar ahora
+        queda en la cola de limpieza, porque el documento que lo registra se elimina.
+        """
+        try:
+            storage_manifest = doc_data.get("storage_manifest")
+            if storage_manifest is not None:
+                try:
+                    return delete_blobs(storage_manifest)
+                except Exception as e:
+                    logging.warning(f"No se pudieron borrar los archivos de {generation_name}; se reintentará: {e}")
+                    schedule_blob_cleanup(storage_manifest)
+                    return 0
+
+            # Documentos creados antes de existir el manifiesto: se lista la carpeta.
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            # La barra final evita borrar también generaciones cuyo nombre empieza igual.
+            return delete_prefix(f"{generation_folder}/")
+        finally:
+            self._schedule_input_release(user_uid, doc_data.get("input_manifest", []))
+            self._delete_conversions(user_uid, generation_name, doc_data)
+
+    def _delete_conversions(self, user_uid: str, generation_name: str, doc_data: dict):
+        storage_manifest = doc_data.get("storage_manifest")
+        generation_folder = f"{self._generation_folder(user_uid, generation_name)}/"
+
+        def matches(source_path: str) -> bool:
+            if storage_manifest is not None:
+                return source_path in storage_manifest
+            return source_path.startswith(generation_folder)
+
+        try:
+            delete_user_conversions(user_uid, matches)
+        except Exception as e:
+            # Las entradas que queden caducan por TTL en el janitor de la caché.
+            logging.warning(f"No se pudieron borrar las conversiones de {generation_name}: {e}")
+
+    def get_generations(self, user_uid: str, fields: Optional[List[str]] = None) -> list:
+        return self.get_generations_entry(user_uid, fields)["data"]
+
+    def get_generations_entry(self, user_uid: str, fields: Optional[List[str]] = None) -> dict:
+        """
+        Devuelve {"data": [...], "etag": ...}. El ETag se calcula con el update_time
+        de cada documento y se cachea junto a los datos.
+        """
+        def load():
+            generations_ref = db.collection('predictions').document(user_uid).collection(self.collection_name)
+            if fields is not None:
+                generations_ref = generations_ref.select(fields)
+            snapshots = list(generations_ref.stream())
+            return {
+                "data": [gen.to_dict() for gen in snapshots],
+                "etag": snapshots_etag(snapshots, fields),
+            }
+
+        cache_key = f"{generations_prefix(user_uid, self.collection_name)}all:{','.join(fields or ['*'])}"
+        return get_or_load(cache_key, load)
+
+    def fetch_generation_snapshots(self, user_uid: str, limit: int, after: Optional[dict] = None, fields: Optional[List[str]] = None) -> Tuple[list, bool]:
+        """
+        Lee una página de generaciones ordenada por timestamp (descendente) y usa el
+        ID del documento como desempate. `after` contiene el timestamp y el ID del
+        último documento de la página anterior.
+        """
+        query = (
+            db.collection('predictions').document(user_uid).collection(self.collection_name)
+            .order_by("timestamp", direction=firestore.Query.DESCENDING)
+            .order_by(firestore.FieldPath.document_id(), direction=firestore.Query.DESCENDING)
+        )
+        if fields is not None:
+            # El timestamp siempre se lee porque es necesario para construir el cursor.
+            query = query.select(sorted(set(fields) | {"timestamp"}))
+        if after:
+            query = query.start_after({"timestamp": after["timestamp"], "__name__": after["id"]})
+
+        snapshots = list(query.limit(limit + 1).stream())
+        return snapshots[:limit], len(snapshots) > limit
+
+    def get_generations_page(self, user_uid: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> dict:
+        return self.get_generations_page_entry(user_uid, limit, cursor, fields)["data"]
+
+    def get_generations_page_entry(self, user_uid: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> dict:
+        cache_key = f"{generations_prefix(user_uid, self.collection_name)}page:{limit}:{cursor or ''}:{','.join(fields or ['*'])}"
+        return get_or_load(cache_key, lambda: self._load_generations_page(user_uid, limit, cursor, fields))
+
+    def _load_generations_page(self, user_uid: str, limit: int, cursor: Optional[str], fields: Optional[List[str]]) -> dict:
+        after = None
+        if cursor:
+            after = decode_cursor(cursor)
+            if not is_valid_position(after):
+                raise ValueError("El cursor de paginación no es válido.")
+
+        snapshots, has_more = self.fetch_generation_snapshots(user_uid, limit, after, fields)
+        items = [project_fields(snapshot.to_dict(), fields) for snapshot in snapshots]
+
+        next_cursor = None
+        if has_more and snapshots:
+            last = snapshots[-1]
+            next_cursor = encode_cursor({"timestamp": last.get("timestamp"), "id": last.id})
+
+        return {
+            "data": {"items": items, "next_cursor": next_cursor},
+            "etag": snapshots_etag(snapshots, fields, next_cursor),
+        }
 
     def add_preview_image(self, user_uid: str, generation_name: str, preview_file) -> dict:
         doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
@@ -24,14 +303,27 @@ class BaseGenerationService:
         if not doc.exists:
             raise ValueError(f"No se encontró la generación '{generation_name}' para el usuario.")
 
-        generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
+        generation_folder = self._generation_folder(user_uid, generation_name)
         
         try:
-            preview_image_url = upload_to_storage(preview_file, f'{generation_folder}/preview_image.png')
+            preview_image_url, preview_blob_path = upload_immutable(preview_file, generation_folder, 'preview_image.png')
             update_data = {"previewImageUrl": preview_image_url}
-            doc_ref.update(update_data)
 
             updated_doc_data = doc.to_dict()
+            storage_manifest = updated_doc_data.get("storage_manifest")
+            if storage_manifest is not None:
+                old_previews = [
+                    path for path in storage_manifest
+                    if path.startswith(f'{generation_folder}/preview_image') and path != preview_blob_path
+                ]
+                new_manifest = [path for path in storage_manifest if path not in old_previews and path != preview_blob_path] + [preview_blob_path]
+                doc_ref.update({**update_data, "storage_manifest": new_manifest})
+                updated_doc_data["storage_manifest"] = new_manifest
+                schedule_blob_cleanup(old_previews)
+            else:
+                doc_ref.update(update_data)
+            invalidate_generations(user_uid, self.collection_name)
+
             updated_doc_data.update(update_data)
             return updated_doc_data
         except Exception as e:
@@ -46,44 +338,12 @@ class BaseGenerationService:
         if not doc.exists:
             return False
 
-        generation_folder = f"users/{user_uid}/generations/{self.collection_name}/{generation_name}"
-        
         try:
-            blobs = bucket.list_blobs(prefix=generation_folder)
-            for blob in blobs:
-                blob.delete()
+            self._delete_generation_files(user_uid, generation_name, doc.to_dict())
         except Exception as e:
             # --- CAMBIO AQUÍ: Reemplazado current_app.logger por logging ---
             logging.error(f"Error al eliminar archivos de Storage para {generation_name}: {e}", exc_info=True)
 
         doc_ref.delete()
+        invalidate_generations(user_uid, self.collection_name)
         return True
-
-    def clear_generation_storage(self, user_uid: str, generation_name: str) -> bool:
-        """
-        Elimina solo los archivos de Firebase Storage asociados a una generación,
-        pero deja el documento de Firestore intacto.
-        """
-        doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-        doc = doc_ref.get()
-
-        if not doc.exists:
-            logging.warning(f"Se intentó limpiar el storage de una generación no existente: {generation_name}")
-            return False
-
-        generation_folder = f"users/{user_uid}/generations/{self.collection_name}/{generation_name}"
-        try:
-            blobs = bucket.list_blobs(prefix=generation_folder)
-            blobs_to_delete = list(blobs)
-            if not blobs_to_delete:
-                logging.info(f"No se encontraron archivos en Storage para limpiar para {generation_name}.")
-                return True
-
-            for blob in blobs_to_delete:
-                blob.delete()
-            
-            logging.info(f"Archivos de Storage para {generation_name} eliminados exitosamente.")
-            return True
-        except Exception as e:
-            logging.error(f"Error al limpiar los archivos de Storage para {generation_name}: {e}", exc_info=True)
-            return False
\ No newline at end of file
@@ -1,14 +1,14 @@
-import asyncio
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from config.huggingface_config import create_hf_client
+from config.huggingface_config import create_async_hf_client
 from gradio_client import handle_file
 from dotenv import load_dotenv
+import asyncio
 import datetime
 import uuid
 import os
-from utils.storage_utils import upload_to_storage
+from utils.image_preprocessing import preprocess_image
+from utils.scratch import job_path
+from utils.storage_utils import write_job_input
 import logging
 
 load_dotenv()
@@ -19,24 +19,26 @@ class Boceto3DService(BaseGenerationService):
         self.gradio_url = os.getenv("CLIENT_BOCETO3D_URL")
 
     async def create_boceto3d(self, user_uid, image_bytes, image_filename, generation_name, description=""):
-        unique_filename = f"temp_boceto_{uuid.uuid4().hex}_{image_filename}"
-        with open(unique_filename, "wb") as f:
-            f.write(image_bytes)
+        unique_filename = job_path(f"temp_boceto_{uuid.uuid4().hex}_{image_filename}")
+        # Bytes de la petición o {"storage_path"} para entradas preparadas en Storage (lotes).
+        await asyncio.get_running_loop().run_in_executor(None, write_job_input, image_bytes, unique_filename)
             
         temp_files_to_clean = [unique_filename]
         client = None
 
         try:
+            input_image_path = await preprocess_image(unique_filename, self.collection_name)
+            if input_image_path != unique_filename:
+                temp_files_to_clean.append(input_image_path)
+
             logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo {generation_name}.")
-            client = create_hf_client(self.gradio_url)
-            loop = asyncio.get_running_loop()
+            client = await create_async_hf_client(self.gradio_url)
 
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
+            await client.predict(api_name="/start_session")
 
-            preprocess_func = partial(
-                client.predict,
-                image=handle_file(unique_filename),
+            logging.info(f"Iniciando preprocesamiento para el trabajo {generation_name}.")
+            processed_image_path = await client.predict(
+                image=handle_file(input_image_path),
                 prompt=description or "A 3D model",
                 negative_prompt="",
                 style_name="3D Model",
@@ -45,21 +47,18 @@ class Boceto3DService(BaseGenerationService):
                 controlnet_conditioning_scale=0.85,
                 api_name="/preprocess_image"
             )
-            logging.info(f"Iniciando preprocesamiento para el trabajo {generation_name}.")
-            processed_image_path = await loop.run_in_executor(None, preprocess_func)
             
             if not processed_image_path or not os.path.exists(processed_image_path):
                 raise FileNotFoundError(f"El archivo preprocesado no se encontró. Respuesta de la API: {processed_image_path}")
             temp_files_to_clean.append(processed_image_path)
             logging.info(f"Preprocesamiento completado para {generation_name}. Archivo en: {processed_image_path}")
 
-            get_seed_func = partial(client.predict, randomize_seed=True, seed=0, api_name="/get_seed")
-            seed_value = await loop.run_in_executor(None, get_seed_func)
+            seed_value = await client.predict(randomize_seed=True, seed=0, api_name="/get_seed")
             if not isinstance(seed_value, int):
                 raise ValueError(f"Seed inválido: {seed_value}")
 
-            image_to_3d_func = partial(
-                client.predict,
+            logging.info(f"Iniciando generación 3D para el trabajo {generation_name}.")
+            result_image_to_3d = await client.predict(
                 image_path=handle_file(processed_image_path),
                 seed=seed_value,
                 ss_guidance_strength=7.5,
@@ -68,8 +67,6 @@ class Boceto3DService(BaseGenerationService):
                 slat_sampling_steps=12,
                 api_name="/image_to_3d"
             )
-            logging.info(f"Iniciando generación 3D para el trabajo {generation_name}.")
-            result_image_to_3d = await loop.run_in_executor(None, image_to_3d_func)
             
             if not isinstance(result_image_to_3d, dict) or "video" not in result_image_to_3d:
                 raise ValueError(f"Respuesta inválida de image_to_3d: {result_image_to_3d}")
@@ -79,14 +76,12 @@ class Boceto3DService(BaseGenerationService):
                 raise FileNotFoundError(f"El archivo 3D generado no se encontró. Respuesta de la API: {generated_3d_asset}")
             temp_files_to_clean.append(generated_3d_asset)
 
-            extract_glb_func = partial(
-                client.predict,
-                mesh_simplify=0.95, 
+            logging.info(f"Extrayendo GLB para el trabajo {generation_name}.")
+            result_extract_glb = await client.predict(
+                mesh_simplify=0.95,
                 texture_size=1024,
                 api_name="/extract_glb"
             )
-            logging.info(f"Extrayendo GLB para el trabajo {generation_name}.")
-            result_extract_glb = await loop.run_in_executor(None, extract_glb_func)
             
             if not result_extract_glb or not isinstance(result_extract_glb, (list, tuple)) or len(result_extract_glb) < 2:
                 raise ValueError(f"Respuesta inesperada de 'extract_glb': {result_extract_glb}")
@@ -96,31 +91,33 @@ class Boceto3DService(BaseGenerationService):
                 raise FileNotFoundError(f"El archivo GLB extraído no se encontró. Respuesta de la API: {extracted_glb_path}")
             temp_files_to_clean.append(extracted_glb_path)
 
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
+            await client.predict(api_name="/end_session")
             logging.info(f"Sesión de Gradio finalizada para {generation_name}.")
 
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'            
-            glb_url_base = upload_to_storage(extracted_glb_path, f'{generation_folder}/model.glb')
-            input_image_url = upload_to_storage(unique_filename, f'{generation_folder}/input_image.png')
-
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            glb_url_with_cache_buster = f"{glb_url_base}{timestamp_query}"
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            storage_manifest = []
+            input_manifest = []
+            glb_url, downloads = await self._upload_model(extracted_glb_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(extracted_glb_path)
+            input_image_url = self._store_input_file(user_uid, unique_filename, input_manifest)
 
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": glb_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": glb_url_with_cache_buster}],
+                "modelUrl": glb_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
+                "input_manifest": input_manifest,
                 "raw_data": {
                     "description": description, 
                     "input_image_url": input_image_url
                 }
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, extracted_glb_path, glb_url)
             
             logging.info(f"Trabajo {generation_name} completado y guardado en Firestore.")
             return normalized_result
@@ -139,7 +136,7 @@ class Boceto3DService(BaseGenerationService):
 
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar el cliente Gradio para {generation_name}: {e}")
\ No newline at end of file
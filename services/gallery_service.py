@@ -0,0 +1,83 @@
+import asyncio
+from functools import partial
+from typing import Optional, List
+from . import SERVICE_INSTANCE_MAP
+from utils.query_utils import DEFAULT_PAGE_SIZE, encode_cursor, decode_cursor, is_valid_position, project_fields
+from utils.cache_utils import cache, MISSING, gallery_prefix, invalidation_version, set_if_current
+from utils.http_utils import snapshots_etag
+
+# Las generaciones de cada tipo viven en subcolecciones con nombres distintos
+# (predictions/{uid}/{tipo}), por lo que no sirve una consulta collection-group:
+# se lee una página de cada tipo en paralelo y se mezclan por timestamp.
+# El cursor guarda la posición de cada tipo; `False` marca un tipo ya agotado.
+
+def _decode_gallery_cursor(cursor: Optional[str]) -> dict:
+    if not cursor:
+        return {}
+
+    state = decode_cursor(cursor)
+    for generation_type, position in state.items():
+        if generation_type not in SERVICE_INSTANCE_MAP:
+            raise ValueError("El cursor de paginación no es válido.")
+        if position is not False and not is_valid_position(position):
+            raise ValueError("El cursor de paginación no es válido.")
+    return state
+
+async def get_all_generations(user_uid: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> dict:
+    entry = await get_all_generations_entry(user_uid, limit, cursor, fields)
+    return entry["data"]
+
+async def get_all_generations_entry(user_uid: str, limit: int = DEFAULT_PAGE_SIZE, cursor: Optional[str] = None, fields: Optional[List[str]] = None) -> dict:
+    cache_key = f"{gallery_prefix(user_uid)}{limit}:{cursor or ''}:{','.join(fields or ['*'])}"
+    entry = cache.get(cache_key)
+    if entry is not MISSING:
+        return entry
+
+    version = invalidation_version(cache_key)
+    entry = await _load_all_generations(user_uid, limit, cursor, fields)
+    set_if_current(cache_key, entry, version)
+    return entry
+
+async def _load_all_generations(user_uid: str, limit: int, cursor: Optional[str], fields: Optional[List[str]]) -> dict:
+    state = _decode_gallery_cursor(cursor)
+    active_types = [t for t in SERVICE_INSTANCE_MAP if state.get(t) is not False]
+
+    loop = asyncio.get_running_loop()
+    results = await asyncio.gather(*[
+        loop.run_in_executor(
+            None,
+            partial(SERVICE_INSTANCE_MAP[t].fetch_generation_snapshots, user_uid, limit, state.get(t), fields)
+        )
+        for t in active_types
+    ])
+
+    candidates = []
+    for generation_type, (snapshots, _) in zip(active_types, results):
+        for snapshot in snapshots:
+            candidates.append((snapshot.get("timestamp"), snapshot.id, generation_type, snapshot))
+
+    # Mismo orden que las consultas por tipo: timestamp y luego ID, ambos descendentes.
+    candidates.sort(key=lambda c: (c[0], c[1]), reverse=True)
+    page = candidates[:limit]
+
+    next_state = dict(state)
+    for generation_type, (snapshots, has_more) in zip(active_types, results):
+        included = [c for c in page if c[2] == generation_type]
+        if included:
+            last_timestamp, last_id, _, _ = included[-1]
+            next_state[generation_type] = {"timestamp": last_timestamp, "id": last_id}
+        if len(included) == len(snapshots) and not has_more:
+            next_state[generation_type] = False
+
+    items = []
+    for _, _, generation_type, snapshot in page:
+        item = project_fields(snapshot.to_dict(), fields)
+        item["generation_type"] = generation_type
+        items.append(item)
+
+    pending = any(next_state.get(t) is not False for t in SERVICE_INSTANCE_MAP)
+    next_cursor = encode_cursor(next_state) if pending else None
+    return {
+        "data": {"items": items, "next_cursor": next_cursor},
+        "etag": snapshots_etag([c[3] for c in page], fields, next_cursor),
+    }
@@ -1,14 +1,14 @@
 import asyncio
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from config.huggingface_config import create_hf_client
+from config.huggingface_config import create_async_hf_client
 from gradio_client import handle_file
 from dotenv import load_dotenv
 import datetime
 import uuid
 import os
-from utils.storage_utils import upload_to_storage
+from utils.storage_utils import write_job_input
+from utils.image_preprocessing import preprocess_image
+from utils.scratch import job_path
 import logging
 
 load_dotenv()
@@ -21,28 +21,40 @@ class MultiImg3DService(BaseGenerationService):
     async def create_multiimg3d(self, user_uid, frontal_bytes, lateral_bytes, trasera_bytes, generation_name):
 
         temp_input_files = {
-            "frontal": f"temp_frontal_{uuid.uuid4().hex}.png",
-            "lateral": f"temp_lateral_{uuid.uuid4().hex}.png",
-            "trasera": f"temp_trasera_{uuid.uuid4().hex}.png"
+            "frontal": job_path(f"temp_frontal_{uuid.uuid4().hex}.png"),
+            "lateral": job_path(f"temp_lateral_{uuid.uuid4().hex}.png"),
+            "trasera": job_path(f"temp_trasera_{uuid.uuid4().hex}.png")
         }
-        
-        with open(temp_input_files["frontal"], "wb") as f: f.write(frontal_bytes)
-        with open(temp_input_files["lateral"], "wb") as f: f.write(lateral_bytes)
-        with open(temp_input_files["trasera"], "wb") as f: f.write(trasera_bytes)
 
         temp_files_to_clean = list(temp_input_files.values())
         client = None
 
         try:
-            logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo {generation_name}.")
-            client = create_hf_client(self.gradio_url)
             loop = asyncio.get_running_loop()
 
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
+            # Las imágenes pueden venir en la petición o subidas antes a Storage.
+            await asyncio.gather(
+                loop.run_in_executor(None, write_job_input, frontal_bytes, temp_input_files["frontal"]),
+                loop.run_in_executor(None, write_job_input, lateral_bytes, temp_input_files["lateral"]),
+                loop.run_in_executor(None, write_job_input, trasera_bytes, temp_input_files["trasera"]),
+            )
+
+            views = list(temp_input_files)
+            preprocessed = await asyncio.gather(
+                *(preprocess_image(temp_input_files[view], self.collection_name) for view in views)
+            )
+            for view, image_path in zip(views, preprocessed):
+                if image_path != temp_input_files[view]:
+                    temp_files_to_clean.append(image_path)
+                    temp_input_files[view] = image_path
+
+            logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo {generation_name}.")
+            client = await create_async_hf_client(self.gradio_url)
+
+            await client.predict(api_name="/start_session")
 
-            preprocess_func = partial(
-                client.predict,
+            logging.info(f"Enviando imágenes para preprocesamiento para el trabajo {generation_name}.")
+            preprocess_results = await client.predict(
                 images=[
                     {"image": handle_file(temp_input_files["frontal"])},
                     {"image": handle_file(temp_input_files["lateral"])},
@@ -51,9 +63,6 @@ class MultiImg3DService(BaseGenerationService):
                 api_name="/preprocess_images"
             )
             
-            logging.info(f"Enviando imágenes para preprocesamiento para el trabajo {generation_name}.")
-            preprocess_results = await loop.run_in_executor(None, preprocess_func)
-            
             if not isinstance(preprocess_results, list) or len(preprocess_results) != 3:
                 raise ValueError(f"Error al preprocesar las imágenes: se esperaban 3 imágenes, se obtuvieron {len(preprocess_results) if isinstance(preprocess_results, list) else 'respuesta no válida'}.")
 
@@ -64,13 +73,12 @@ class MultiImg3DService(BaseGenerationService):
             temp_files_to_clean.extend(preprocess_paths)
             logging.info(f"Preprocesamiento de imágenes completado para el trabajo {generation_name}.")
 
-            get_seed_func = partial(client.predict, randomize_seed=True, seed=0, api_name="/get_seed")
-            seed_value = await loop.run_in_executor(None, get_seed_func)
+            seed_value = await client.predict(randomize_seed=True, seed=0, api_name="/get_seed")
             if not isinstance(seed_value, int):
                 raise ValueError(f"Seed inválido: {seed_value}")
 
-            image_to_3d_func = partial(
-                client.predict,
+            logging.info(f"Iniciando generación 3D para el trabajo {generation_name}.")
+            result_image_to_3d = await client.predict(
                 multiimages=[
                     {"image": handle_file(preprocess_paths[0])},
                     {"image": handle_file(preprocess_paths[1])},
@@ -84,9 +92,6 @@ class MultiImg3DService(BaseGenerationService):
                 multiimage_algo="stochastic",
                 api_name="/image_to_3d"
             )
-            
-            logging.info(f"Iniciando generación 3D para el trabajo {generation_name}.")
-            result_image_to_3d = await loop.run_in_executor(None, image_to_3d_func)
             if not isinstance(result_image_to_3d, dict) or "video" not in result_image_to_3d:
                 raise ValueError(f"Error al generar modelo 3D: respuesta inválida: {result_image_to_3d}")
             
@@ -95,10 +100,8 @@ class MultiImg3DService(BaseGenerationService):
                 raise FileNotFoundError(f"El archivo 3D generado no se encontró. Respuesta de la API: {generated_3d_asset}")
             temp_files_to_clean.append(generated_3d_asset)
 
-            extract_glb_func = partial(client.predict, mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
-            
             logging.info(f"Extrayendo GLB para el trabajo {generation_name}.")
-            result_extract_glb = await loop.run_in_executor(None, extract_glb_func)
+            result_extract_glb = await client.predict(mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
             if not result_extract_glb or not isinstance(result_extract_glb, (list, tuple)) or len(result_extract_glb) < 2:
                 raise ValueError(f"Respuesta inesperada de 'extract_glb': {result_extract_glb}")
 
@@ -107,33 +110,35 @@ class MultiImg3DService(BaseGenerationService):
                 raise FileNotFoundError(f"El archivo GLB extraído no se encontró. Respuesta de la API: {extracted_glb_path}")
             temp_files_to_clean.append(extracted_glb_path)
 
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
+            await client.predict(api_name="/end_session")
             logging.info(f"Sesión de Gradio finalizada para {generation_name}.")
 
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            storage_manifest = []
+            input_manifest = []
             
-            glb_url_base = upload_to_storage(extracted_glb_path, f'{generation_folder}/model.glb')
+            glb_url, downloads = await self._upload_model(extracted_glb_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(extracted_glb_path)
             input_urls = {
-                "frontal": upload_to_storage(temp_input_files["frontal"], f'{generation_folder}/input_frontal.png'),
-                "lateral": upload_to_storage(temp_input_files["lateral"], f'{generation_folder}/input_lateral.png'),
-                "trasera": upload_to_storage(temp_input_files["trasera"], f'{generation_folder}/input_trasera.png')
+                "frontal": self._store_input_file(user_uid, temp_input_files["frontal"], input_manifest),
+                "lateral": self._store_input_file(user_uid, temp_input_files["lateral"], input_manifest),
+                "trasera": self._store_input_file(user_uid, temp_input_files["trasera"], input_manifest)
             }
 
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            glb_url_with_cache_buster = f"{glb_url_base}{timestamp_query}"
-
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": glb_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": glb_url_with_cache_buster}],
+                "modelUrl": glb_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
+                "input_manifest": input_manifest,
                 "raw_data": {"input_image_urls": input_urls}
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, extracted_glb_path, glb_url)
 
             logging.info(f"Trabajo {generation_name} completado y guardado en Firestore.")
             return normalized_result
@@ -152,7 +157,7 @@ class MultiImg3DService(BaseGenerationService):
             
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar el cliente Gradio para {generation_name}: {e}")
\ No newline at end of file
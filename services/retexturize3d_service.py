@@ -1,14 +1,13 @@
 import asyncio
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from config.huggingface_config import create_hf_client
+from config.huggingface_config import create_async_hf_client
 from gradio_client import handle_file
 from dotenv import load_dotenv
 import datetime
 import uuid
 import os
-from utils.storage_utils import upload_to_storage
+from utils.storage_utils import write_job_input
+from utils.scratch import job_path
 import logging
 
 load_dotenv()
@@ -23,34 +22,34 @@ class Retexturize3DService(BaseGenerationService):
     async def create_retexture3d(self, user_uid, generation_name, model_bytes, model_filename, texture_bytes, texture_filename):
         # La comprobación de existencia ahora se maneja en la ruta POST
         
-        temp_model_filename = f"temp_model_{uuid.uuid4().hex}_{model_filename}"
-        temp_texture_filename = f"temp_texture_{uuid.uuid4().hex}_{texture_filename}"
+        temp_model_filename = job_path(f"temp_model_{uuid.uuid4().hex}_{model_filename}")
+        temp_texture_filename = job_path(f"temp_texture_{uuid.uuid4().hex}_{texture_filename}")
         
-        with open(temp_model_filename, "wb") as f:
-            f.write(model_bytes)
-        with open(temp_texture_filename, "wb") as f:
-            f.write(texture_bytes)
-            
         temp_files_to_clean = [temp_model_filename, temp_texture_filename]
         client = None
 
         try:
-            logging.info(f"Creando cliente Gradio para trabajo de retexturizado: {generation_name}")
-            client = create_hf_client(self.gradio_url)
             loop = asyncio.get_running_loop()
 
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
+            # Los archivos pueden venir en la petición o subidos antes a Storage.
+            await asyncio.gather(
+                loop.run_in_executor(None, write_job_input, model_bytes, temp_model_filename),
+                loop.run_in_executor(None, write_job_input, texture_bytes, temp_texture_filename),
+            )
+
+            logging.info(f"Creando cliente Gradio para trabajo de retexturizado: {generation_name}")
+            client = await create_async_hf_client(self.gradio_url)
+
+            await client.predict(api_name="/start_session")
             logging.info(f"Sesión iniciada en Gradio para {generation_name}.")
 
-            get_seed_func = partial(client.predict, randomize_seed=True, seed=2024, api_name="/get_random_seed")
-            seed_value = await loop.run_in_executor(None, get_seed_func)
+            seed_value = await client.predict(randomize_seed=True, seed=2024, api_name="/get_random_seed")
             if not isinstance(seed_value, int):
                 raise ValueError(f"Seed inválido recibido de la API: {seed_value}")
             logging.info(f"Seed obtenido para {generation_name}: {seed_value}")
 
-            generate_texture_func = partial(
-                client.predict,
+            logging.info(f"Iniciando generación de textura para {generation_name}.")
+            result_path = await client.predict(
                 input_image_path=handle_file(temp_texture_filename),
                 input_mesh_path=handle_file(temp_model_filename),
                 guidance_scale=3,
@@ -59,8 +58,6 @@ class Retexturize3DService(BaseGenerationService):
                 reference_conditioning_scale=1,
                 api_name="/generate_texture"
             )
-            logging.info(f"Iniciando generación de textura para {generation_name}.")
-            result_path = await loop.run_in_executor(None, generate_texture_func)
             
             if not result_path or not os.path.exists(result_path):
                 raise FileNotFoundError(f"El archivo del modelo retexturizado no se encontró. Respuesta de API: {result_path}")
@@ -68,31 +65,33 @@ class Retexturize3DService(BaseGenerationService):
             temp_files_to_clean.append(result_path)
             logging.info(f"Textura generada exitosamente para {generation_name}. Archivo en: {result_path}")
 
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
+            await client.predict(api_name="/end_session")
             logging.info(f"Sesión finalizada en Gradio para {generation_name}.")
 
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
-            
-            retextured_model_url_base = upload_to_storage(result_path, f'{generation_folder}/model.glb')
-            texture_image_url = upload_to_storage(temp_texture_filename, f'{generation_folder}/texture_reference.png')
-            
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            retextured_model_url_with_cache_buster = f"{retextured_model_url_base}{timestamp_query}"
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            storage_manifest = []
             
+            retextured_model_url, downloads = await self._upload_model(result_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(result_path)
+            texture_image_url = await asyncio.get_running_loop().run_in_executor(
+                None, self._upload_generation_file, temp_texture_filename, generation_folder, 'texture_reference.png', storage_manifest
+            )
+
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": retextured_model_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": retextured_model_url_with_cache_buster}],
+                "modelUrl": retextured_model_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
                 "raw_data": {
                     "texture_image_url": texture_image_url,
                 }
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, result_path, retextured_model_url)
             
             logging.info(f"Trabajo {generation_name} completado y guardado en Firestore.")
             return normalized_result
@@ -110,7 +109,7 @@ class Retexturize3DService(BaseGenerationService):
                         logging.warning(f"No se pudo eliminar el archivo temporal {file_path}: {e}")
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar cliente Gradio para {generation_name}: {e}")
\ No newline at end of file
@@ -1,12 +1,8 @@
-import asyncio
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from config.huggingface_config import create_hf_client
+from config.huggingface_config import create_async_hf_client
 from dotenv import load_dotenv
 import datetime
 import os
-from utils.storage_utils import upload_to_storage
 import logging
 
 load_dotenv()
@@ -42,19 +38,15 @@ class Text3DService(BaseGenerationService):
 
         try:
             logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo {generation_name}.")
-            client = create_hf_client(self.gradio_url)
-            loop = asyncio.get_running_loop()
+            client = await create_async_hf_client(self.gradio_url)
 
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
+            await client.predict(api_name="/start_session")
 
-            get_seed_func = partial(client.predict, randomize_seed=True, seed=0, api_name="/get_seed")
-            seed_value = await loop.run_in_executor(None, get_seed_func)
+            seed_value = await client.predict(randomize_seed=True, seed=0, api_name="/get_seed")
             if not isinstance(seed_value, int):
                 raise ValueError(f"Seed inválido: {seed_value}")
 
-            text_to_3d_func = partial(
-                client.predict,
+            result_text_to_3d = await client.predict(
                 prompt=prompt_final,
                 seed=seed_value,
                 ss_guidance_strength=7.5,
@@ -63,7 +55,6 @@ class Text3DService(BaseGenerationService):
                 slat_sampling_steps=25,
                 api_name="/text_to_3d"
             )
-            result_text_to_3d = await loop.run_in_executor(None, text_to_3d_func)
             if not isinstance(result_text_to_3d, dict) or "video" not in result_text_to_3d:
                 raise ValueError(f"Error al generar modelo 3D: respuesta de la API inválida: {result_text_to_3d}")
 
@@ -72,8 +63,7 @@ class Text3DService(BaseGenerationService):
                  raise FileNotFoundError(f"El archivo de video generado no se encontró. Respuesta de la API: {generated_video_path}")
             temp_files_to_clean.append(generated_video_path)
 
-            extract_glb_func = partial(client.predict, mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
-            result_extract_glb = await loop.run_in_executor(None, extract_glb_func)
+            result_extract_glb = await client.predict(mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
             if not result_extract_glb or not isinstance(result_extract_glb, (list, tuple)) or len(result_extract_glb) < 2:
                 raise ValueError(f"Respuesta inesperada de 'extract_glb': {result_extract_glb}")
 
@@ -82,21 +72,21 @@ class Text3DService(BaseGenerationService):
                  raise FileNotFoundError(f"El archivo GLB extraído no se encontró. Respuesta de la API: {extracted_glb_path}")
             temp_files_to_clean.append(extracted_glb_path)
 
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
+            await client.predict(api_name="/end_session")
             
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
-            glb_url_base = upload_to_storage(extracted_glb_path, f'{generation_folder}/model.glb')
-            
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            glb_url_with_cache_buster = f"{glb_url_base}{timestamp_query}"
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            storage_manifest = []
+            glb_url, downloads = await self._upload_model(extracted_glb_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(extracted_glb_path)
 
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": glb_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": glb_url_with_cache_buster}],
+                "modelUrl": glb_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
                 "raw_data": {
                     "user_prompt": prompt,
                     "selected_style": selected_style,
@@ -104,8 +94,8 @@ class Text3DService(BaseGenerationService):
                 }
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, extracted_glb_path, glb_url)
 
             return normalized_result
 
@@ -122,7 +112,7 @@ class Text3DService(BaseGenerationService):
                         logging.warning(f"No se pudo eliminar el archivo temporal {file_path}: {e}")
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar el cliente Gradio para {generation_name}: {e}")
\ No newline at end of file
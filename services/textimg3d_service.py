@@ -1,181 +1,293 @@
 import asyncio
 import httpx
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from config.huggingface_config import create_hf_client
+from config.huggingface_config import create_async_hf_client
 from gradio_client import handle_file
 from dotenv import load_dotenv
 import datetime
 import os
-from utils.storage_utils import upload_to_storage
-import tempfile
+import random
+from config.firebase_config import db
+from utils.storage_utils import upload_immutable, blob_path_from_url
+from utils.cleanup_queue import schedule_blob_cleanup
+import uuid
+from utils.image_preprocessing import preprocess_image
+from utils.artifact_cache import artifact_cache
+from utils.remote_fetcher import fetch_to_file
+from utils.scratch import job_path
 import logging
 
 load_dotenv()
 
+TEXT2D_MAX_CANDIDATES = int(os.getenv("TEXT2D_MAX_CANDIDATES", "4"))
+# Llamadas simultáneas a /generate_flux_image sumando todos los trabajos, para que
+# los candidatos no multipliquen la carga sobre el Space.
+FLUX_MAX_CONCURRENT_CALLS = int(os.getenv("FLUX_MAX_CONCURRENT_CALLS", "10"))
+MAX_SEED = 2 ** 31 - 1
+# Candidatos 2D subidos que aún no usa ninguna generación TextImg3D:
+#   predictions/{uid}/text2d_candidates/{generation_name} -> {storage_manifest, timestamp}
+# Al guardar la generación 3D se borran los que no se eligieron; los que nunca se
+# usan los recoge el reconciliador de Storage.
+CANDIDATES_COLLECTION = 'text2d_candidates'
+
+_flux_calls = asyncio.Semaphore(FLUX_MAX_CONCURRENT_CALLS)
+
+STYLE_KEYWORDS = {
+    "realistic": "photorealistic, 8k, hyper-detailed, octane render, cinematic lighting, ultra-realistic",
+    "disney": "disney pixar style, friendly character, vibrant colors, smooth shading, 3d animation movie style",
+    "anime": "anime key visual, studio ghibli style, cel shaded, japanese animation, detailed character design",
+    "chibi": "chibi style, cute, big expressive eyes, small body, kawaii, miniature",
+    "pixar": "pixar movie style, detailed textures, expressive character, 3d animated film scene",
+}
+
+def validate_image_url(user_uid: str, image_url) -> str:
+    """
+    La imagen de entrada debe ser una imagen del propio usuario en el bucket del
+    proyecto; no se descargan URLs arbitrarias. Devuelve la ruta del blob.
+    """
+    blob_path = blob_path_from_url(image_url) if isinstance(image_url, str) else None
+    if blob_path is None or not blob_path.startswith(f"users/{user_uid}/"):
+        raise ValueError("imageUrl debe ser una imagen tuya almacenada en el proyecto.")
+    return blob_path
+
 class TextImg3DService(BaseGenerationService):
     def __init__(self):
         super().__init__(collection_name="TextImg3D", readable_name="Texto a Imagen a 3D")
         self.gradio_url = os.getenv("CLIENT_TEXTOIMAGEN3D_URL")
 
-    async def create_2d_image(self, user_uid, generation_name, prompt, selected_style):
-        if self._generation_exists(user_uid, generation_name):
-            raise ValueError("El nombre de la generación ya existe. Por favor, elige otro nombre.")
+    def _candidates_doc(self, user_uid: str, generation_name: str):
+        return db.collection('predictions').document(user_uid).collection(CANDIDATES_COLLECTION).document(generation_name)
 
-        style_keywords = {
-            "realistic": "photorealistic, 8k, hyper-detailed, octane render, cinematic lighting, ultra-realistic",
-            "disney": "disney pixar style, friendly character, vibrant colors, smooth shading, 3d animation movie style",
-            "anime": "anime key visual, studio ghibli style, cel shaded, japanese animation, detailed character design",
-            "chibi": "chibi style, cute, big expressive eyes, small body, kawaii, miniature",
-            "pixar": "pixar movie style, detailed textures, expressive character, 3d animated film scene",
-        }
+    def _release_candidates(self, user_uid: str, generation_name: str, storage_manifest: list):
+        """Borra los candidatos 2D que no forman parte de la generación guardada."""
+        candidates_doc = self._candidates_doc(user_uid, generation_name)
+        snapshot = candidates_doc.get()
+        if not snapshot.exists:
+            return
+        schedule_blob_cleanup([path for path in snapshot.to_dict().get("storage_manifest", []) if path not in storage_manifest])
+        candidates_doc.delete()
 
+    def _build_2d_prompt(self, prompt, selected_style):
         logging.info(f"Estilo seleccionado para imagen 2D: '{selected_style}'")
-        
-        if selected_style and selected_style in style_keywords:
+
+        if selected_style and selected_style in STYLE_KEYWORDS:
             logging.info(f"Aplicando aumento de prompt para el estilo 2D: {selected_style}")
-            selected_keywords = style_keywords[selected_style]
+            selected_keywords = STYLE_KEYWORDS[selected_style]
             prompt_final = f"award-winning photo of {prompt}, {selected_keywords}, ({selected_style} style)"
         else:
             logging.info("No se aplicó un estilo predefinido. Usando el prompt del usuario para imagen 2D.")
             prompt_final = f"award-winning photo of {prompt}, 4k, detailed"
 
         logging.info(f"Prompt final para 2D enviado a la API: '{prompt_final}'")
-        
-        generated_image_path = None
-        client = None
-
-        try:
-            logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo 2D {generation_name}.")
-            client = create_hf_client(self.gradio_url)
-            loop = asyncio.get_running_loop()
+        return prompt_final
 
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
-
-            generate_image_func = partial(
-                client.predict,
+    async def _generate_flux_image(self, client, prompt_final, generation_name, seed=None):
+        logging.info(f"Iniciando generación de imagen 2D para el trabajo {generation_name}.")
+        async with _flux_calls:
+            generated_image_path = await client.predict(
                 prompt=prompt_final,
-                seed=42,
-                randomize_seed=True,
+                seed=42 if seed is None else seed,
+                randomize_seed=seed is None,
                 width=1024,
                 height=1024,
                 guidance_scale=3.5,
                 api_name="/generate_flux_image"
             )
 
-            logging.info(f"Iniciando generación de imagen 2D para el trabajo {generation_name}.")
-            generated_image_path = await loop.run_in_executor(None, generate_image_func)
-            
-            if not generated_image_path or not os.path.exists(generated_image_path):
-                raise FileNotFoundError(f"Error al generar la imagen 2D. No se encontró el archivo. Respuesta de la API: {generated_image_path}")
+        if not generated_image_path or not os.path.exists(generated_image_path):
+            raise FileNotFoundError(f"Error al generar la imagen 2D. No se encontró el archivo. Respuesta de la API: {generated_image_path}")
+        return generated_image_path
+
+    async def create_2d_image(self, user_uid, generation_name, prompt, selected_style, candidates=1, progress_callback=None):
+        """
+        Con `candidates` > 1 lanza varias generaciones con semillas distintas en la
+        misma sesión e informa de cada URL por `progress_callback` según termina.
+        """
+        if self._generation_exists(user_uid, generation_name):
+            raise ValueError("El nombre de la generación ya existe. Por favor, elige otro nombre.")
+
+        prompt_final = self._build_2d_prompt(prompt, selected_style)
+        candidates = max(1, min(candidates, TEXT2D_MAX_CANDIDATES))
+
+        generated_paths = []
+        image_urls = []
+        uploaded_paths = []
+        client = None
+
+        try:
+            logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo 2D {generation_name}.")
+            client = await create_async_hf_client(self.gradio_url)
+            loop = asyncio.get_running_loop()
+
+            await client.predict(api_name="/start_session")
+
+            generation_folder = self._generation_folder(user_uid, generation_name)
+
+            async def generate_candidate(seed):
+                generated_image_path = await self._generate_flux_image(client, prompt_final, generation_name, seed=seed)
+                generated_paths.append(generated_image_path)
 
-            logging.info(f"Imagen 2D generada para {generation_name}. Subiendo a storage...")
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
-            image_url = upload_to_storage(generated_image_path, f'{generation_folder}/generated_2d_image.png')
+                logging.info(f"Imagen 2D generada para {generation_name}. Subiendo a storage...")
+                image_url, blob_path = await loop.run_in_executor(
+                    None, upload_immutable, generated_image_path, generation_folder, 'generated_2d_image.png'
+                )
+                uploaded_paths.append(blob_path)
+                # El trabajo TextImg3D que suele seguir a este la toma de disco en vez de descargarla.
+                await loop.run_in_executor(None, artifact_cache.put, image_url, generated_image_path)
+                image_urls.append(image_url)
+                if progress_callback:
+                    progress_callback({"candidates": list(image_urls), "total": candidates})
 
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
+            seeds = [None] if candidates == 1 else random.sample(range(MAX_SEED), candidates)
+            results = await asyncio.gather(*(generate_candidate(seed) for seed in seeds), return_exceptions=True)
+            errors = [result for result in results if isinstance(result, Exception)]
+            if not image_urls:
+                raise errors[0]
+            for error in errors:
+                logging.warning(f"Un candidato 2D de {generation_name} falló: {error}")
 
-            return {"generated_2d_image_url": image_url}
+            await client.predict(api_name="/end_session")
+
+            await loop.run_in_executor(None, self._candidates_doc(user_uid, generation_name).set, {
+                "storage_manifest": list(uploaded_paths),
+                "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            })
+            uploaded_paths.clear()
+
+            return {"generated_2d_image_url": image_urls[0], "candidates": image_urls}
 
         except Exception as e:
             logging.error(f"Excepción en create_2d_image para {generation_name}: {e}", exc_info=True)
+            # Los candidatos subidos que no quedaron registrados no los usará nadie.
+            schedule_blob_cleanup(uploaded_paths)
             raise
 
         finally:
-            if generated_image_path and os.path.exists(generated_image_path):
-                try:
-                    os.remove(generated_image_path)
-                except OSError as e:
-                    logging.warning(f"No se pudo eliminar el archivo temporal de imagen 2D {generated_image_path}: {e}")
+            for generated_image_path in generated_paths:
+                if os.path.exists(generated_image_path):
+                    try:
+                        os.remove(generated_image_path)
+                    except OSError as e:
+                        logging.warning(f"No se pudo eliminar el archivo temporal de imagen 2D {generated_image_path}: {e}")
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para el trabajo 2D {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar el cliente Gradio para el trabajo 2D {generation_name}: {e}")
 
-    async def create_3d_from_image(self, user_uid, generation_name, image_url, prompt, selected_style):        
+    async def _download_2d_image(self, image_url, generation_name):
+        downloaded_image_path = job_path(f"temp_2d_{uuid.uuid4().hex}.png")
+
+        # Se sirve desde la caché local si la imagen se generó o descargó hace poco.
+        logging.info(f"Obteniendo imagen 2D de {image_url} para el trabajo 3D {generation_name}.")
+        await fetch_to_file(image_url, downloaded_image_path)
+        return downloaded_image_path
+
+    async def _image_to_glb(self, client, input_image_path, temp_files_to_clean):
+        preprocess_result = await client.predict(image=handle_file(input_image_path), api_name="/preprocess_image")
+
+        preprocess_image_path = preprocess_result[0] if isinstance(preprocess_result, (list, tuple)) else preprocess_result
+        if not preprocess_image_path or not os.path.exists(preprocess_image_path):
+            raise FileNotFoundError(f"Error al preprocesar la imagen. Respuesta de la API: {preprocess_image_path}")
+        temp_files_to_clean.append(preprocess_image_path)
+
+        seed_value = await client.predict(randomize_seed=True, seed=0, api_name="/get_seed")
+
+        result_image_to_3d = await client.predict(
+            image=handle_file(preprocess_image_path),
+            seed=seed_value,
+            ss_guidance_strength=7.5,
+            ss_sampling_steps=12,
+            slat_guidance_strength=3,
+            slat_sampling_steps=12,
+            api_name="/image_to_3d"
+        )
+        if not isinstance(result_image_to_3d, dict) or "video" not in result_image_to_3d:
+            raise ValueError(f"Respuesta inválida de image_to_3d: {result_image_to_3d}")
+
+        generated_3d_asset = result_image_to_3d["video"]
+        if not generated_3d_asset or not os.path.exists(generated_3d_asset):
+            raise FileNotFoundError(f"El archivo 3D generado no se encontró. Respuesta de la API: {generated_3d_asset}")
+        temp_files_to_clean.append(generated_3d_asset)
+
+        result_extract_glb = await client.predict(mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
+        if not result_extract_glb or not isinstance(result_extract_glb, (list, tuple)) or len(result_extract_glb) < 2:
+            raise ValueError(f"Respuesta inesperada de 'extract_glb': {result_extract_glb}")
+
+        extracted_glb_path = result_extract_glb[1]
+        if not extracted_glb_path or not os.path.exists(extracted_glb_path):
+            raise FileNotFoundError(f"El archivo GLB extraído no se encontró. Respuesta de la API: {extracted_glb_path}")
+        temp_files_to_clean.append(extracted_glb_path)
+        return extracted_glb_path
+
+    async def create_3d_from_image(self, user_uid, generation_name, image_url, prompt, selected_style, fused=False):
+        """
+        Con `fused=True` la imagen 2D se genera en la misma sesión y pasa directamente
+        a /preprocess_image; su subida a Storage corre en paralelo con la etapa 3D.
+        """
         temp_files_to_clean = []
         client = None
-        
+        upload_2d_task = None
+
         try:
-            logging.info(f"Descargando imagen 2D de {image_url} para el trabajo 3D {generation_name}.")
-            async with httpx.AsyncClient() as http_client:
-                response = await http_client.get(image_url, timeout=60.0)
-                response.raise_for_status()
-                
-                with tempfile.NamedTemporaryFile(delete=False, suffix=".png") as temp_file:
-                    temp_file.write(response.content)
-                    downloaded_image_path = temp_file.name
-            
-            temp_files_to_clean.append(downloaded_image_path)
-            logging.info(f"Imagen 2D descargada en: {downloaded_image_path}")
+            generation_folder = self._generation_folder(user_uid, generation_name)
+
+            if not fused:
+                validate_image_url(user_uid, image_url)
+                try:
+                    downloaded_image_path = await self._download_2d_image(image_url, generation_name)
+                except httpx.HTTPStatusError as e:
+                    # Solo la descarga: los errores HTTP del Space se propagan tal cual.
+                    logging.error(f"Error HTTP al descargar la imagen para {generation_name}: {e.response.status_code}", exc_info=True)
+                    raise ValueError(f"No se pudo descargar la imagen 2D desde la URL. Código de estado: {e.response.status_code}")
+                temp_files_to_clean.append(downloaded_image_path)
+                logging.info(f"Imagen 2D lista en: {downloaded_image_path}")
 
             logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo 3D {generation_name}.")
-            client = create_hf_client(self.gradio_url)
+            client = await create_async_hf_client(self.gradio_url)
             loop = asyncio.get_running_loop()
-            
-            start_session_func = partial(client.predict, api_name="/start_session")
-            await loop.run_in_executor(None, start_session_func)
-
-            preprocess_func = partial(client.predict, image=handle_file(downloaded_image_path), api_name="/preprocess_image")
-            preprocess_result = await loop.run_in_executor(None, preprocess_func)
-            
-            preprocess_image_path = preprocess_result[0] if isinstance(preprocess_result, (list, tuple)) else preprocess_result
-            if not preprocess_image_path or not os.path.exists(preprocess_image_path):
-                raise FileNotFoundError(f"Error al preprocesar la imagen. Respuesta de la API: {preprocess_image_path}")
-            temp_files_to_clean.append(preprocess_image_path)
-            
-            get_seed_func = partial(client.predict, randomize_seed=True, seed=0, api_name="/get_seed")
-            seed_value = await loop.run_in_executor(None, get_seed_func)
-
-            image_to_3d_func = partial(
-                client.predict,
-                image=handle_file(preprocess_image_path),
-                seed=seed_value,
-                ss_guidance_strength=7.5,
-                ss_sampling_steps=12,
-                slat_guidance_strength=3,
-                slat_sampling_steps=12,
-                api_name="/image_to_3d"
-            )
-            result_image_to_3d = await loop.run_in_executor(None, image_to_3d_func)
-            if not isinstance(result_image_to_3d, dict) or "video" not in result_image_to_3d:
-                raise ValueError(f"Respuesta inválida de image_to_3d: {result_image_to_3d}")
-
-            generated_3d_asset = result_image_to_3d["video"]
-            if not generated_3d_asset or not os.path.exists(generated_3d_asset):
-                raise FileNotFoundError(f"El archivo 3D generado no se encontró. Respuesta de la API: {generated_3d_asset}")
-            temp_files_to_clean.append(generated_3d_asset)
-
-            extract_glb_func = partial(client.predict, mesh_simplify=0.95, texture_size=1024, api_name="/extract_glb")
-            result_extract_glb = await loop.run_in_executor(None, extract_glb_func)
-            if not result_extract_glb or not isinstance(result_extract_glb, (list, tuple)) or len(result_extract_glb) < 2:
-                raise ValueError(f"Respuesta inesperada de 'extract_glb': {result_extract_glb}")
-
-            extracted_glb_path = result_extract_glb[1]
-            if not extracted_glb_path or not os.path.exists(extracted_glb_path):
-                raise FileNotFoundError(f"El archivo GLB extraído no se encontró. Respuesta de la API: {extracted_glb_path}")
-            temp_files_to_clean.append(extracted_glb_path)
-
-            end_session_func = partial(client.predict, api_name="/end_session")
-            await loop.run_in_executor(None, end_session_func)
-            
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'
-            glb_url_base = upload_to_storage(extracted_glb_path, f'{generation_folder}/model.glb')
-
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            glb_url_with_cache_buster = f"{glb_url_base}{timestamp_query}"
+
+            await client.predict(api_name="/start_session")
+
+            if fused:
+                prompt_final = self._build_2d_prompt(prompt, selected_style)
+                downloaded_image_path = await self._generate_flux_image(client, prompt_final, generation_name)
+                temp_files_to_clean.append(downloaded_image_path)
+                upload_2d_task = loop.run_in_executor(
+                    None, upload_immutable, downloaded_image_path, generation_folder, 'generated_2d_image.png'
+                )
+
+            input_image_path = await preprocess_image(downloaded_image_path, self.collection_name)
+            if input_image_path != downloaded_image_path:
+                temp_files_to_clean.append(input_image_path)
+
+            extracted_glb_path = await self._image_to_glb(client, input_image_path, temp_files_to_clean)
+
+            await client.predict(api_name="/end_session")
+
+            storage_manifest = []
+            glb_url, downloads = await self._upload_model(extracted_glb_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(extracted_glb_path)
+
+            if upload_2d_task is not None:
+                image_url, _ = await upload_2d_task
+                upload_2d_task = None
+                await loop.run_in_executor(None, artifact_cache.put, image_url, downloaded_image_path)
+
+            # La imagen 2D se subió en el trabajo TextoImagen2D (o en este mismo) dentro de la misma carpeta.
+            input_2d_image_path = blob_path_from_url(image_url)
+            if input_2d_image_path and input_2d_image_path.startswith(f"{generation_folder}/"):
+                storage_manifest.append(input_2d_image_path)
 
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": glb_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": glb_url_with_cache_buster}],
+                "modelUrl": glb_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
                 "raw_data": {
                     "input_2d_image_url": image_url,
                     "user_prompt": prompt,
@@ -183,20 +295,24 @@ class TextImg3DService(BaseGenerationService):
                 }
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, extracted_glb_path, glb_url)
+            try:
+                self._release_candidates(user_uid, generation_name, storage_manifest)
+            except Exception as e:
+                logging.warning(f"No se pudieron liberar los candidatos 2D de {generation_name}: {e}")
 
             logging.info(f"Trabajo 3D {generation_name} completado y guardado en Firestore.")
             return normalized_result
 
-        except httpx.HTTPStatusError as e:
-            logging.error(f"Error HTTP al descargar la imagen para {generation_name}: {e.response.status_code}", exc_info=True)
-            raise ValueError(f"No se pudo descargar la imagen 2D desde la URL. Código de estado: {e.response.status_code}")
         except Exception as e:
             logging.error(f"Excepción en create_3d_from_image para {generation_name}: {e}", exc_info=True)
             raise
 
         finally:
+            if upload_2d_task is not None:
+                # Se espera a la subida antes de borrar el archivo local que está leyendo.
+                await asyncio.gather(upload_2d_task, return_exceptions=True)
             for file_path in temp_files_to_clean:
                 if file_path and os.path.exists(file_path):
                     try:
@@ -205,7 +321,7 @@ class TextImg3DService(BaseGenerationService):
                         logging.warning(f"No se pudo eliminar el archivo temporal 3D {file_path}: {e}")
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para el trabajo 3D {generation_name} cerrado.")
                 except Exception as e:
-                    logging.warning(f"Error al cerrar el cliente Gradio para el trabajo 3D {generation_name}: {e}")
\ No newline at end of file
+                    logging.warning(f"Error al cerrar el cliente Gradio para el trabajo 3D {generation_name}: {e}")
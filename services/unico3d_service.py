@@ -1,14 +1,14 @@
-import asyncio
-from functools import partial
 from .base_generation_service import BaseGenerationService
-from config.firebase_config import db
-from gradio_client import file
-from config.huggingface_config import create_hf_client
+from gradio_client import handle_file
+from config.huggingface_config import create_async_hf_client
 from dotenv import load_dotenv
+import asyncio
 import datetime
 import uuid
 import os
-from utils.storage_utils import upload_to_storage
+from utils.image_preprocessing import preprocess_image
+from utils.scratch import job_path
+from utils.storage_utils import write_job_input
 import logging
 
 load_dotenv()
@@ -19,32 +19,32 @@ class Unico3DService(BaseGenerationService):
         self.gradio_url = os.getenv("CLIENT_UNICO3D_URL")
 
     async def create_unico3d(self, user_uid, image_bytes, image_filename, generation_name):
-        unique_filename = f"temp_image_unico_{uuid.uuid4().hex}_{image_filename}"
-        with open(unique_filename, "wb") as f:
-            f.write(image_bytes)
+        unique_filename = job_path(f"temp_image_unico_{uuid.uuid4().hex}_{image_filename}")
+        # Bytes de la petición o {"storage_path"} para entradas preparadas en Storage (lotes).
+        await asyncio.get_running_loop().run_in_executor(None, write_job_input, image_bytes, unique_filename)
         
         temp_files_to_clean = [unique_filename]
         client = None
 
         try:
+            input_image_path = await preprocess_image(unique_filename, self.collection_name)
+            if input_image_path != unique_filename:
+                temp_files_to_clean.append(input_image_path)
+
             logging.info(f"Creando una nueva instancia de cliente Gradio para el trabajo {generation_name}.")
-            client = create_hf_client(self.gradio_url)
-            loop = asyncio.get_running_loop()
+            client = await create_async_hf_client(self.gradio_url)
 
-            generate_func = partial(
-                client.predict, 
-                file(unique_filename),  
+            logging.info(f"Enviando trabajo {generation_name} al Space Unique3D...")
+            result_generate3dv2 = await client.predict(
+                handle_file(input_image_path),
                 True,
                 -1,
                 False,
                 True,
                 0.1,
                 "std",
-                api_name="/generate3dv2" 
+                api_name="/generate3dv2"
             )
-            
-            logging.info(f"Enviando trabajo {generation_name} al Space Unique3D...")
-            result_generate3dv2 = await loop.run_in_executor(None, generate_func)
             logging.info(f"Respuesta recibida del Space para {generation_name}.")
 
             if isinstance(result_generate3dv2, tuple) and len(result_generate3dv2) > 0:
@@ -59,26 +59,29 @@ class Unico3DService(BaseGenerationService):
 
             temp_files_to_clean.append(extracted_glb_path)
 
-            generation_folder = f'users/{user_uid}/generations/{self.collection_name}/{generation_name}'            
-            glb_url_base = upload_to_storage(extracted_glb_path, f'{generation_folder}/model.glb')
-            input_image_url = upload_to_storage(unique_filename, f'{generation_folder}/input_image.png')
-            
-            timestamp_query = f"?v={int(datetime.datetime.now().timestamp())}"
-            glb_url_with_cache_buster = f"{glb_url_base}{timestamp_query}"
-            
+            generation_folder = self._generation_folder(user_uid, generation_name)
+            storage_manifest = []
+            input_manifest = []
+            glb_url, downloads = await self._upload_model(extracted_glb_path, generation_folder, storage_manifest)
+            mesh_stats = await self._inspect_model(extracted_glb_path)
+            input_image_url = self._store_input_file(user_uid, unique_filename, input_manifest)
+
             normalized_result = {
                 "generation_name": generation_name,
                 "prediction_type": self.readable_name,
                 "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
-                "modelUrl": glb_url_with_cache_buster,
-                "downloads": [{"format": "GLB", "url": glb_url_with_cache_buster}],
+                "modelUrl": glb_url,
+                "downloads": downloads,
+                "mesh_stats": mesh_stats,
+                "storage_manifest": storage_manifest,
+                "input_manifest": input_manifest,
                 "raw_data": {
                     "input_image_url": input_image_url
                 }
             }
 
-            doc_ref = db.collection('predictions').document(user_uid).collection(self.collection_name).document(generation_name)
-            doc_ref.set(normalized_result)
+            self.save_generation(user_uid, generation_name, normalized_result)
+            self.schedule_glb_variants(user_uid, generation_name, extracted_glb_path, glb_url)
 
             logging.info(f"Trabajo {generation_name} completado y guardado en Firestore.")
             return normalized_result
@@ -97,7 +100,7 @@ class Unico3DService(BaseGenerationService):
             
             if client:
                 try:
-                    await asyncio.get_running_loop().run_in_executor(None, client.close)
+                    await client.close()
                     logging.info(f"Cliente Gradio para {generation_name} cerrado.")
                 except Exception as e:
                     logging.warning(f"Error al cerrar el cliente Gradio para {generation_name}: {e}")
\ No newline at end of file
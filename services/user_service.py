@@ -1,7 +1,16 @@
-from config.firebase_config import db, bucket
+import asyncio
+from functools import partial
+from config.firebase_config import db
+from utils.storage_utils import delete_prefix, upload_immutable
+from utils.cleanup_queue import schedule_blob_cleanup
+from utils.firestore_utils import delete_document_recursive
 import datetime
-from firebase_admin import auth
+from config.firebase_config import auth
 import logging
+from utils.cache_utils import get_or_load, user_key, invalidate_user, invalidate_all_generations
+from utils.http_utils import snapshots_etag
+from utils.webhooks import delete_webhook, delete_user_deliveries
+from utils.model_conversion import delete_user_conversions
 
 def register_user(user_data):
     user_ref = db.collection('users').document(user_data["uid"])
@@ -11,16 +20,26 @@ def register_user(user_data):
         "profile_picture": user_data.get("profile_picture", ""),
         "created_at": datetime.datetime.now()
     }, merge=True)
+    invalidate_user(user_data["uid"])
 
 def get_user_data(user_uid):
-    user_ref = db.collection('users').document(user_uid)
-    user_doc = user_ref.get()
-    return user_doc.to_dict() if user_doc.exists else None
+    return get_user_data_entry(user_uid)["data"]
+
+def get_user_data_entry(user_uid):
+    def load():
+        user_ref = db.collection('users').document(user_uid)
+        user_doc = user_ref.get()
+        if not user_doc.exists:
+            return {"data": None, "etag": None}
+        return {"data": user_doc.to_dict(), "etag": snapshots_etag([user_doc])}
+
+    return get_or_load(user_key(user_uid), load)
 
 def update_user_name(user_uid, new_name):
     try:
         user_ref = db.collection('users').document(user_uid)
         user_ref.update({"name": new_name})
+        invalidate_user(user_uid)
         return get_user_data(user_uid)
     except Exception as e:
         logging.error(f"Error en update_user_name: {str(e)}")
@@ -28,37 +47,84 @@ def update_user_name(user_uid, new_name):
 
 def update_profile_picture(user_uid, uploaded_file):
     try:
-        destination_blob_name = f"users/{user_uid}/profile_picture/image"        
-        blob = bucket.blob(destination_blob_name)        
-        uploaded_file.file.seek(0)        
-        blob.upload_from_file(
+        profile_folder = f"users/{user_uid}/profile_picture"
+        previous_data = get_user_data(user_uid) or {}
+        # Las fotos anteriores a las rutas por hash se guardaban siempre en .../image.
+        previous_blob_name = previous_data.get("profile_picture_path", f"{profile_folder}/image")
+
+        profile_picture_url, destination_blob_name = upload_immutable(
             uploaded_file.file,
+            profile_folder,
+            "image",
             content_type=uploaded_file.content_type
         )
         
-        blob.make_public()
-        base_url = blob.public_url
-        cache_busting_url = f"{base_url}?updated={int(datetime.datetime.now().timestamp())}"
-        
         user_ref = db.collection('users').document(user_uid)
-        user_ref.update({"profile_picture": cache_busting_url})
+        user_ref.update({"profile_picture": profile_picture_url, "profile_picture_path": destination_blob_name})
+        invalidate_user(user_uid)
+        if previous_blob_name != destination_blob_name:
+            schedule_blob_cleanup([previous_blob_name])
         logging.info(f"Foto de perfil actualizada para {user_uid} en {destination_blob_name}")
-        return cache_busting_url
+        return profile_picture_url
         
     except Exception as e:
         logging.error(f"Error en update_profile_picture: {str(e)}")
         raise
 
-def delete_user(user_uid):
-    user_ref = db.collection('users').document(user_uid)
-    user_ref.delete()
+ACCOUNT_DELETIONS_COLLECTION = 'account_deletions'
 
+def delete_user(user_uid):
+    """
+    Elimina el perfil y la cuenta de autenticación. Antes se registra la solicitud
+    de purga en Firestore: los archivos de Storage y las generaciones se eliminan
+    después en segundo plano con purge_user_data, y si el proceso se reinicia antes
+    de terminar, la purga se retoma al arrancar (pending_account_deletions).
+    """
+    deletion_ref = db.collection(ACCOUNT_DELETIONS_COLLECTION).document(user_uid)
+    deletion_ref.set({"requested_at": datetime.datetime.now(datetime.timezone.utc)})
     try:
-        user_folder_prefix = f"users/{user_uid}/"
-        blobs_to_delete = bucket.list_blobs(prefix=user_folder_prefix)
-        for blob in blobs_to_delete:
-            blob.delete()
-        logging.info(f"Todos los archivos de Storage para el usuario {user_uid} han sido eliminados.")
-    except Exception as e:
-        logging.error(f"No se pudieron eliminar los archivos de Storage para {user_uid}: {e}")
-    auth.delete_user(user_uid)
\ No newline at end of file
+        auth.delete_user(user_uid)
+    except Exception:
+        # La cuenta sigue activa: no se debe purgar nada.
+        deletion_ref.delete()
+        raise
+    db.collection('users').document(user_uid).delete()
+    invalidate_user(user_uid)
+
+def pending_account_deletions():
+    return [doc_ref.id for doc_ref in db.collection(ACCOUNT_DELETIONS_COLLECTION).list_documents()]
+
+async def purge_user_data(user_uid, progress_callback=None):
+    progress = {"stage": "storage", "blobs_deleted": 0, "documents_deleted": 0}
+
+    def report(**changes):
+        progress.update(changes)
+        if progress_callback:
+            progress_callback(dict(progress))
+
+    loop = asyncio.get_running_loop()
+    blobs_deleted = await loop.run_in_executor(
+        None,
+        partial(delete_prefix, f"users/{user_uid}/", lambda count: report(blobs_deleted=count))
+    )
+    logging.info(f"Todos los archivos de Storage para el usuario {user_uid} han sido eliminados.")
+
+    report(stage="firestore")
+    documents_deleted = await loop.run_in_executor(
+        None,
+        partial(
+            delete_document_recursive,
+            db.collection('predictions').document(user_uid),
+            lambda count: report(documents_deleted=count)
+        )
+    )
+    invalidate_all_generations(user_uid)
+    # Las entradas de la caché de conversiones están fuera de predictions/{uid}.
+    await loop.run_in_executor(None, delete_user_conversions, user_uid)
+    await loop.run_in_executor(None, delete_webhook, user_uid)
+    await loop.run_in_executor(None, delete_user_deliveries, user_uid)
+    logging.info(f"Todas las generaciones del usuario {user_uid} han sido eliminadas de Firestore.")
+    await loop.run_in_executor(None, db.collection(ACCOUNT_DELETIONS_COLLECTION).document(user_uid).delete)
+
+    report(stage="completed")
+    return {"blobs_deleted": blobs_deleted, "documents_deleted": documents_deleted}
\ No newline at end of file
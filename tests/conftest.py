@@ -0,0 +1,61 @@
+"""
+Las pruebas usan los simulados de fakes/: Firebase en memoria y un Space de
+Gradio local que se arranca una vez por sesión en un puerto libre.
+"""
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import httpx
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+FAKE_SPACE_URL = f"http://127.0.0.1:{_free_port()}"
+
+# La configuración se lee al importar los módulos: debe fijarse antes.
+os.environ["FIREBASE_BACKEND"] = "fake"
+os.environ["HF_SPACE_OVERRIDE_URL"] = FAKE_SPACE_URL
+os.environ["GLB_VARIANTS_ENABLED"] = "false"
+os.environ["GRADIO_SCHEMA_CACHE_DIR"] = tempfile.mkdtemp(prefix="instant3d_test_schemas_")
+os.environ["SCRATCH_ROOT"] = tempfile.mkdtemp(prefix="instant3d_test_scratch_")
+os.environ.setdefault("HF_TOKEN", "hf_fake")
+for name in ("TEXTO3D", "IMAGEN3D", "TEXTOIMAGEN3D", "UNICO3D", "MULTI3D", "BOCETO3D", "RETEXTURE3D"):
+    os.environ.setdefault(f"CLIENT_{name}_URL", f"owner/space-{name.lower()}")
+sys.path.insert(0, ROOT)
+
+@pytest.fixture(scope="session")
+def fake_space():
+    env = {**os.environ, "FAKE_SPACE_LATENCY_SCALE": "0.01", "FAKE_SPACE_IMAGE_BYTES": "4096",
+           "FAKE_SPACE_GLB_BYTES": "65536", "FAKE_SPACE_VIDEO_BYTES": "4096"}
+    port = FAKE_SPACE_URL.rsplit(":", 1)[1]
+    process = subprocess.Popen([sys.executable, "-m", "fakes.gradio_space", "--port", port], cwd=ROOT, env=env)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                httpx.get(f"{FAKE_SPACE_URL}/config", timeout=1).raise_for_status()
+                break
+            except httpx.HTTPError:
+                if process.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("No se pudo arrancar el Space simulado.")
+                time.sleep(0.2)
+        yield FAKE_SPACE_URL
+    finally:
+        process.terminate()
+        process.wait(timeout=10)
+
+@pytest.fixture(autouse=True)
+def fake_firebase():
+    from config.firebase_config import bucket
+    from fakes.firebase import reset_fake_backends
+
+    reset_fake_backends(bucket)
+    yield bucket
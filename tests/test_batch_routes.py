@@ -0,0 +1,78 @@
+import io
+import json
+import zipfile
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from queue_manager import batches, jobs, task_queue
+from routes import batch_routes
+from services import SERVICE_INSTANCE_MAP
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 256
+HEADERS = {"Authorization": "Bearer usuario-1"}
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(batch_routes.router)
+    yield TestClient(app)
+    jobs.clear()
+    batches.clear()
+    while not task_queue.empty():
+        task_queue.get_nowait()
+
+def _archive(members: dict) -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+    return buffer.getvalue()
+
+def _post(client, entries, members=None):
+    files = {"archive": ("lote.zip", _archive(members), "application/zip")} if members is not None else None
+    return client.post("/generation/batch", data={"manifest": json.dumps({"jobs": entries})}, files=files, headers=HEADERS)
+
+def _stored(bucket):
+    return [blob.name for blob in bucket.list_blobs(prefix="users/usuario-1/")]
+
+def test_batch_stages_archive_members(client, fake_firebase):
+    response = _post(client, [
+        {"type": "Texto3D", "generationName": "texto", "prompt": "una silla", "selectedStyle": "none"},
+        {"type": "Imagen3D", "generationName": "imagen", "image": "fotos/silla.png"},
+    ], {"fotos/silla.png": PNG})
+
+    assert response.status_code == 200, response.text
+    body = response.json()
+    assert batches[body["batch_id"]]["job_ids"] == body["job_ids"]
+    image_job = jobs[body["job_ids"][1]]
+    staged_path = image_job["data"]["image_bytes"]["storage_path"]
+    assert image_job["data"]["image_filename"] == "silla.png"
+    assert image_job["cleanup_paths"] == [staged_path]
+    assert _stored(fake_firebase) == [staged_path]
+    assert fake_firebase.blob(staged_path).download_as_bytes() == PNG
+
+def test_batch_rejects_invalid_members_without_staging(client, fake_firebase):
+    response = _post(client, [
+        {"type": "Imagen3D", "generationName": "buena", "image": "buena.png"},
+        {"type": "Imagen3D", "generationName": "texto", "image": "notas.png"},
+        {"type": "Unico3D", "generationName": "falta", "image": "no-existe.png"},
+        {"type": "TextImg3D", "generationName": "ajena", "prompt": "x", "imageUrl": "https://example.com/a.png"},
+    ], {"buena.png": PNG, "notas.png": b"no es una imagen"})
+
+    assert response.status_code == 400
+    errors = response.json()["detail"]["errors"]
+    assert [error["index"] for error in errors] == [1, 2, 3]
+    assert _stored(fake_firebase) == []
+    assert not jobs
+
+def test_batch_rejects_existing_names_without_staging(client, fake_firebase):
+    SERVICE_INSTANCE_MAP["Imagen3D"]._doc_ref("usuario-1", "repetida").set({"generation_name": "repetida"})
+
+    response = _post(client, [
+        {"type": "Imagen3D", "generationName": "nueva", "image": "a.png"},
+        {"type": "Imagen3D", "generationName": "repetida", "image": "a.png"},
+    ], {"a.png": PNG})
+
+    assert response.status_code == 409
+    assert [error["index"] for error in response.json()["detail"]["errors"]] == [1]
+    assert _stored(fake_firebase) == []
@@ -0,0 +1,26 @@
+from utils.cache_utils import MISSING, cache, get_or_load, invalidate_generations, invalidate_user, user_key
+
+def test_load_interrupted_by_invalidation_is_not_cached():
+    key = "generations:usuario-1:Texto3D:all:*"
+
+    def stale_loader():
+        # Una escritura invalida la caché mientras la lectura sigue en curso.
+        invalidate_generations("usuario-1", "Texto3D")
+        return "antes"
+
+    assert get_or_load(key, stale_loader) == "antes"
+    assert cache.get(key) is MISSING
+    assert get_or_load(key, lambda: "después") == "después"
+    assert get_or_load(key, lambda: "otra") == "después"
+
+def test_invalidation_of_other_scopes_does_not_discard_load():
+    key = user_key("usuario-1")
+
+    def loader():
+        invalidate_user("usuario-2")
+        invalidate_generations("usuario-1", "Texto3D")
+        return {"name": "U"}
+
+    invalidate_user("usuario-1")
+    assert get_or_load(key, loader) == {"name": "U"}
+    assert cache.get(key) == {"name": "U"}
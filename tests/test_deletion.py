@@ -0,0 +1,116 @@
+import asyncio
+from services import SERVICE_INSTANCE_MAP
+from services import user_service
+from utils.input_store import acquire_input
+from utils.storage_utils import delete_blobs
+
+def _upload(bucket, *paths):
+    for path in paths:
+        bucket.blob(path).upload_from_string(b"x")
+
+def _names(bucket, prefix=""):
+    return sorted(blob.name for blob in bucket.list_blobs(prefix=prefix))
+
+def test_delete_blobs_in_batches(fake_firebase):
+    paths = [f"users/usuario-1/generations/Texto3D/g/{i}.glb" for i in range(250)]
+    _upload(fake_firebase, *paths)
+    progress = []
+
+    # Un blob que ya no existe no es un error.
+    assert delete_blobs(paths + ["users/usuario-1/no-existe"], progress.append) == 250
+    assert _names(fake_firebase) == []
+    assert progress[-1] == 250
+
+def test_delete_generation_uses_manifest(fake_firebase):
+    service = SERVICE_INSTANCE_MAP["Texto3D"]
+    folder = service._generation_folder("usuario-1", "silla")
+    _upload(fake_firebase, f"{folder}/model.glb", f"{folder}/preview.mp4", "users/usuario-1/generations/Texto3D/sillas/model.glb")
+    service._doc_ref("usuario-1", "silla").set({
+        "generation_name": "silla",
+        "storage_manifest": [f"{folder}/model.glb", f"{folder}/preview.mp4"],
+    })
+
+    assert service.delete_generation("usuario-1", "silla")
+    assert not service._doc_ref("usuario-1", "silla").get().exists
+    assert _names(fake_firebase) == ["users/usuario-1/generations/Texto3D/sillas/model.glb"]
+    assert not service.delete_generation("usuario-1", "silla")
+
+def test_delete_generation_deletes_outputs_when_input_release_fails(fake_firebase, tmp_path, monkeypatch):
+    service = SERVICE_INSTANCE_MAP["Imagen3D"]
+    inputs = []
+    for index in range(2):
+        source = tmp_path / f"entrada{index}.png"
+        source.write_bytes(b"\x89PNG" + bytes([index]) * 32)
+        inputs.append(acquire_input("usuario-1", str(source))[1])
+    folder = service._generation_folder("usuario-1", "silla")
+    _upload(fake_firebase, f"{folder}/model.glb")
+    service._doc_ref("usuario-1", "silla").set({
+        "storage_manifest": [f"{folder}/model.glb"], "input_manifest": inputs,
+    })
+
+    # La primera liberación falla y la cola de limpieza la reintenta.
+    from services import base_generation_service
+    from utils import cleanup_queue
+    original = base_generation_service.release_inputs
+    calls = []
+
+    def failing_release(user_uid, paths):
+        calls.append(paths)
+        if len(calls) == 1:
+            raise RuntimeError("transacción abortada")
+        return original(user_uid, paths)
+
+    monkeypatch.setattr(base_generation_service, "release_inputs", failing_release)
+    monkeypatch.setattr(cleanup_queue, "CLEANUP_RETRY_DELAY_SECONDS", 0)
+
+    async def run():
+        worker = asyncio.create_task(cleanup_queue.cleanup_worker())
+        await asyncio.sleep(0)
+        try:
+            deleted = await asyncio.get_running_loop().run_in_executor(
+                None, service.delete_generation, "usuario-1", "silla"
+            )
+            while len(calls) < 3:
+                await asyncio.sleep(0.01)
+            await cleanup_queue.cleanup_queue.join()
+            return deleted
+        finally:
+            worker.cancel()
+
+    assert asyncio.run(asyncio.wait_for(run(), timeout=10))
+    assert _names(fake_firebase, folder) == []
+    assert _names(fake_firebase, "users/usuario-1/inputs/") == []
+    assert sorted(calls) == sorted([[inputs[0]], [inputs[0]], [inputs[1]]])
+
+def test_delete_user_and_purge(fake_firebase):
+    db = user_service.db
+    user_service.register_user({"uid": "usuario-1", "email": "u@example.com", "name": "U"})
+    for collection in ("Texto3D", "Imagen3D"):
+        for index in range(3):
+            db.collection("predictions").document("usuario-1").collection(collection).document(f"g{index}").set({"i": index})
+    _upload(fake_firebase, "users/usuario-1/a.glb", "users/usuario-1/b/c.png", "users/usuario-2/a.glb")
+    conversions = db.collection("conversion_cache")
+    conversions.document("propia").set({"user_uid": "usuario-1", "source_path": "users/usuario-1/a.glb", "path": "users/usuario-1/b/c.png"})
+    conversions.document("ajena").set({"user_uid": "usuario-2", "source_path": "users/usuario-2/a.glb", "path": "users/usuario-2/a.glb"})
+
+    user_service.delete_user("usuario-1")
+    assert not db.collection("users").document("usuario-1").get().exists
+    assert user_service.pending_account_deletions() == ["usuario-1"]
+
+    progress = []
+    result = asyncio.run(user_service.purge_user_data("usuario-1", progress.append))
+    assert result == {"blobs_deleted": 2, "documents_deleted": 6}
+    assert progress[-1]["stage"] == "completed"
+    assert _names(fake_firebase) == ["users/usuario-2/a.glb"]
+    assert list(db.collection("predictions").document("usuario-1").collections()) == []
+    assert [doc_ref.id for doc_ref in conversions.list_documents()] == ["ajena"]
+    assert user_service.pending_account_deletions() == []
+
+def test_delete_user_keeps_data_when_auth_fails(fake_firebase):
+    try:
+        user_service.delete_user("uid no válido")
+    except user_service.auth.UserNotFoundError:
+        pass
+    else:
+        raise AssertionError("delete_user debía fallar")
+    assert user_service.pending_account_deletions() == []
@@ -0,0 +1,105 @@
+import asyncio
+import copy
+import os
+from utils.gradio_async_client import AsyncSpaceClient, close_space_http_client, get_space_http_client
+
+async def _client(src: str) -> AsyncSpaceClient:
+    http_client = get_space_http_client()
+    config = (await http_client.get(f"{src}/config")).json()
+    api_info = (await http_client.get(f"{src}/gradio_api/info")).json()
+    return AsyncSpaceClient(src, config, api_info)
+
+def test_concurrent_predictions_share_session(fake_space, tmp_path):
+    async def run():
+        client = await _client(fake_space)
+        client.download_dir = str(tmp_path)
+        try:
+            await client.predict(api_name="/start_session")
+            paths = await asyncio.wait_for(asyncio.gather(*(
+                client.predict(prompt="silla", seed=seed, randomize_seed=False, api_name="/generate_flux_image")
+                for seed in range(4)
+            )), timeout=30)
+            await client.predict(api_name="/end_session")
+            return paths
+        finally:
+            await client.close()
+            await close_space_http_client()
+
+    paths = asyncio.run(run())
+    assert len(set(paths)) == 4
+    assert all(os.path.getsize(path) > 0 for path in paths)
+
+def test_create_2d_image_returns_every_candidate(fake_space, fake_firebase):
+    from services.textimg3d_service import TextImg3DService
+
+    async def run():
+        try:
+            return await TextImg3DService().create_2d_image("usuario-1", "silla", "una silla", None, candidates=4)
+        finally:
+            await close_space_http_client()
+
+    result = asyncio.run(run())
+    assert len(set(result["candidates"])) == 4
+    assert result["generated_2d_image_url"] == result["candidates"][0]
+
+def _outdated_schema(schema: dict, api_name: str, change) -> dict:
+    config = copy.deepcopy(schema["config"])
+    change(next(dependency for dependency in config["dependencies"] if dependency["api_name"] == api_name))
+    return {**schema, "config": config}
+
+def _run_with_outdated_schema(src: str, change):
+    async def run():
+        fresh = await _client(src)
+        refreshes = []
+
+        async def refresh_schema():
+            refreshes.append(True)
+            return {"config": fresh.config, "api_info": fresh.api_info}
+
+        outdated = _outdated_schema({"config": fresh.config}, "get_seed", change)
+        client = AsyncSpaceClient(src, outdated["config"], fresh.api_info, refresh_schema=refresh_schema)
+        try:
+            seed = await client.predict(randomize_seed=False, seed=7, api_name="/get_seed")
+            # El cliente sigue con el esquema nuevo: no vuelve a descargarlo.
+            await client.predict(randomize_seed=False, seed=8, api_name="/get_seed")
+            return seed, len(refreshes)
+        finally:
+            await client.close()
+            await close_space_http_client()
+
+    return asyncio.run(run())
+
+def test_outdated_inputs_refresh_schema_and_retry(fake_space):
+    # El esquema en caché tiene una entrada menos que el endpoint real.
+    def drop_input(dependency):
+        dependency["inputs"] = dependency["inputs"][:-1]
+
+    assert _run_with_outdated_schema(fake_space, drop_input) == (7, 1)
+
+def test_rejected_join_refreshes_schema_and_retries(fake_space):
+    def unknown_fn_index(dependency):
+        dependency["id"] = 9999
+
+    assert _run_with_outdated_schema(fake_space, unknown_fn_index) == (7, 1)
+
+def test_stale_cached_schema_is_revalidated(fake_space):
+    from config import huggingface_config
+    from utils.gradio_schema_cache import gradio_schema_cache
+
+    url = fake_space
+
+    async def run():
+        try:
+            fresh = await _client(fake_space)
+            outdated = _outdated_schema({"config": fresh.config}, "get_seed", lambda dependency: dependency.update(inputs=[]))
+            gradio_schema_cache.put(url, f"{fake_space}/", outdated["config"], fresh.api_info)
+            gradio_schema_cache._entries[url]["fetched_at"] = 0
+
+            await huggingface_config.create_async_hf_client(url)
+            await asyncio.gather(*huggingface_config._refresh_tasks)
+            return fresh.config
+        finally:
+            await close_space_http_client()
+
+    config = asyncio.run(run())
+    assert gradio_schema_cache.get(url)["config"] == config
@@ -0,0 +1,61 @@
+import asyncio
+import os
+import sys
+import pytest
+from fakes.gradio_space import make_glb
+from utils import model_conversion, scratch
+from utils.storage_utils import upload_immutable
+
+def _model_url(tmp_path) -> str:
+    source = tmp_path / "model.glb"
+    source.write_bytes(make_glb("conversion", 4096))
+    return upload_immutable(str(source), "users/usuario-1/generations/Texto3D/silla", "model.glb")[0]
+
+def _convert(model_url: str, fmt: str):
+    return asyncio.run(model_conversion.get_converted_model("usuario-1", model_url, fmt))
+
+def _conversion_workspaces():
+    return [name for name in os.listdir(scratch.SCRATCH_JOBS_DIR) if name.startswith("conversion_")]
+
+def test_conversion_is_cached(fake_firebase, tmp_path):
+    model_url = _model_url(tmp_path)
+
+    result = _convert(model_url, "stl")
+    assert result["format"] == "STL" and result["size"] > 0
+    assert _convert(model_url, "stl") == result
+    assert _conversion_workspaces() == []
+
+def test_hung_conversion_is_killed(fake_firebase, tmp_path, monkeypatch):
+    model_url = _model_url(tmp_path)
+    monkeypatch.setattr(model_conversion, "CONVERSION_TIMEOUT_SECONDS", 0.5)
+
+    def hung(*args):
+        return [sys.executable, "-c", "import time; time.sleep(60)"]
+
+    monkeypatch.setattr(model_conversion, "_conversion_command", hung)
+
+    with pytest.raises(asyncio.TimeoutError):
+        _convert(model_url, "stl")
+    assert _conversion_workspaces() == []
+
+    # Las siguientes conversiones no quedan bloqueadas por la anterior.
+    monkeypatch.undo()
+    assert _convert(model_url, "ply")["format"] == "PLY"
+
+def _conversion_entries():
+    return [snapshot.to_dict() for snapshot in model_conversion.db.collection(model_conversion.CONVERSION_CACHE_COLLECTION).stream()]
+
+def test_deleting_generation_drops_its_conversions(fake_firebase, tmp_path):
+    from services import SERVICE_INSTANCE_MAP
+    from utils.storage_utils import blob_path_from_url
+
+    service = SERVICE_INSTANCE_MAP["Texto3D"]
+    model_url = _model_url(tmp_path)
+    model_path = blob_path_from_url(model_url)
+    service._doc_ref("usuario-1", "silla").set({"modelUrl": model_url, "storage_manifest": [model_path]})
+    _convert(model_url, "stl")
+    [entry] = _conversion_entries()
+
+    assert service.delete_generation("usuario-1", "silla")
+    assert _conversion_entries() == []
+    assert not fake_firebase.blob(entry["path"]).exists()
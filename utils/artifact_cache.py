@@ -0,0 +1,94 @@
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ARTIFACT_CACHE_DIR = os.getenv("ARTIFACT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "instant3d_artifacts"))
+ARTIFACT_CACHE_TTL_SECONDS = float(os.getenv("ARTIFACT_CACHE_TTL_SECONDS", "1800"))
+ARTIFACT_CACHE_MAX_BYTES = int(float(os.getenv("ARTIFACT_CACHE_MAX_MB", "512")) * 1024 * 1024)
+
+class ArtifactCache:
+    """
+    Caché local en disco de archivos recientes indexada por su URL de Storage.
+    Los archivos expiran por TTL y, al superar el tamaño máximo, se borran los
+    usados hace más tiempo (el mtime se actualiza en cada acierto).
+    """
+    def __init__(self, directory: str = ARTIFACT_CACHE_DIR, ttl_seconds: float = ARTIFACT_CACHE_TTL_SECONDS,
+                 max_bytes: int = ARTIFACT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path_for(self, url: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(url.encode("utf-8")).hexdigest())
+
+    def put(self, url: str, source_path: str):
+        """Guarda una copia de `source_path`; el llamador conserva el original."""
+        if not url:
+            return
+        destination = self._path_for(url)
+        partial_path = f"{destination}.{uuid.uuid4().hex}.part"
+        try:
+            shutil.copyfile(source_path, partial_path)
+            os.replace(partial_path, destination)
+        except OSError as e:
+            logging.warning(f"No se pudo guardar {url} en la caché local de artefactos: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            return
+        self._evict()
+
+    def fetch_into(self, url: str, destination_path: str) -> bool:
+        """
+        Copia el artefacto cacheado a `destination_path`. Devuelve False si no está
+        o ha expirado. Se copia para que una expulsión no afecte al trabajo en curso.
+        """
+        if not url:
+            return False
+        cached_path = self._path_for(url)
+        try:
+            if time.time() - os.path.getmtime(cached_path) > self.ttl_seconds:
+                return False
+            shutil.copyfile(cached_path, destination_path)
+            os.utime(cached_path)
+            return True
+        except OSError:
+            return False
+
+    def _evict(self):
+        with self._lock:
+            entries = []
+            now = time.time()
+            for entry in os.scandir(self.directory):
+                if not entry.is_file() or entry.name.endswith(".part"):
+                    continue
+                stat = entry.stat()
+                if now - stat.st_mtime > self.ttl_seconds:
+                    self._remove(entry.path)
+                else:
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+            total = sum(size for _, size, _ in entries)
+            for _, size, path in sorted(entries):
+                if total <= self.max_bytes:
+                    break
+                self._remove(path)
+                total -= size
+
+    @staticmethod
+    def _remove(path: str):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+artifact_cache = ArtifactCache()
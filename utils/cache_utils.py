@@ -0,0 +1,257 @@
+import copy
+import datetime
+import json
+import os
+import threading
+import time
+import logging
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable
+from dotenv import load_dotenv
+
+load_dotenv()
+
+CACHE_BACKEND = os.getenv("CACHE_BACKEND", "memory")
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "5000"))
+CACHE_TTL_SECONDS = float(os.getenv("CACHE_TTL_SECONDS", "300"))
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_PREFIX = "instant3d:"
+
+MISSING = object()
+
+def _json_default(value: Any):
+    # Los documentos de Firestore pueden contener fechas; se etiquetan para recuperarlas.
+    if isinstance(value, datetime.datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Valor no serializable en la caché: {type(value).__name__}")
+
+def _json_object_hook(value: dict):
+    if set(value) == {"__datetime__"}:
+        return datetime.datetime.fromisoformat(value["__datetime__"])
+    return value
+
+def dumps(value: Any) -> bytes:
+    return json.dumps(value, default=_json_default, separators=(",", ":")).encode("utf-8")
+
+def loads(raw: bytes) -> Any:
+    return json.loads(raw, object_hook=_json_object_hook)
+
+def _namespace(key: str) -> str:
+    return key.split(":", 1)[0]
+
+class _CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(lambda: {"hits": 0, "misses": 0, "invalidations": 0})
+
+    def record(self, key: str, counter: str, amount: int = 1):
+        with self._lock:
+            self._counters[_namespace(key)][counter] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            namespaces = {name: dict(values) for name, values in self._counters.items()}
+        hits = sum(v["hits"] for v in namespaces.values())
+        misses = sum(v["misses"] for v in namespaces.values())
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": round(hits / (hits + misses), 4) if hits + misses else 0.0,
+            "namespaces": namespaces,
+        }
+
+class MemoryCache:
+    """
+    Caché LRU en memoria del proceso con expiración por TTL.
+    Es seguro usarla desde los hilos del executor. Guarda y devuelve copias para
+    que quien modifique un valor leído no altere la entrada cacheada.
+    """
+    backend = "memory"
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl_seconds: float = CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = _CacheStats()
+        self.evictions = 0
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self.stats.record(key, "hits")
+                    return copy.deepcopy(value)
+                del self._entries[key]
+        self.stats.record(key, "misses")
+        return MISSING
+
+    def set(self, key: str, value: Any):
+        value = copy.deepcopy(value)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str):
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+        if removed:
+            self.stats.record(key, "invalidations")
+
+    def delete_prefix(self, prefix: str):
+        with self._lock:
+            keys = [key for key in self._entries if key.startswith(prefix)]
+            for key in keys:
+                del self._entries[key]
+        if keys:
+            self.stats.record(prefix, "invalidations", len(keys))
+
+    def info(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        return {
+            "backend": self.backend,
+            "size": size,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+            "evictions": self.evictions,
+            **self.stats.snapshot(),
+        }
+
+class RedisCache:
+    """
+    Backend compartido entre procesos. Los valores se serializan en JSON (con las
+    fechas etiquetadas), nunca con pickle: un valor leído de Redis no puede
+    ejecutar código al deserializarse.
+    """
+    backend = "redis"
+
+    def __init__(self, url: str, ttl_seconds: float = CACHE_TTL_SECONDS):
+        import redis
+
+        self.ttl_seconds = ttl_seconds
+        self._client = redis.Redis.from_url(url)
+        self.stats = _CacheStats()
+
+    def get(self, key: str) -> Any:
+        try:
+            raw = self._client.get(REDIS_KEY_PREFIX + key)
+        except Exception as e:
+            logging.warning(f"Error al leer la caché Redis para {key}: {e}")
+            raw = None
+        if raw is None:
+            self.stats.record(key, "misses")
+            return MISSING
+        try:
+            value = loads(raw)
+        except ValueError as e:
+            logging.warning(f"Valor ilegible en la caché Redis para {key}: {e}")
+            self.stats.record(key, "misses")
+            return MISSING
+        self.stats.record(key, "hits")
+        return value
+
+    def set(self, key: str, value: Any):
+        try:
+            self._client.set(REDIS_KEY_PREFIX + key, dumps(value), px=int(self.ttl_seconds * 1000))
+        except Exception as e:
+            logging.warning(f"Error al escribir en la caché Redis para {key}: {e}")
+
+    def delete(self, key: str):
+        try:
+            if self._client.delete(REDIS_KEY_PREFIX + key):
+                self.stats.record(key, "invalidations")
+        except Exception as e:
+            logging.warning(f"Error al invalidar la caché Redis para {key}: {e}")
+
+    def delete_prefix(self, prefix: str):
+        try:
+            keys = list(self._client.scan_iter(match=f"{REDIS_KEY_PREFIX}{prefix}*"))
+            if keys:
+                self._client.delete(*keys)
+                self.stats.record(prefix, "invalidations", len(keys))
+        except Exception as e:
+            logging.warning(f"Error al invalidar la caché Redis con prefijo {prefix}: {e}")
+
+    def info(self) -> dict:
+        return {"backend": self.backend, "ttl_seconds": self.ttl_seconds, **self.stats.snapshot()}
+
+def _create_cache():
+    if CACHE_BACKEND == "redis":
+        if not REDIS_URL:
+            logging.warning("CACHE_BACKEND=redis pero no se configuró REDIS_URL. Se usará la caché en memoria.")
+        else:
+            try:
+                return RedisCache(REDIS_URL)
+            except ImportError:
+                logging.warning("El paquete 'redis' no está instalado. Se usará la caché en memoria.")
+    return MemoryCache()
+
+cache = _create_cache()
+
+# Contador de invalidaciones por clave y por prefijo (terminado en ":"). Un valor
+# cargado solo se guarda si nadie ha invalidado su clave mientras se leía de
+# Firestore; si no, una lectura anterior a una escritura quedaría en caché todo
+# el TTL. Los contadores son del proceso: con Redis no cubren otras réplicas.
+_invalidations = defaultdict(int)
+_invalidations_lock = threading.Lock()
+
+def _scopes(key: str):
+    for index, char in enumerate(key):
+        if char == ":":
+            yield key[:index + 1]
+    yield key
+
+def invalidation_version(key: str) -> int:
+    with _invalidations_lock:
+        return sum(_invalidations.get(scope, 0) for scope in _scopes(key))
+
+def set_if_current(key: str, value: Any, version: int):
+    with _invalidations_lock:
+        if sum(_invalidations.get(scope, 0) for scope in _scopes(key)) != version:
+            return
+        cache.set(key, value)
+
+def invalidate_key(key: str):
+    with _invalidations_lock:
+        _invalidations[key] += 1
+        cache.delete(key)
+
+def invalidate_prefix(prefix: str):
+    with _invalidations_lock:
+        _invalidations[prefix] += 1
+        cache.delete_prefix(prefix)
+
+def get_or_load(key: str, loader: Callable[[], Any]) -> Any:
+    value = cache.get(key)
+    if value is MISSING:
+        version = invalidation_version(key)
+        value = loader()
+        set_if_current(key, value, version)
+    return value
+
+def user_key(user_uid: str) -> str:
+    return f"user:{user_uid}"
+
+def generations_prefix(user_uid: str, collection_name: str) -> str:
+    return f"generations:{user_uid}:{collection_name}:"
+
+def gallery_prefix(user_uid: str) -> str:
+    return f"gallery:{user_uid}:"
+
+def invalidate_user(user_uid: str):
+    invalidate_key(user_key(user_uid))
+
+def invalidate_all_generations(user_uid: str):
+    invalidate_prefix(f"generations:{user_uid}:")
+    invalidate_prefix(gallery_prefix(user_uid))
+
+def invalidate_generations(user_uid: str, collection_name: str):
+    invalidate_prefix(generations_prefix(user_uid, collection_name))
+    invalidate_prefix(gallery_prefix(user_uid))
@@ -0,0 +1,58 @@
+import asyncio
+import logging
+from functools import partial
+from typing import Callable, Iterable
+from utils.storage_utils import delete_pending_blobs, mark_pending_cleanup
+
+CLEANUP_MAX_ATTEMPTS = 3
+CLEANUP_RETRY_DELAY_SECONDS = 30
+
+cleanup_queue: asyncio.Queue = asyncio.Queue()
+_loop = None
+# Referencias a los reintentos programados para que no se recojan antes de tiempo.
+_retry_tasks = set()
+
+def schedule_cleanup(task: Callable[[], object], description: str):
+    """
+    Encola una tarea de limpieza bloqueante (se ejecuta en el executor). Puede
+    llamarse desde el event loop o desde un hilo del executor.
+    """
+    if _loop is None:
+        # Sin worker de limpieza (p. ej. en scripts) se ejecuta en el momento.
+        task()
+        return
+    _loop.call_soon_threadsafe(cleanup_queue.put_nowait, (task, description, 1))
+
+def schedule_blob_cleanup(blob_paths: Iterable[str]):
+    paths = list(blob_paths)
+    if paths:
+        # Una subida posterior del mismo contenido (upload_immutable) cancela el borrado.
+        mark_pending_cleanup(paths)
+        schedule_cleanup(partial(delete_pending_blobs, paths), f"borrado de {len(paths)} archivos de Storage")
+
+async def _retry_later(task: Callable[[], object], description: str, attempt: int):
+    await asyncio.sleep(CLEANUP_RETRY_DELAY_SECONDS)
+    cleanup_queue.put_nowait((task, description, attempt))
+
+async def cleanup_worker():
+    global _loop
+    _loop = asyncio.get_running_loop()
+    logging.info("Worker de limpieza de Storage iniciado.")
+    try:
+        while True:
+            task, description, attempt = await cleanup_queue.get()
+            try:
+                await _loop.run_in_executor(None, task)
+                logging.info(f"Limpieza diferida completada: {description}.")
+            except Exception as e:
+                if attempt < CLEANUP_MAX_ATTEMPTS:
+                    logging.warning(f"Error en la limpieza diferida '{description}' (intento {attempt}), se reintentará: {e}")
+                    retry = asyncio.create_task(_retry_later(task, description, attempt + 1))
+                    _retry_tasks.add(retry)
+                    retry.add_done_callback(_retry_tasks.discard)
+                else:
+                    logging.error(f"No se pudo completar la limpieza '{description}' tras {attempt} intentos: {e}")
+            finally:
+                cleanup_queue.task_done()
+    finally:
+        _loop = None
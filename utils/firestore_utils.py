@@ -0,0 +1,46 @@
+from config.firebase_config import db
+from typing import Callable, Optional
+import logging
+
+# Límite de operaciones por WriteBatch en Firestore.
+WRITE_BATCH_SIZE = 500
+
+def delete_collection(collection_ref, progress_callback: Optional[Callable[[int], None]] = None) -> int:
+    deleted = 0
+    batch = db.batch()
+    pending = 0
+
+    # list_documents no lee el contenido de los documentos, solo sus referencias.
+    for doc_ref in collection_ref.list_documents(page_size=WRITE_BATCH_SIZE):
+        batch.delete(doc_ref)
+        pending += 1
+        if pending == WRITE_BATCH_SIZE:
+            batch.commit()
+            deleted += pending
+            batch, pending = db.batch(), 0
+            if progress_callback:
+                progress_callback(deleted)
+
+    if pending:
+        batch.commit()
+        deleted += pending
+        if progress_callback:
+            progress_callback(deleted)
+
+    return deleted
+
+def delete_document_recursive(doc_ref, progress_callback: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Elimina todas las subcolecciones de `doc_ref` (predictions/{uid}/*) y luego el
+    propio documento, que normalmente no existe y solo actúa como contenedor.
+    """
+    deleted = 0
+    for collection_ref in doc_ref.collections():
+        deleted += delete_collection(
+            collection_ref,
+            (lambda count, base=deleted: progress_callback(base + count)) if progress_callback else None
+        )
+        logging.info(f"Subcolección {collection_ref.id} eliminada de {doc_ref.path}.")
+
+    doc_ref.delete()
+    return deleted
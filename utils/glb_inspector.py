@@ -0,0 +1,151 @@
+"""
+Lectura de estadísticas de un GLB sin cargar sus buffers binarios: solo se lee
+la cabecera, el chunk JSON y, para las texturas embebidas, los primeros bytes de
+cada imagen.
+"""
+import json
+import os
+import struct
+from typing import BinaryIO, Optional, Tuple
+
+GLB_MAGIC = b"glTF"
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+# Modos de primitiva de glTF.
+MODE_TRIANGLES = 4
+MODE_TRIANGLE_STRIP = 5
+MODE_TRIANGLE_FAN = 6
+
+IMAGE_HEADER_BYTES = 64 * 1024
+
+def _read_exact(f: BinaryIO, size: int) -> bytes:
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError("El archivo GLB está truncado.")
+    return data
+
+def _jpeg_size(data: bytes) -> Optional[Tuple[int, int]]:
+    offset = 2
+    while offset + 9 <= len(data):
+        if data[offset] != 0xFF:
+            offset += 1
+            continue
+        marker = data[offset + 1]
+        if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+            offset += 2
+            continue
+        (segment_length,) = struct.unpack(">H", data[offset + 2:offset + 4])
+        # SOF0..SOF15 salvo DHT (C4), JPG (C8) y DAC (CC).
+        if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            height, width = struct.unpack(">HH", data[offset + 5:offset + 9])
+            return width, height
+        offset += 2 + segment_length
+    return None
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        return struct.unpack(">II", data[16:24])
+    if data.startswith(b"\xff\xd8"):
+        return _jpeg_size(data)
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8X":
+            return int.from_bytes(data[24:27], "little") + 1, int.from_bytes(data[27:30], "little") + 1
+    return None
+
+def _primitive_triangles(primitive: dict, accessors: list) -> int:
+    mode = primitive.get("mode", MODE_TRIANGLES)
+    if "indices" in primitive:
+        count = accessors[primitive["indices"]]["count"]
+    else:
+        count = accessors[primitive["attributes"]["POSITION"]]["count"]
+
+    if mode == MODE_TRIANGLES:
+        return count // 3
+    if mode in (MODE_TRIANGLE_STRIP, MODE_TRIANGLE_FAN):
+        return max(count - 2, 0)
+    return 0
+
+def inspect_glb(glb_path: str) -> dict:
+    """
+    Devuelve recuento de vértices y triángulos, caja envolvente (en coordenadas
+    de la malla, sin aplicar las transformaciones de los nodos), tamaño de las
+    texturas y del archivo.
+    """
+    file_size = os.path.getsize(glb_path)
+    with open(glb_path, "rb") as f:
+        magic, version, _ = struct.unpack("<4sII", _read_exact(f, 12))
+        if magic != GLB_MAGIC:
+            raise ValueError("El archivo no es un GLB válido.")
+
+        json_length, chunk_type = struct.unpack("<II", _read_exact(f, 8))
+        if chunk_type != CHUNK_JSON:
+            raise ValueError("El primer chunk del GLB no es JSON.")
+        gltf = json.loads(_read_exact(f, json_length))
+
+        bin_offset = None
+        if 20 + json_length + 8 <= file_size:
+            _, chunk_type = struct.unpack("<II", _read_exact(f, 8))
+            if chunk_type == CHUNK_BIN:
+                bin_offset = 20 + json_length + 8
+
+        accessors = gltf.get("accessors", [])
+        position_accessors = set()
+        triangle_count = 0
+        primitive_count = 0
+        bbox_min = [float("inf")] * 3
+        bbox_max = [float("-inf")] * 3
+
+        for mesh in gltf.get("meshes", []):
+            for primitive in mesh.get("primitives", []):
+                position = primitive.get("attributes", {}).get("POSITION")
+                if position is None:
+                    continue
+                primitive_count += 1
+                triangle_count += _primitive_triangles(primitive, accessors)
+                position_accessors.add(position)
+
+                accessor = accessors[position]
+                if "min" in accessor and "max" in accessor:
+                    bbox_min = [min(a, b) for a, b in zip(bbox_min, accessor["min"])]
+                    bbox_max = [max(a, b) for a, b in zip(bbox_max, accessor["max"])]
+
+        vertex_count = sum(accessors[index]["count"] for index in position_accessors)
+
+        buffer_views = gltf.get("bufferViews", [])
+        textures = []
+        for image in gltf.get("images", []):
+            entry = {"mime_type": image.get("mimeType"), "width": None, "height": None, "size": None}
+            view_index = image.get("bufferView")
+            if view_index is not None and bin_offset is not None:
+                view = buffer_views[view_index]
+                entry["size"] = view["byteLength"]
+                f.seek(bin_offset + view.get("byteOffset", 0))
+                dimensions = image_size(f.read(min(view["byteLength"], IMAGE_HEADER_BYTES)))
+                if dimensions:
+                    entry["width"], entry["height"] = dimensions
+            textures.append(entry)
+
+    has_bbox = bbox_min[0] != float("inf")
+    bbox = {"min": bbox_min, "max": bbox_max} if has_bbox else None
+    degenerate = triangle_count == 0 or not has_bbox or any(hi - lo <= 0 for lo, hi in zip(bbox_min, bbox_max))
+
+    return {
+        "file_size": file_size,
+        "gltf_version": version,
+        "mesh_count": len(gltf.get("meshes", [])),
+        "primitive_count": primitive_count,
+        "material_count": len(gltf.get("materials", [])),
+        "vertex_count": vertex_count,
+        "triangle_count": triangle_count,
+        "bbox": bbox,
+        "textures": textures,
+        "degenerate": degenerate,
+    }
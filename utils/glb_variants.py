@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import shutil
+from typing import List
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GLB_VARIANTS_ENABLED = os.getenv("GLB_VARIANTS_ENABLED", "true").lower() == "true"
+GLTF_TRANSFORM_BIN = os.getenv("GLTF_TRANSFORM_BIN", "gltf-transform")
+GLB_VARIANT_TIMEOUT_SECONDS = float(os.getenv("GLB_VARIANT_TIMEOUT_SECONDS", "180"))
+# Procesos de optimización simultáneos en todo el servidor.
+GLB_VARIANT_CONCURRENCY = int(os.getenv("GLB_VARIANT_CONCURRENCY", "2"))
+
+# Variantes que se generan a partir del GLB original con `gltf-transform optimize`.
+# Las de compresión conservan la geometría; los LOD simplifican la malla y reducen
+# las texturas para visores móviles.
+GLB_VARIANTS = [
+    {
+        "variant": "draco",
+        "args": ["--compress", "draco", "--texture-compress", "webp", "--simplify", "false"],
+    },
+    {
+        "variant": "meshopt",
+        "args": ["--compress", "meshopt", "--texture-compress", "webp", "--simplify", "false"],
+    },
+    {
+        "variant": "lod1",
+        "args": ["--compress", "meshopt", "--texture-compress", "webp", "--texture-size", "512",
+                 "--simplify-ratio", "0.5", "--simplify-error", "0.01"],
+    },
+    {
+        "variant": "lod2",
+        "args": ["--compress", "meshopt", "--texture-compress", "webp", "--texture-size", "256",
+                 "--simplify-ratio", "0.2", "--simplify-error", "0.02"],
+    },
+]
+
+_semaphore = asyncio.Semaphore(GLB_VARIANT_CONCURRENCY)
+
+def glb_variants_available() -> bool:
+    return GLB_VARIANTS_ENABLED and shutil.which(GLTF_TRANSFORM_BIN) is not None
+
+def check_gltf_transform():
+    """
+    Se llama al arrancar. Sin la CLI solo se publica el GLB original; se avisa una
+    vez aquí en lugar de en cada generación.
+    """
+    if GLB_VARIANTS_ENABLED and shutil.which(GLTF_TRANSFORM_BIN) is None:
+        logging.warning(
+            f"No se encontró '{GLTF_TRANSFORM_BIN}': no se generarán variantes de los GLB. Instala la CLI con "
+            "`npm install -g @gltf-transform/cli@4` o desactívalas con GLB_VARIANTS_ENABLED=false."
+        )
+
+async def _run_variant(tool: str, glb_path: str, output_path: str, args: List[str]) -> bool:
+    async with _semaphore:
+        process = await asyncio.create_subprocess_exec(
+            tool, "optimize", glb_path, output_path, *args,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=GLB_VARIANT_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+
+    if process.returncode != 0:
+        logging.warning(f"gltf-transform falló para {output_path}: {stderr.decode(errors='replace')[-500:]}")
+        return False
+    return os.path.exists(output_path)
+
+async def build_glb_variants(glb_path: str, output_dir: str) -> List[dict]:
+    """
+    Genera en `output_dir` las variantes de GLB_VARIANTS en subprocesos, fuera del
+    event loop. Devuelve [{"variant", "path", "size"}] solo con las que se han
+    generado y son más pequeñas que el original.
+    """
+    if not GLB_VARIANTS_ENABLED:
+        return []
+    tool = shutil.which(GLTF_TRANSFORM_BIN)
+    if tool is None:
+        logging.warning(f"No se encontró '{GLTF_TRANSFORM_BIN}'; no se generan variantes de {glb_path}.")
+        return []
+
+    original_size = os.path.getsize(glb_path)
+    outputs = [os.path.join(output_dir, f"model.{spec['variant']}.glb") for spec in GLB_VARIANTS]
+    results = await asyncio.gather(
+        *(_run_variant(tool, glb_path, output, spec["args"]) for spec, output in zip(GLB_VARIANTS, outputs)),
+        return_exceptions=True,
+    )
+
+    variants = []
+    for spec, output, result in zip(GLB_VARIANTS, outputs, results):
+        if isinstance(result, Exception):
+            logging.warning(f"No se pudo generar la variante {spec['variant']} de {glb_path}: {result!r}")
+            continue
+        if not result:
+            continue
+        size = os.path.getsize(output)
+        if size < original_size:
+            variants.append({"variant": spec["variant"], "path": output, "size": size})
+    return variants
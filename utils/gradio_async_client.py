@@ -0,0 +1,351 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import uuid
+from contextlib import aclosing
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Optional
+from urllib.parse import urljoin
+import httpx
+from dotenv import load_dotenv
+from utils.http_client import _http2_available
+from utils.scratch import current_workspace
+
+load_dotenv()
+
+# Cada predicción mantiene abierto un stream SSE durante minutos; el límite es mucho
+# mayor que el del cliente HTTP general.
+GRADIO_MAX_CONNECTIONS = int(os.getenv("GRADIO_MAX_CONNECTIONS", "1000"))
+# Gradio envía un heartbeat cada ~15 s; sin datos durante este tiempo el stream se da por muerto.
+GRADIO_STREAM_READ_TIMEOUT_SECONDS = float(os.getenv("GRADIO_STREAM_READ_TIMEOUT_SECONDS", "120"))
+GRADIO_CANCEL_TIMEOUT_SECONDS = 5.0
+# Streams seguidos que el Space cierra sin mensajes para los eventos pendientes.
+GRADIO_EMPTY_STREAM_RETRIES = 3
+
+SUPPORTED_PROTOCOLS = {"sse_v1", "sse_v2", "sse_v2.1", "sse_v3"}
+# Respuestas de queue/join que no indican un rechazo de los datos enviados.
+NON_SCHEMA_JOIN_STATUSES = {401, 403, 429}
+# Errores con los que Gradio rechaza un número de entradas que no coincide con el endpoint.
+_ARITY_ERROR = re.compile(r"input values|needed: \d+, got: \d+", re.IGNORECASE)
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+
+_space_client: Optional[httpx.AsyncClient] = None
+
+class SpaceError(RuntimeError):
+    """El Space terminó la predicción con un error."""
+
+class SpaceSchemaError(SpaceError, ValueError):
+    """Los datos no encajan con el endpoint: el esquema en caché puede estar obsoleto."""
+
+def get_space_http_client() -> httpx.AsyncClient:
+    global _space_client
+    if _space_client is None or _space_client.is_closed:
+        _space_client = httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(max_connections=GRADIO_MAX_CONNECTIONS, max_keepalive_connections=100),
+            timeout=httpx.Timeout(60.0, connect=10.0),
+            follow_redirects=True,
+        )
+    return _space_client
+
+async def close_space_http_client():
+    global _space_client
+    if _space_client is not None:
+        await _space_client.aclose()
+        _space_client = None
+
+def _is_local_file(value: Any) -> bool:
+    # Lo que devuelve gradio_client.handle_file() para una ruta local.
+    return (
+        isinstance(value, dict)
+        and value.get("meta", {}).get("_type") == "gradio.FileData"
+        and not value.get("url")
+        and isinstance(value.get("path"), str)
+        and os.path.exists(value["path"])
+    )
+
+def _is_remote_file(value: Any) -> bool:
+    return isinstance(value, dict) and isinstance(value.get("path"), str) and isinstance(value.get("url"), str)
+
+async def _traverse(value: Any, predicate: Callable[[Any], bool], transform: Callable[[Any], Any]) -> Any:
+    if predicate(value):
+        return await transform(value)
+    if isinstance(value, dict):
+        return {key: await _traverse(item, predicate, transform) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [await _traverse(item, predicate, transform) for item in value]
+    return value
+
+class AsyncSpaceClient:
+    """
+    Cliente de un Space de Gradio que habla directamente el protocolo de cola
+    (queue/join + stream SSE en queue/data) sobre httpx. Una predicción en curso
+    no ocupa ningún hilo; si la tarea se cancela, se cancela también en el Space.
+    La interfaz de `predict` imita la de gradio_client: parámetros por nombre,
+    archivos con handle_file() y archivos de salida devueltos como rutas locales.
+    """
+    def __init__(self, src: str, config: Dict[str, Any], api_info: Dict[str, Any],
+                 headers: Optional[Dict[str, str]] = None, download_dir: Optional[str] = None,
+                 refresh_schema: Optional[Callable[[], Awaitable[Dict[str, Any]]]] = None):
+        self.src = src if src.endswith("/") else f"{src}/"
+        self.headers = headers or {}
+        self.download_dir = download_dir
+        self.session_hash = uuid.uuid4().hex
+        self._refresh_schema = refresh_schema
+        self._set_schema(config, api_info)
+        # Gradio entrega los mensajes de toda la sesión por un único stream: un solo
+        # lector los reparte por event_id entre las predicciones en curso.
+        self._event_queues: Dict[str, asyncio.Queue] = {}
+        self._unclaimed: Dict[str, list] = {}
+        self._reader: Optional[asyncio.Task] = None
+
+    def _set_schema(self, config: Dict[str, Any], api_info: Dict[str, Any]):
+        self.config = config
+        self.api_info = api_info
+        self.api_prefix = config.get("api_prefix", "").strip("/")
+        self._components = {component["id"]: component for component in config.get("components", [])}
+
+    def _url(self, path: str) -> str:
+        return urljoin(self.src, f"{self.api_prefix}/{path}" if self.api_prefix else path)
+
+    def _endpoint(self, api_name: str):
+        name = api_name.lstrip("/")
+        for index, dependency in enumerate(self.config.get("dependencies", [])):
+            if dependency.get("api_name") == name:
+                parameters = self.api_info.get("named_endpoints", {}).get(f"/{name}", {}).get("parameters", [])
+                return dependency.get("id", index), dependency, parameters
+        raise SpaceSchemaError(f"El Space no tiene ningún endpoint con api_name '{api_name}'.")
+
+    def _is_state(self, component_id: int) -> bool:
+        return self._components.get(component_id, {}).get("type") == "state"
+
+    def _build_data(self, dependency: dict, parameters: list, args: tuple, kwargs: dict) -> list:
+        values = list(args)
+        for parameter in parameters[len(args):]:
+            name = parameter.get("parameter_name")
+            if name in kwargs:
+                values.append(kwargs.pop(name))
+            elif parameter.get("parameter_has_default"):
+                values.append(parameter.get("parameter_default"))
+            else:
+                raise SpaceSchemaError(f"Falta el parámetro '{name}'.")
+        if kwargs:
+            raise SpaceSchemaError(f"Parámetros no reconocidos: {', '.join(kwargs)}")
+
+        # Los componentes State no aparecen en la API pero ocupan su posición en los datos.
+        data = []
+        remaining = iter(values)
+        for component_id in dependency.get("inputs", []):
+            data.append(None if self._is_state(component_id) else next(remaining, None))
+        return data
+
+    async def _upload(self, file_data: dict) -> dict:
+        path = file_data["path"]
+        name = file_data.get("orig_name") or os.path.basename(path)
+        with open(path, "rb") as f:
+            response = await get_space_http_client().post(
+                self._url("upload"), headers=self.headers, files=[("files", (name, f))],
+                timeout=httpx.Timeout(None, connect=10.0),
+            )
+        response.raise_for_status()
+        return {**file_data, "path": response.json()[0], "orig_name": name, "meta": {"_type": "gradio.FileData"}}
+
+    async def _download(self, file_data: dict) -> str:
+        url = urljoin(self.src, file_data["url"])
+        name = os.path.basename(file_data.get("orig_name") or file_data["path"]) or "output"
+        # Sin directorio explícito, las salidas van al scratch del trabajo en curso.
+        destination_dir = os.path.join(self.download_dir or current_workspace(), uuid.uuid4().hex)
+        os.makedirs(destination_dir, exist_ok=True)
+        destination = os.path.join(destination_dir, name)
+        async with get_space_http_client().stream("GET", url, headers=self.headers) as response:
+            response.raise_for_status()
+            with open(destination, "wb") as f:
+                async for chunk in response.aiter_bytes(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+        return destination
+
+    async def _cancel(self, fn_index: int, event_id: str):
+        try:
+            await get_space_http_client().post(
+                self._url("cancel"),
+                headers=self.headers,
+                json={"session_hash": self.session_hash, "fn_index": fn_index, "event_id": event_id},
+                timeout=GRADIO_CANCEL_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            logging.warning(f"No se pudo cancelar el evento {event_id} en {self.src}: {e}")
+
+    async def submit(self, *args, api_name: str, **kwargs) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Encola la predicción y va devolviendo los mensajes del Space (estimation,
+        progress, process_starts...). El último es process_completed con la salida.
+        """
+        fn_index, dependency, parameters = self._endpoint(api_name)
+        data = self._build_data(dependency, parameters, args, dict(kwargs))
+        data = await _traverse(data, _is_local_file, self._upload)
+
+        targets = dependency.get("targets") or []
+        response = await get_space_http_client().post(
+            self._url("queue/join"),
+            headers=self.headers,
+            json={
+                "data": data,
+                "event_data": None,
+                "fn_index": fn_index,
+                "trigger_id": targets[0][0] if targets and isinstance(targets[0], (list, tuple)) else None,
+                "session_hash": self.session_hash,
+            },
+        )
+        if response.status_code == 503:
+            raise SpaceError(f"La cola del Space está llena ({api_name}).")
+        if 400 <= response.status_code < 500 and response.status_code not in NON_SCHEMA_JOIN_STATUSES:
+            raise SpaceSchemaError(f"El Space rechazó la petición a {api_name} (HTTP {response.status_code}): {response.text[:200]}")
+        response.raise_for_status()
+        event_id = response.json()["event_id"]
+
+        queue = self._register_event(event_id)
+        completed = False
+        try:
+            while True:
+                message = await queue.get()
+                if isinstance(message, Exception):
+                    raise message
+                if message.get("msg") == "process_completed":
+                    completed = True
+                    yield message
+                    return
+                yield message
+        finally:
+            self._event_queues.pop(event_id, None)
+            if not completed:
+                await asyncio.shield(self._cancel(fn_index, event_id))
+
+    def _register_event(self, event_id: str) -> asyncio.Queue:
+        queue = asyncio.Queue()
+        # Mensajes que llegaron por el stream antes de que queue/join respondiera.
+        for message in self._unclaimed.pop(event_id, []):
+            queue.put_nowait(message)
+        self._event_queues[event_id] = queue
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.create_task(self._read_messages())
+        return queue
+
+    def _fail_pending(self, error: Exception):
+        for queue in self._event_queues.values():
+            queue.put_nowait(error)
+
+    async def _read_messages(self):
+        """
+        Lee el stream de la sesión mientras haya predicciones en curso. Si el Space
+        lo cierra con eventos pendientes se vuelve a abrir; tras varios streams
+        seguidos sin mensajes para ellos se dan por perdidos.
+        """
+        empty_streams = 0
+        try:
+            while self._event_queues:
+                if await self._read_stream():
+                    empty_streams = 0
+                else:
+                    empty_streams += 1
+                    if empty_streams >= GRADIO_EMPTY_STREAM_RETRIES:
+                        raise SpaceError("El Space cerró el stream sin completar las predicciones.")
+        except Exception as e:
+            self._fail_pending(e)
+
+    async def _read_stream(self) -> bool:
+        delivered = False
+        async with get_space_http_client().stream(
+            "GET",
+            self._url("queue/data"),
+            params={"session_hash": self.session_hash},
+            headers={**self.headers, "Accept": "text/event-stream"},
+            timeout=httpx.Timeout(GRADIO_STREAM_READ_TIMEOUT_SECONDS, connect=10.0),
+        ) as stream:
+            stream.raise_for_status()
+            async for line in stream.aiter_lines():
+                if not line.startswith("data:"):
+                    continue
+                message = json.loads(line[5:])
+                kind = message.get("msg")
+                if kind == "unexpected_error":
+                    raise SpaceError(message.get("message") or "Error inesperado en el Space.")
+                if kind == "close_stream":
+                    break
+                event_id = message.get("event_id")
+                if kind == "heartbeat" or event_id is None:
+                    continue
+                delivered = True
+                queue = self._event_queues.get(event_id)
+                if queue is not None:
+                    queue.put_nowait(message)
+                else:
+                    self._unclaimed.setdefault(event_id, []).append(message)
+        return delivered
+
+    async def predict(self, *args, api_name: str, on_update: Optional[Callable[[Dict[str, Any]], None]] = None, **kwargs):
+        """
+        Si el Space rechaza los datos por no coincidir con el esquema en caché, se
+        descarga el esquema de nuevo y se reintenta una vez.
+        """
+        try:
+            return await self._predict(*args, api_name=api_name, on_update=on_update, **kwargs)
+        except SpaceSchemaError as e:
+            if self._refresh_schema is None:
+                raise
+            logging.warning(f"El esquema de {self.src} no coincide con {api_name} ({e}). Se descarga de nuevo y se reintenta.")
+            try:
+                schema = await self._refresh_schema()
+            except Exception as refresh_error:
+                logging.warning(f"No se pudo volver a descargar el esquema de {self.src}: {refresh_error}")
+                raise e
+            self._set_schema(schema["config"], schema["api_info"])
+        return await self._predict(*args, api_name=api_name, on_update=on_update, **kwargs)
+
+    async def _predict(self, *args, api_name: str, on_update: Optional[Callable[[Dict[str, Any]], None]] = None, **kwargs):
+        _, dependency, _ = self._endpoint(api_name)
+        async with aclosing(self.submit(*args, api_name=api_name, **kwargs)) as messages:
+            async for message in messages:
+                if message.get("msg") != "process_completed":
+                    if on_update:
+                        on_update(message)
+                    continue
+                output = message.get("output") or {}
+                if not message.get("success", True) or "error" in output:
+                    error = output.get("error") or f"El Space devolvió un error en {api_name}."
+                    raise (SpaceSchemaError if _ARITY_ERROR.search(error) else SpaceError)(error)
+
+                outputs = [
+                    value for component_id, value in zip(dependency.get("outputs", []), output.get("data", []))
+                    if not self._is_state(component_id)
+                ]
+                outputs = await _traverse(outputs, _is_remote_file, self._download)
+                if not outputs:
+                    return None
+                return outputs[0] if len(outputs) == 1 else tuple(outputs)
+
+    async def close(self):
+        # El estado vive en el Space por session_hash; solo queda el lector del stream.
+        if self._reader is not None and not self._reader.done():
+            self._reader.cancel()
+            try:
+                await self._reader
+            except asyncio.CancelledError:
+                pass
+        self._fail_pending(SpaceError(f"Cliente de {self.src} cerrado con predicciones en curso."))
+        self._unclaimed.clear()
+
+class ExecutorSpaceClient:
+    """
+    Adaptador con la misma interfaz asíncrona para Spaces con un protocolo de cola
+    que AsyncSpaceClient no implementa: delega en gradio_client desde el executor.
+    """
+    def __init__(self, client):
+        self._client = client
+
+    async def predict(self, *args, api_name: str, on_update=None, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, lambda: self._client.predict(*args, api_name=api_name, **kwargs))
+
+    async def close(self):
+        await asyncio.get_running_loop().run_in_executor(None, self._client.close)
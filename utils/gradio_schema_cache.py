@@ -0,0 +1,138 @@
+import copy
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+GRADIO_SCHEMA_CACHE_DIR = os.getenv(
+    "GRADIO_SCHEMA_CACHE_DIR", os.path.join(tempfile.gettempdir(), "instant3d_gradio_schemas")
+)
+# Pasado este tiempo se sigue usando el esquema guardado, pero se revalida en segundo plano.
+GRADIO_SCHEMA_REVALIDATE_SECONDS = float(os.getenv("GRADIO_SCHEMA_REVALIDATE_SECONDS", "3600"))
+
+def schema_hash(config: Dict[str, Any]) -> str:
+    """
+    Huella de la parte del config que usa el cliente: versión de Gradio,
+    endpoints con sus entradas/salidas y tipos de componente.
+    """
+    relevant = {
+        "version": config.get("version"),
+        "protocol": config.get("protocol"),
+        "dependencies": [
+            [dependency.get("api_name"), dependency.get("inputs"), dependency.get("outputs"), dependency.get("backend_fn")]
+            for dependency in config.get("dependencies", [])
+        ],
+        "components": [[component.get("id"), component.get("type")] for component in config.get("components", [])],
+    }
+    return hashlib.sha256(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+class GradioSchemaCache:
+    """
+    Guarda en memoria y en disco el config y la información de la API de cada
+    Space, indexados por su URL, para construir clientes Gradio sin descargarlos.
+    Cada entrada lleva la huella del esquema, que se comprueba al leerla.
+    """
+    def __init__(self, directory: str = GRADIO_SCHEMA_CACHE_DIR):
+        self.directory = directory
+        self._entries: Dict[str, dict] = {}
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path_for(self, url: str) -> str:
+        return os.path.join(self.directory, f"{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json")
+
+    @staticmethod
+    def _is_valid(url: str, entry: Any) -> bool:
+        return (
+            isinstance(entry, dict)
+            and entry.get("url") == url
+            and isinstance(entry.get("src"), str)
+            and isinstance(entry.get("config"), dict)
+            and entry.get("api_info") is not None
+            and entry.get("schema_hash") == schema_hash(entry["config"])
+        )
+
+    def get(self, url: str) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(url)
+        if entry is not None:
+            return copy.deepcopy(entry)
+
+        path = self._path_for(url)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                entry = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            logging.warning(f"Esquema Gradio en caché ilegible para {url}: {e}")
+            entry = None
+
+        if not self._is_valid(url, entry):
+            logging.warning(f"Esquema Gradio en caché no válido para {url}. Se descartará.")
+            self.invalidate(url)
+            return None
+
+        with self._lock:
+            self._entries[url] = entry
+        return copy.deepcopy(entry)
+
+    def put(self, url: str, src: str, config: Dict[str, Any], api_info: Any):
+        entry = {
+            "url": url,
+            "src": src,
+            "config": config,
+            "api_info": api_info,
+            "schema_hash": schema_hash(config),
+            "fetched_at": time.time(),
+        }
+        with self._lock:
+            previous = self._entries.get(url)
+            self._entries[url] = entry
+        if previous is not None and previous["schema_hash"] != entry["schema_hash"]:
+            logging.info(f"El esquema de la API de {url} ha cambiado; caché actualizada.")
+
+        path = self._path_for(url)
+        partial_path = f"{path}.{uuid.uuid4().hex}.part"
+        try:
+            with open(partial_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, default=str)
+            os.replace(partial_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.warning(f"No se pudo guardar en disco el esquema Gradio de {url}: {e}")
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+
+    def invalidate(self, url: str):
+        with self._lock:
+            self._entries.pop(url, None)
+        try:
+            os.remove(self._path_for(url))
+        except OSError:
+            pass
+
+    def is_stale(self, entry: dict) -> bool:
+        return time.time() - entry["fetched_at"] > GRADIO_SCHEMA_REVALIDATE_SECONDS
+
+    def begin_refresh(self, url: str) -> bool:
+        """Evita lanzar más de una revalidación a la vez por Space."""
+        with self._lock:
+            if url in self._refreshing:
+                return False
+            self._refreshing.add(url)
+            return True
+
+    def end_refresh(self, url: str):
+        with self._lock:
+            self._refreshing.discard(url)
+
+gradio_schema_cache = GradioSchemaCache()
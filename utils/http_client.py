@@ -0,0 +1,56 @@
+import os
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_TIMEOUT_SECONDS = float(os.getenv("HTTP_TIMEOUT_SECONDS", "60"))
+
+_client = None
+_webhook_client = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Cliente HTTP compartido por todo el proceso (HTTP/2 si está instalado `h2`),
+    para reutilizar conexiones en lugar de abrir una por trabajo.
+    """
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=_http2_available(),
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+            follow_redirects=True,
+        )
+    return _client
+
+def get_webhook_http_client() -> httpx.AsyncClient:
+    """
+    Cliente para URLs de terceros (webhooks): no sigue redirecciones y no reutiliza
+    conexiones, porque cada petición se dirige a una IP ya validada con su propio SNI.
+    """
+    global _webhook_client
+    if _webhook_client is None or _webhook_client.is_closed:
+        _webhook_client = httpx.AsyncClient(
+            limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=0),
+            timeout=httpx.Timeout(HTTP_TIMEOUT_SECONDS, connect=10.0),
+            follow_redirects=False,
+        )
+    return _webhook_client
+
+async def close_http_client():
+    global _client, _webhook_client
+    for client in (_client, _webhook_client):
+        if client is not None:
+            await client.aclose()
+    _client = None
+    _webhook_client = None
@@ -0,0 +1,36 @@
+import hashlib
+from typing import Any, Iterable, Optional
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+def compute_etag(parts: Iterable[Any]) -> str:
+    digest = hashlib.sha1()
+    for part in parts:
+        digest.update(str(part).encode("utf-8"))
+        digest.update(b"\x00")
+    return f'W/"{digest.hexdigest()}"'
+
+def snapshots_etag(snapshots: Iterable[Any], *extra: Any) -> str:
+    parts = []
+    for snapshot in snapshots:
+        parts.extend([snapshot.reference.path, snapshot.update_time])
+    return compute_etag([*parts, *extra])
+
+def _strip_weak(tag: str) -> str:
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or _strip_weak(etag) in {_strip_weak(tag) for tag in candidates}
+
+def conditional_response(request: Request, etag: str, payload: Any) -> Response:
+    """
+    Devuelve 304 sin serializar el cuerpo si el cliente ya tiene la versión actual.
+    """
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content=jsonable_encoder(payload), headers=headers)
@@ -0,0 +1,97 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from utils.job_metrics import job_metrics
+
+load_dotenv()
+
+PREPROCESS_ENABLED = os.getenv("IMAGE_PREPROCESS_ENABLED", "true").lower() == "true"
+# Resolución de trabajo de los Spaces: por encima solo se envían bytes que se descartan.
+PREPROCESS_MAX_SIDE = int(os.getenv("IMAGE_PREPROCESS_MAX_SIDE", "1024"))
+PREPROCESS_KEEP_ALPHA = os.getenv("IMAGE_PREPROCESS_KEEP_ALPHA", "true").lower() == "true"
+PREPROCESS_JPEG_QUALITY = int(os.getenv("IMAGE_PREPROCESS_JPEG_QUALITY", "92"))
+PREPROCESS_WORKERS = int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+_pool = None
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        # spawn evita heredar hilos y conexiones abiertas del proceso de la API.
+        _pool = ProcessPoolExecutor(max_workers=PREPROCESS_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+def shutdown_preprocessing_pool():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
+
+def _has_alpha(image) -> bool:
+    if image.mode in ("RGBA", "LA", "PA"):
+        return image.getchannel("A").getextrema()[0] < 255
+    return image.mode == "P" and "transparency" in image.info
+
+def _normalize_image(input_path: str, output_base: str, max_side: int, keep_alpha: bool, jpeg_quality: int) -> str:
+    """
+    Se ejecuta en el pool de procesos: corrige la orientación EXIF, reduce la
+    imagen a `max_side` y la guarda como PNG si conserva un canal alfa útil
+    (máscara ya recortada) o como JPEG en caso contrario.
+    """
+    from PIL import Image, ImageOps
+
+    with Image.open(input_path) as image:
+        original_size = image.size
+        rotated = image.getexif().get(0x0112, 1) != 1
+        # Para JPEG grandes decodifica directamente a una escala reducida.
+        image.draft("RGB", (max_side, max_side))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+        resized = image.size != original_size
+
+        if keep_alpha and _has_alpha(image):
+            output_path = f"{output_base}.png"
+            image.convert("RGBA").save(output_path, format="PNG", optimize=True)
+        else:
+            output_path = f"{output_base}.jpg"
+            image.convert("RGB").save(output_path, format="JPEG", quality=jpeg_quality, optimize=True)
+
+    # Si la imagen no cambió de tamaño ni de orientación y la copia ocupa más,
+    # recodificar no aporta nada: se envía la original.
+    if not resized and not rotated and os.path.getsize(output_path) >= os.path.getsize(input_path):
+        os.remove(output_path)
+        return input_path
+    return output_path
+
+async def preprocess_image(input_path: str, job_type: str, max_side: int = PREPROCESS_MAX_SIDE, keep_alpha: bool = PREPROCESS_KEEP_ALPHA) -> str:
+    """
+    Devuelve la ruta de la imagen normalizada (un archivo nuevo que el llamador
+    debe limpiar) o `input_path` si el preprocesamiento está desactivado, falla o
+    no reduciría la imagen.
+    """
+    if not PREPROCESS_ENABLED:
+        return input_path
+
+    started = time.perf_counter()
+    output_base = f"{os.path.splitext(input_path)[0]}_pre"
+    try:
+        loop = asyncio.get_running_loop()
+        output_path = await loop.run_in_executor(
+            _get_pool(), _normalize_image, input_path, output_base, max_side, keep_alpha, PREPROCESS_JPEG_QUALITY
+        )
+    except Exception as e:
+        logging.warning(f"No se pudo preprocesar la imagen {input_path}, se enviará la original: {e}")
+        return input_path
+
+    bytes_in = os.path.getsize(input_path)
+    bytes_out = os.path.getsize(output_path)
+    job_metrics.record_preprocessing(job_type, bytes_in, bytes_out, time.perf_counter() - started)
+    if output_path == input_path:
+        logging.info(f"Imagen para {job_type} sin cambios tras el preprocesamiento ({bytes_in} bytes); se envía la original.")
+    else:
+        logging.info(f"Imagen preprocesada para {job_type}: {bytes_in} -> {bytes_out} bytes.")
+    return output_path
@@ -0,0 +1,104 @@
+import logging
+import os
+from typing import Iterable
+from config.firebase_config import firestore
+from google.api_core import exceptions as gcloud_exceptions
+from config.firebase_config import db, bucket
+from utils.storage_utils import IMMUTABLE_CACHE_CONTROL, file_sha256, guess_content_type
+
+# Almacén de entradas por usuario direccionado por contenido:
+#   Storage:   users/{uid}/inputs/{sha256}{ext}
+#   Firestore: predictions/{uid}/input_refs/{sha256} -> {path, count, generation}
+# `count` es el número de generaciones que referencian el archivo y `generation`
+# la generación del objeto en GCS, que se usa como precondición al borrarlo para
+# no eliminar una copia que otra generación acaba de volver a subir. El documento
+# solo se crea cuando la subida ha terminado.
+
+INPUT_REFS_COLLECTION = 'input_refs'
+
+def _ref_doc(user_uid: str, sha256: str):
+    return db.collection('predictions').document(user_uid).collection(INPUT_REFS_COLLECTION).document(sha256)
+
+@firestore.transactional
+def _reuse_ref(transaction, ref_doc):
+    # Solo se reutiliza una entrada cuya subida ya terminó (tiene `generation`).
+    snapshot = ref_doc.get(transaction=transaction)
+    if snapshot.exists and snapshot.get("count") > 0 and snapshot.get("generation") is not None:
+        transaction.update(ref_doc, {"count": firestore.Increment(1)})
+        return snapshot.get("path")
+    return None
+
+@firestore.transactional
+def _register_upload(transaction, ref_doc, blob_path: str, generation: int):
+    snapshot = ref_doc.get(transaction=transaction)
+    if snapshot.exists and snapshot.get("count") > 0:
+        path = snapshot.get("path")
+        update = {"count": firestore.Increment(1)}
+        if path == blob_path:
+            # Otra subida concurrente del mismo contenido: la última generación es la vigente.
+            update["generation"] = max(snapshot.get("generation") or 0, generation)
+        transaction.update(ref_doc, update)
+        return path
+    transaction.set(ref_doc, {"path": blob_path, "count": 1, "generation": generation})
+    return blob_path
+
+@firestore.transactional
+def _release_ref(transaction, ref_doc):
+    snapshot = ref_doc.get(transaction=transaction)
+    if not snapshot.exists:
+        return None
+    count = snapshot.get("count") - 1
+    if count > 0:
+        transaction.update(ref_doc, {"count": count})
+        return None
+    transaction.delete(ref_doc)
+    return snapshot.to_dict()
+
+def acquire_input(user_uid: str, file_source: str):
+    """
+    Registra una referencia a la entrada y la sube solo si no estaba ya almacenada.
+    Devuelve (url_pública, ruta_del_blob).
+    """
+    sha256 = file_sha256(file_source)
+    extension = os.path.splitext(file_source)[1].lower() or ".png"
+    ref_doc = _ref_doc(user_uid, sha256)
+
+    blob_path = _reuse_ref(db.transaction(), ref_doc)
+    if blob_path is not None:
+        logging.info(f"La entrada {blob_path} ya está almacenada; se omite la subida.")
+        return bucket.blob(blob_path).public_url, blob_path
+
+    # La referencia se registra después de subir: si la subida falla no queda
+    # ningún documento apuntando a un objeto que no existe.
+    blob_path = f"users/{user_uid}/inputs/{sha256}{extension}"
+    blob = bucket.blob(blob_path)
+    blob.cache_control = IMMUTABLE_CACHE_CONTROL
+    blob.upload_from_filename(file_source, content_type=guess_content_type(blob_path))
+    blob.make_public()
+
+    registered_path = _register_upload(db.transaction(), ref_doc, blob_path, blob.generation)
+    if registered_path != blob_path:
+        # El mismo contenido ya estaba guardado con otra extensión; se descarta la copia.
+        try:
+            blob.delete(if_generation_match=blob.generation)
+        except (gcloud_exceptions.NotFound, gcloud_exceptions.PreconditionFailed):
+            pass
+        return bucket.blob(registered_path).public_url, registered_path
+    return blob.public_url, blob_path
+
+def release_inputs(user_uid: str, blob_paths: Iterable[str]):
+    for blob_path in blob_paths:
+        sha256 = os.path.splitext(os.path.basename(blob_path))[0]
+        released = _release_ref(db.transaction(), _ref_doc(user_uid, sha256))
+        if released is None:
+            continue
+
+        try:
+            generation = released.get("generation")
+            if generation is None:
+                bucket.blob(released["path"]).delete()
+            else:
+                bucket.blob(released["path"]).delete(if_generation_match=generation)
+            logging.info(f"Entrada sin referencias eliminada: {released['path']}")
+        except (gcloud_exceptions.NotFound, gcloud_exceptions.PreconditionFailed):
+            pass
@@ -0,0 +1,42 @@
+import threading
+from collections import defaultdict
+
+class _JobMetrics:
+    """
+    Contadores en memoria por tipo de trabajo: latencia de extremo a extremo en el
+    worker y bytes enviados a los Spaces tras el preprocesamiento local.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._jobs = defaultdict(lambda: {"completed": 0, "failed": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+        self._preprocessing = defaultdict(lambda: {"images": 0, "bytes_in": 0, "bytes_out": 0, "total_seconds": 0.0})
+
+    def record_job(self, job_type: str, succeeded: bool, seconds: float):
+        with self._lock:
+            entry = self._jobs[job_type]
+            entry["completed" if succeeded else "failed"] += 1
+            entry["total_seconds"] += seconds
+            entry["max_seconds"] = max(entry["max_seconds"], seconds)
+
+    def record_preprocessing(self, job_type: str, bytes_in: int, bytes_out: int, seconds: float):
+        with self._lock:
+            entry = self._preprocessing[job_type]
+            entry["images"] += 1
+            entry["bytes_in"] += bytes_in
+            entry["bytes_out"] += bytes_out
+            entry["total_seconds"] += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            jobs = {name: dict(values) for name, values in self._jobs.items()}
+            preprocessing = {name: dict(values) for name, values in self._preprocessing.items()}
+
+        for values in jobs.values():
+            count = values["completed"] + values["failed"]
+            values["avg_seconds"] = round(values["total_seconds"] / count, 3) if count else 0.0
+        for values in preprocessing.values():
+            values["avg_seconds"] = round(values["total_seconds"] / values["images"], 3) if values["images"] else 0.0
+            values["bytes_saved_ratio"] = round(1 - values["bytes_out"] / values["bytes_in"], 4) if values["bytes_in"] else 0.0
+        return {"jobs": jobs, "preprocessing": preprocessing}
+
+job_metrics = _JobMetrics()
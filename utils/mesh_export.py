@@ -0,0 +1,27 @@
+"""
+Exporta un GLB a OBJ (zip con su .mtl y texturas), STL o PLY con trimesh. Se
+ejecuta en un proceso aparte para poder matarlo si una malla no termina:
+
+    python -m utils.mesh_export modelo.glb salida.zip obj
+"""
+import sys
+import zipfile
+
+def export_mesh(glb_path: str, output_path: str, fmt: str):
+    import trimesh
+
+    scene = trimesh.load(glb_path, force="scene")
+    if fmt == "obj":
+        from trimesh.exchange.obj import export_obj
+
+        mesh = scene.to_geometry() if hasattr(scene, "to_geometry") else scene.dump(concatenate=True)
+        obj_text, files = export_obj(mesh, include_texture=True, return_texture=True, mtl_name="model.mtl")
+        with zipfile.ZipFile(output_path, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("model.obj", obj_text)
+            for name, data in files.items():
+                archive.writestr(name, data)
+    else:
+        scene.export(output_path, file_type=fmt)
+
+if __name__ == "__main__":
+    export_mesh(*sys.argv[1:4])
@@ -0,0 +1,225 @@
+import asyncio
+import datetime
+import hashlib
+import logging
+import os
+import shutil
+import sys
+import uuid
+from functools import partial
+from typing import Callable, Dict, Optional
+from dotenv import load_dotenv
+from config.firebase_config import db, bucket
+from utils.storage_utils import upload_immutable, blob_path_from_url, delete_blobs, DOWNLOAD_CHUNK_SIZE
+from utils.firestore_utils import WRITE_BATCH_SIZE
+from utils.scratch import create_job_workspace, release_job_workspace, wait_for_disk_space
+
+load_dotenv()
+
+CONVERSION_CACHE_COLLECTION = "conversion_cache"
+# Conversiones simultáneas; cada una corre en su propio proceso.
+CONVERSION_WORKERS = int(os.getenv("CONVERSION_WORKERS", "2"))
+CONVERSION_TIMEOUT_SECONDS = float(os.getenv("CONVERSION_TIMEOUT_SECONDS", "300"))
+# Política de expulsión: entradas sin uso durante el TTL y, si se supera el tamaño
+# total, las menos usadas recientemente.
+CONVERSION_CACHE_TTL = datetime.timedelta(days=float(os.getenv("CONVERSION_CACHE_TTL_DAYS", "14")))
+CONVERSION_CACHE_MAX_BYTES = int(float(os.getenv("CONVERSION_CACHE_MAX_GB", "20")) * 1024 ** 3)
+CONVERSION_CACHE_SWEEP_SECONDS = float(os.getenv("CONVERSION_CACHE_SWEEP_SECONDS", "3600"))
+# Evita escribir en Firestore en cada acierto de caché.
+CONVERSION_TOUCH_INTERVAL = datetime.timedelta(hours=1)
+USD_FROM_GLTF_BIN = os.getenv("USD_FROM_GLTF_BIN", "usd_from_gltf")
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# formato -> (extensión del artefacto, content type). OBJ se entrega en un zip con
+# su .mtl y texturas.
+CONVERSION_FORMATS = {
+    "obj": ("zip", "application/zip"),
+    "stl": ("stl", "model/stl"),
+    "ply": ("ply", "application/octet-stream"),
+    "usdz": ("usdz", "model/vnd.usdz+zip"),
+}
+
+class ConversionUnavailableError(Exception):
+    pass
+
+_semaphore = asyncio.Semaphore(CONVERSION_WORKERS)
+_inflight: Dict[str, asyncio.Future] = {}
+
+def _conversion_command(glb_path: str, output_path: str, fmt: str) -> list:
+    # trimesh cubre OBJ/STL/PLY; USDZ necesita la herramienta usd_from_gltf.
+    if fmt == "usdz":
+        return [USD_FROM_GLTF_BIN, glb_path, output_path]
+    return [sys.executable, "-m", "utils.mesh_export", glb_path, output_path, fmt]
+
+async def _convert_file(glb_path: str, output_path: str, fmt: str):
+    """
+    Convierte en un subproceso, que se mata si supera CONVERSION_TIMEOUT_SECONDS:
+    una malla patológica no deja ocupado ningún worker para las siguientes.
+    """
+    async with _semaphore:
+        process = await asyncio.create_subprocess_exec(
+            *_conversion_command(glb_path, output_path, fmt),
+            cwd=PROJECT_ROOT,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            _, stderr = await asyncio.wait_for(process.communicate(), timeout=CONVERSION_TIMEOUT_SECONDS)
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            process.kill()
+            await process.wait()
+            raise
+
+    if process.returncode != 0:
+        raise RuntimeError(f"La conversión a {fmt.upper()} falló: {stderr.decode(errors='replace')[-500:]}")
+
+def _cache_key(source_path: str, fmt: str) -> str:
+    # El GLB tiene nombre por contenido, así que la ruta identifica el contenido.
+    return hashlib.sha256(f"{source_path}:{fmt}".encode("utf-8")).hexdigest()[:32]
+
+def _cached_entry(key: str):
+    snapshot = db.collection(CONVERSION_CACHE_COLLECTION).document(key).get()
+    if not snapshot.exists:
+        return None
+    entry = snapshot.to_dict()
+    now = datetime.datetime.now(datetime.timezone.utc)
+    if now - entry["last_access"] > CONVERSION_TOUCH_INTERVAL:
+        snapshot.reference.update({"last_access": now})
+    return entry
+
+def _download_source(source_path: str, destination: str):
+    blob = bucket.blob(source_path)
+    blob.chunk_size = DOWNLOAD_CHUNK_SIZE
+    blob.download_to_filename(destination)
+
+async def _convert_and_cache(user_uid: str, source_path: str, fmt: str, key: str) -> dict:
+    loop = asyncio.get_running_loop()
+    extension, content_type = CONVERSION_FORMATS[fmt]
+    await wait_for_disk_space()
+    work_dir = create_job_workspace(f"conversion_{uuid.uuid4().hex}")
+    try:
+        glb_path = os.path.join(work_dir, "model.glb")
+        output_path = os.path.join(work_dir, f"model.{extension}")
+        await loop.run_in_executor(None, _download_source, source_path, glb_path)
+
+        logging.info(f"Convirtiendo {source_path} a {fmt.upper()}.")
+        await _convert_file(glb_path, output_path, fmt)
+
+        url, path = await loop.run_in_executor(
+            None, upload_immutable, output_path, f"users/{user_uid}/conversions", f"model.{extension}", content_type
+        )
+        now = datetime.datetime.now(datetime.timezone.utc)
+        entry = {
+            "user_uid": user_uid,
+            "source_path": source_path,
+            "format": fmt,
+            "url": url,
+            "path": path,
+            "size": os.path.getsize(output_path),
+            "created_at": now,
+            "last_access": now,
+        }
+        await loop.run_in_executor(None, db.collection(CONVERSION_CACHE_COLLECTION).document(key).set, entry)
+        return entry
+    finally:
+        await release_job_workspace(work_dir)
+
+def _conversion_done(key: str, future: asyncio.Future):
+    _inflight.pop(key, None)
+    # Marca el error como recuperado aunque todos los clientes se hayan ido.
+    if not future.cancelled():
+        future.exception()
+
+async def get_converted_model(user_uid: str, model_url: str, fmt: str) -> dict:
+    """
+    Devuelve {"format", "url", "size"} del modelo convertido. Si la conversión no
+    está en caché se hace una sola vez aunque lleguen varias peticiones a la vez.
+    """
+    if fmt not in CONVERSION_FORMATS:
+        raise ConversionUnavailableError(f"Formato no soportado: {fmt}")
+    if fmt == "usdz" and shutil.which(USD_FROM_GLTF_BIN) is None:
+        raise ConversionUnavailableError("La conversión a USDZ no está disponible en este servidor.")
+
+    source_path = blob_path_from_url(model_url)
+    if source_path is None:
+        raise ValueError("El modelo de la generación no está en el almacenamiento.")
+
+    key = _cache_key(source_path, fmt)
+    loop = asyncio.get_running_loop()
+    entry = await loop.run_in_executor(None, _cached_entry, key)
+
+    if entry is None:
+        future = _inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(_convert_and_cache(user_uid, source_path, fmt, key))
+            _inflight[key] = future
+            future.add_done_callback(partial(_conversion_done, key))
+        # shield: si un cliente se desconecta, la conversión sigue para los demás.
+        entry = await asyncio.shield(future)
+
+    return {"format": fmt.upper(), "url": entry["url"], "size": entry["size"]}
+
+def evict_conversion_cache() -> int:
+    """
+    Borra las conversiones sin uso durante CONVERSION_CACHE_TTL y, después, las
+    menos usadas hasta que el total quede por debajo de CONVERSION_CACHE_MAX_BYTES.
+    """
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - CONVERSION_CACHE_TTL
+    collection = db.collection(CONVERSION_CACHE_COLLECTION)
+
+    expired = []
+    total_size = 0
+    query = collection.order_by("last_access", direction="DESCENDING").select(["path", "size", "last_access"])
+    for snapshot in query.stream():
+        entry = snapshot.to_dict()
+        total_size += entry.get("size", 0)
+        if entry["last_access"] < cutoff or total_size > CONVERSION_CACHE_MAX_BYTES:
+            expired.append((snapshot.reference, entry["path"]))
+
+    if not expired:
+        return 0
+
+    delete_blobs(path for _, path in expired)
+    batch = db.batch()
+    for index, (reference, _) in enumerate(expired, start=1):
+        batch.delete(reference)
+        if index % WRITE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return len(expired)
+
+def delete_user_conversions(user_uid: str, matches: Optional[Callable[[str], bool]] = None) -> int:
+    """
+    Borra las conversiones del usuario (solo las de los modelos para los que
+    `matches(source_path)` sea cierto, si se indica) junto con sus artefactos.
+    """
+    query = db.collection(CONVERSION_CACHE_COLLECTION).where("user_uid", "==", user_uid)
+    snapshots = list(query.select(["source_path", "path"]).stream())
+    removed = [snapshot for snapshot in snapshots if matches is None or matches(snapshot.get("source_path"))]
+    if not removed:
+        return 0
+
+    # Un mismo artefacto (nombre por contenido) puede estar en entradas que se conservan.
+    removed_ids = {snapshot.id for snapshot in removed}
+    kept_paths = {snapshot.get("path") for snapshot in snapshots if snapshot.id not in removed_ids}
+    delete_blobs({snapshot.get("path") for snapshot in removed} - kept_paths)
+    batch = db.batch()
+    for index, snapshot in enumerate(removed, start=1):
+        batch.delete(snapshot.reference)
+        if index % WRITE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return len(removed)
+
+async def conversion_cache_janitor():
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(CONVERSION_CACHE_SWEEP_SECONDS)
+        try:
+            evicted = await loop.run_in_executor(None, evict_conversion_cache)
+            if evicted:
+                logging.info(f"Caché de conversiones: {evicted} artefactos expulsados.")
+        except Exception as e:
+            logging.warning(f"Error al limpiar la caché de conversiones: {e}")
@@ -0,0 +1,58 @@
+import base64
+import json
+from typing import Optional, List
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+GENERATION_FIELDS = {
+    "generation_name",
+    "prediction_type",
+    "timestamp",
+    "modelUrl",
+    "previewImageUrl",
+    "downloads",
+    "mesh_stats",
+    "raw_data",
+}
+
+SUMMARY_FIELDS = ["generation_name", "previewImageUrl", "modelUrl"]
+
+def encode_cursor(data: dict) -> str:
+    raw = json.dumps(data, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> dict:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(cursor + padding))
+    except (ValueError, TypeError) as e:
+        raise ValueError("El cursor de paginación no es válido.") from e
+
+    if not isinstance(data, dict):
+        raise ValueError("El cursor de paginación no es válido.")
+    return data
+
+def is_valid_position(position) -> bool:
+    return (
+        isinstance(position, dict)
+        and isinstance(position.get("timestamp"), str)
+        and isinstance(position.get("id"), str)
+    )
+
+def parse_fields(fields: Optional[str], summary: bool = False) -> Optional[List[str]]:
+    if summary:
+        return list(SUMMARY_FIELDS)
+    if not fields:
+        return None
+
+    requested = [field.strip() for field in fields.split(",") if field.strip()]
+    unknown = [field for field in requested if field not in GENERATION_FIELDS]
+    if unknown:
+        raise ValueError(f"Campos no válidos en 'fields': {', '.join(unknown)}")
+    return requested
+
+def project_fields(data: dict, fields: Optional[List[str]]) -> dict:
+    if fields is None:
+        return data
+    return {field: data[field] for field in fields if field in data}
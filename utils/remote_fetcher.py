@@ -0,0 +1,66 @@
+import asyncio
+import logging
+import os
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from utils.artifact_cache import artifact_cache
+from utils.http_client import get_http_client
+
+load_dotenv()
+
+REMOTE_FETCH_MAX_BYTES = int(float(os.getenv("REMOTE_FETCH_MAX_MB", "50")) * 1024 * 1024)
+REMOTE_FETCH_CHUNK_SIZE = 256 * 1024
+# Hosts desde los que se aceptan descargas; por defecto solo el Storage del proyecto.
+REMOTE_FETCH_ALLOWED_HOSTS = frozenset(
+    host.strip().lower() for host in os.getenv("REMOTE_FETCH_ALLOWED_HOSTS", "storage.googleapis.com").split(",") if host.strip()
+)
+
+class RemoteFileTooLargeError(ValueError):
+    pass
+
+class RemoteHostNotAllowedError(ValueError):
+    pass
+
+def _check_url(url: str):
+    parsed = urlparse(url)
+    if parsed.scheme != "https" or (parsed.hostname or "").lower() not in REMOTE_FETCH_ALLOWED_HOSTS:
+        raise RemoteHostNotAllowedError(f"No se permite descargar archivos de {parsed.hostname or url}.")
+
+async def fetch_to_file(url: str, destination_path: str, max_bytes: int = REMOTE_FETCH_MAX_BYTES, use_cache: bool = True):
+    """
+    Descarga `url` en `destination_path` por partes, sin cargar el cuerpo completo
+    en memoria, y corta la descarga si supera `max_bytes`. Solo se aceptan hosts de
+    REMOTE_FETCH_ALLOWED_HOSTS y no se siguen redirecciones. Las URLs descargadas
+    recientemente se sirven desde la caché local de artefactos.
+    """
+    _check_url(url)
+    loop = asyncio.get_running_loop()
+    # Las copias y la expulsión de la caché recorren el disco: van al executor.
+    if use_cache and await loop.run_in_executor(None, artifact_cache.fetch_into, url, destination_path):
+        logging.info(f"{url} servido desde la caché local de artefactos.")
+        return
+
+    client = get_http_client()
+    try:
+        async with client.stream("GET", url, follow_redirects=False) as response:
+            if response.is_redirect:
+                raise RemoteHostNotAllowedError(f"{url} responde con una redirección, que no se sigue.")
+            response.raise_for_status()
+            declared = response.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > max_bytes:
+                raise RemoteFileTooLargeError(f"El archivo remoto supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB.")
+
+            received = 0
+            with open(destination_path, "wb") as f:
+                async for chunk in response.aiter_bytes(REMOTE_FETCH_CHUNK_SIZE):
+                    received += len(chunk)
+                    if received > max_bytes:
+                        raise RemoteFileTooLargeError(f"El archivo remoto supera el tamaño máximo de {max_bytes // (1024 * 1024)} MB.")
+                    f.write(chunk)
+    except Exception:
+        if os.path.exists(destination_path):
+            os.remove(destination_path)
+        raise
+
+    if use_cache:
+        await loop.run_in_executor(None, artifact_cache.put, url, destination_path)
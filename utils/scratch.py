@@ -0,0 +1,148 @@
+import asyncio
+import contextvars
+import logging
+import os
+import shutil
+import tempfile
+import time
+import uuid
+from functools import partial
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Puede apuntar a un tmpfs (p. ej. /dev/shm/instant3d) para que los intermedios no toquen el disco.
+SCRATCH_ROOT = os.getenv("SCRATCH_ROOT", os.path.join(tempfile.gettempdir(), "instant3d_scratch"))
+SCRATCH_JOBS_DIR = os.path.join(SCRATCH_ROOT, "jobs")
+SCRATCH_JANITOR_INTERVAL_SECONDS = float(os.getenv("SCRATCH_JANITOR_INTERVAL_SECONDS", "60"))
+# Directorios sin trabajo activo más antiguos que esto se consideran huérfanos.
+SCRATCH_ORPHAN_GRACE_SECONDS = float(os.getenv("SCRATCH_ORPHAN_GRACE_SECONDS", "300"))
+# Por debajo de este espacio libre en el volumen se deja de despachar trabajos.
+SCRATCH_MIN_FREE_BYTES = int(float(os.getenv("SCRATCH_MIN_FREE_MB", "1024")) * 1024 * 1024)
+SCRATCH_MIN_FREE_RATIO = float(os.getenv("SCRATCH_MIN_FREE_RATIO", "0.05"))
+# Límite opcional del tamaño total de SCRATCH_ROOT (0 = sin límite).
+SCRATCH_QUOTA_BYTES = int(float(os.getenv("SCRATCH_QUOTA_MB", "0")) * 1024 * 1024)
+SCRATCH_GUARD_POLL_SECONDS = float(os.getenv("SCRATCH_GUARD_POLL_SECONDS", "5"))
+
+_current_workspace: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("job_workspace", default=None)
+_active_workspaces = set()
+_scratch_bytes = 0
+
+os.makedirs(SCRATCH_JOBS_DIR, exist_ok=True)
+
+def create_job_workspace(job_id: str) -> str:
+    workspace = os.path.join(SCRATCH_JOBS_DIR, job_id)
+    os.makedirs(workspace, exist_ok=True)
+    _active_workspaces.add(workspace)
+    return workspace
+
+async def release_job_workspace(workspace: str):
+    _active_workspaces.discard(workspace)
+    await asyncio.get_running_loop().run_in_executor(None, partial(shutil.rmtree, workspace, ignore_errors=True))
+
+def set_current_workspace(workspace: Optional[str]) -> contextvars.Token:
+    return _current_workspace.set(workspace)
+
+def reset_current_workspace(token: contextvars.Token):
+    _current_workspace.reset(token)
+
+def current_workspace() -> str:
+    """
+    Directorio de trabajo del job en curso. Fuera de un worker (rutas, scripts) se
+    usa un directorio compartido que el janitor limpia por antigüedad.
+    """
+    workspace = _current_workspace.get()
+    if workspace is None:
+        workspace = os.path.join(SCRATCH_ROOT, "shared")
+        os.makedirs(workspace, exist_ok=True)
+    return workspace
+
+def job_path(filename: str) -> str:
+    return os.path.join(current_workspace(), os.path.basename(filename))
+
+def job_subdir(prefix: str) -> str:
+    path = os.path.join(current_workspace(), f"{prefix}{uuid.uuid4().hex}")
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+def _remove_entry(entry: os.DirEntry):
+    if entry.is_dir(follow_symlinks=False):
+        shutil.rmtree(entry.path, ignore_errors=True)
+    else:
+        os.remove(entry.path)
+
+def _sweep() -> int:
+    """Borra los directorios huérfanos y devuelve el tamaño total del scratch."""
+    now = time.time()
+    removed = 0
+    for entry in os.scandir(SCRATCH_JOBS_DIR):
+        if entry.path in _active_workspaces:
+            continue
+        try:
+            if now - entry.stat().st_mtime < SCRATCH_ORPHAN_GRACE_SECONDS:
+                continue
+            _remove_entry(entry)
+        except OSError:
+            continue
+        removed += 1
+
+    shared = os.path.join(SCRATCH_ROOT, "shared")
+    if os.path.isdir(shared):
+        for entry in os.scandir(shared):
+            try:
+                if now - entry.stat().st_mtime >= SCRATCH_ORPHAN_GRACE_SECONDS:
+                    _remove_entry(entry)
+                    removed += 1
+            except OSError:
+                continue
+
+    if removed:
+        logging.info(f"Janitor de scratch: {removed} entradas huérfanas eliminadas.")
+    return _tree_size(SCRATCH_ROOT)
+
+async def scratch_janitor():
+    global _scratch_bytes
+    loop = asyncio.get_running_loop()
+    logging.info(f"Janitor de scratch iniciado en {SCRATCH_ROOT}.")
+    while True:
+        try:
+            _scratch_bytes = await loop.run_in_executor(None, _sweep)
+        except Exception as e:
+            logging.error(f"Error en el janitor de scratch: {e}", exc_info=True)
+        await asyncio.sleep(SCRATCH_JANITOR_INTERVAL_SECONDS)
+
+def disk_status() -> dict:
+    usage = shutil.disk_usage(SCRATCH_ROOT)
+    low_space = usage.free < SCRATCH_MIN_FREE_BYTES or usage.free / usage.total < SCRATCH_MIN_FREE_RATIO
+    over_quota = bool(SCRATCH_QUOTA_BYTES) and _scratch_bytes >= SCRATCH_QUOTA_BYTES
+    return {
+        "root": SCRATCH_ROOT,
+        "free_bytes": usage.free,
+        "total_bytes": usage.total,
+        "scratch_bytes": _scratch_bytes,
+        "quota_bytes": SCRATCH_QUOTA_BYTES or None,
+        "active_jobs": len(_active_workspaces),
+        "dispatch_paused": low_space or over_quota,
+    }
+
+async def wait_for_disk_space():
+    """Bloquea el despacho mientras el volumen de scratch esté casi lleno."""
+    paused_since = None
+    while disk_status()["dispatch_paused"]:
+        if paused_since is None:
+            paused_since = time.monotonic()
+            logging.warning(f"Poco espacio en {SCRATCH_ROOT}: se pausa el despacho de trabajos.")
+        await asyncio.sleep(SCRATCH_GUARD_POLL_SECONDS)
+    if paused_since is not None:
+        logging.info(f"Despacho reanudado tras {time.monotonic() - paused_since:.0f}s sin espacio en {SCRATCH_ROOT}.")
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Optional
+from dotenv import load_dotenv
+from utils.http_client import get_http_client
+
+load_dotenv()
+
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_TICK_SECONDS = float(os.getenv("WARMUP_TICK_SECONDS", "5"))
+WARMUP_MIN_INTERVAL_SECONDS = float(os.getenv("WARMUP_MIN_INTERVAL_SECONDS", "60"))
+WARMUP_MAX_INTERVAL_SECONDS = float(os.getenv("WARMUP_MAX_INTERVAL_SECONDS", "900"))
+# Sin trabajos durante este tiempo se deja de hacer ping y el Space puede dormirse.
+WARMUP_IDLE_AFTER_SECONDS = float(os.getenv("WARMUP_IDLE_AFTER_SECONDS", "3600"))
+WARMUP_DEMAND_WINDOW_SECONDS = float(os.getenv("WARMUP_DEMAND_WINDOW_SECONDS", "900"))
+WARMUP_WAKE_POLL_SECONDS = float(os.getenv("WARMUP_WAKE_POLL_SECONDS", "10"))
+WARMUP_WAKE_TIMEOUT_SECONDS = float(os.getenv("WARMUP_WAKE_TIMEOUT_SECONDS", "300"))
+WARMUP_PING_TIMEOUT_SECONDS = float(os.getenv("WARMUP_PING_TIMEOUT_SECONDS", "20"))
+# Un ping correcto se da por válido durante este tiempo como mínimo; si el intervalo
+# de ping actual es mayor, el estado dura hasta el siguiente ping (ver awake_ttl).
+WARMUP_AWAKE_TTL_SECONDS = float(os.getenv("WARMUP_AWAKE_TTL_SECONDS", "300"))
+# Peso de la tasa actual en la media móvil exponencial de la demanda.
+WARMUP_DEMAND_SMOOTHING = 0.3
+
+# Variable de entorno con la URL del Space que atiende cada tipo de trabajo.
+SPACE_URL_ENV = {
+    'Texto3D': "CLIENT_TEXTO3D_URL",
+    'Imagen3D': "CLIENT_IMAGEN3D_URL",
+    'TextoImagen2D': "CLIENT_TEXTOIMAGEN3D_URL",
+    'TextImg3D': "CLIENT_TEXTOIMAGEN3D_URL",
+    'Unico3D': "CLIENT_UNICO3D_URL",
+    'MultiImagen3D': "CLIENT_MULTI3D_URL",
+    'Boceto3D': "CLIENT_BOCETO3D_URL",
+    'Retexturize3D': "CLIENT_RETEXTURE3D_URL",
+}
+
+# Sustituye todos los Spaces por un único servidor, p. ej. el Space simulado de
+# fakes/gradio_space.py en pruebas de carga.
+HF_SPACE_OVERRIDE_URL = os.getenv("HF_SPACE_OVERRIDE_URL")
+
+def resolve_space_url(source: str) -> str:
+    return HF_SPACE_OVERRIDE_URL or source
+
+def space_base_url(source: str) -> str:
+    """Convierte 'usuario/space' en su dominio *.hf.space; las URLs se usan tal cual."""
+    if source.startswith(("http://", "https://")):
+        return source.rstrip("/")
+    owner, name = source.strip("/").split("/", 1)
+    host = f"{owner}-{name}".lower().replace("_", "-").replace(".", "-")
+    return f"https://{host}.hf.space"
+
+class _SpaceState:
+    def __init__(self, source: str):
+        self.source = source
+        self.ping_url = f"{space_base_url(resolve_space_url(source))}/config"
+        self.last_ping: Optional[float] = None
+        self.last_awake: Optional[float] = None
+        self.last_demand: Optional[float] = None
+        self.consecutive_failures = 0
+        self.enqueues = deque()
+        self.predicted_rate = 0.0
+        self.wake_requested = False
+        self.awake_event = asyncio.Event()
+
+    def awake_ttl(self) -> float:
+        # Con poca demanda los pings se espacian más que el TTL base; sin este margen
+        # un Space despierto se daría por dormido entre dos pings.
+        interval = self.ping_interval()
+        if interval is None:
+            return WARMUP_AWAKE_TTL_SECONDS
+        return max(WARMUP_AWAKE_TTL_SECONDS, interval + WARMUP_PING_TIMEOUT_SECONDS + WARMUP_TICK_SECONDS)
+
+    def is_awake(self, now: float) -> bool:
+        return self.last_awake is not None and now - self.last_awake < self.awake_ttl()
+
+    def current_rate(self, now: float) -> float:
+        while self.enqueues and now - self.enqueues[0] > WARMUP_DEMAND_WINDOW_SECONDS:
+            self.enqueues.popleft()
+        return len(self.enqueues) * 60 / WARMUP_DEMAND_WINDOW_SECONDS
+
+    def ping_interval(self) -> Optional[float]:
+        """Intervalo entre pings según la demanda prevista (trabajos por minuto)."""
+        if self.wake_requested:
+            return WARMUP_WAKE_POLL_SECONDS
+        if self.last_demand is None or time.monotonic() - self.last_demand > WARMUP_IDLE_AFTER_SECONDS:
+            return None
+        interval = WARMUP_MAX_INTERVAL_SECONDS / (1 + self.predicted_rate)
+        return max(WARMUP_MIN_INTERVAL_SECONDS, interval)
+
+class SpaceWarmupScheduler:
+    """
+    Mantiene despiertos los Spaces de Hugging Face con pings periódicos cuya
+    frecuencia sigue la demanda reciente de cada uno. El worker consulta su estado
+    antes de despachar un trabajo para no esperar un arranque en frío ocupando un
+    hueco del semáforo.
+    """
+    def __init__(self):
+        self._spaces: Dict[str, _SpaceState] = {}
+        self._job_spaces: Dict[str, _SpaceState] = {}
+
+    def _space_for(self, job_type: str) -> Optional[_SpaceState]:
+        if job_type in self._job_spaces:
+            return self._job_spaces[job_type]
+        source = os.getenv(SPACE_URL_ENV[job_type], "") if job_type in SPACE_URL_ENV else ""
+        space = None
+        if WARMUP_ENABLED and source:
+            space = self._spaces.setdefault(source, _SpaceState(source))
+        self._job_spaces[job_type] = space
+        return space
+
+    def record_demand(self, job_type: str):
+        space = self._space_for(job_type)
+        if space is not None:
+            space.last_demand = time.monotonic()
+            space.enqueues.append(space.last_demand)
+
+    def record_awake(self, job_type: str):
+        """Un trabajo que termina bien confirma que su Space está despierto."""
+        space = self._space_for(job_type)
+        if space is not None:
+            self._mark_awake(space)
+
+    def is_awake(self, job_type: str) -> bool:
+        space = self._space_for(job_type)
+        return space is None or space.is_awake(time.monotonic())
+
+    async def wait_until_awake(self, job_type: str) -> bool:
+        """
+        Pide despertar el Space y espera a que responda. Devuelve False si se agota
+        WARMUP_WAKE_TIMEOUT_SECONDS; el llamador despacha el trabajo igualmente.
+        """
+        space = self._space_for(job_type)
+        if space is None or space.is_awake(time.monotonic()):
+            return True
+        space.awake_event.clear()
+        space.wake_requested = True
+        space.last_ping = None
+        try:
+            await asyncio.wait_for(space.awake_event.wait(), timeout=WARMUP_WAKE_TIMEOUT_SECONDS)
+            return True
+        except asyncio.TimeoutError:
+            logging.warning(f"El Space {space.source} no respondió tras {WARMUP_WAKE_TIMEOUT_SECONDS:.0f}s; se despacha igualmente.")
+            space.wake_requested = False
+            return False
+
+    def _mark_awake(self, space: _SpaceState):
+        space.last_awake = time.monotonic()
+        space.consecutive_failures = 0
+        space.wake_requested = False
+        space.awake_event.set()
+
+    async def _ping(self, space: _SpaceState):
+        space.last_ping = time.monotonic()
+        headers = {"Authorization": f"Bearer {os.getenv('HF_TOKEN')}"} if os.getenv("HF_TOKEN") else {}
+        try:
+            response = await get_http_client().get(space.ping_url, headers=headers, timeout=WARMUP_PING_TIMEOUT_SECONDS)
+            awake = response.status_code == 200
+        except Exception as e:
+            logging.debug(f"Ping a {space.ping_url} fallido: {e}")
+            awake = False
+
+        if awake:
+            if not space.is_awake(time.monotonic()):
+                logging.info(f"Space {space.source} despierto.")
+            self._mark_awake(space)
+        else:
+            # Un Space dormido responde con error mientras arranca; el ping ya lo despierta.
+            space.consecutive_failures += 1
+            space.last_awake = None
+
+    def _due_spaces(self):
+        now = time.monotonic()
+        due = []
+        for space in self._spaces.values():
+            current = space.current_rate(now)
+            space.predicted_rate = (
+                WARMUP_DEMAND_SMOOTHING * current + (1 - WARMUP_DEMAND_SMOOTHING) * space.predicted_rate
+            )
+            interval = space.ping_interval()
+            if interval is not None and (space.last_ping is None or now - space.last_ping >= interval):
+                due.append(space)
+        return due
+
+    async def run(self):
+        for job_type in SPACE_URL_ENV:
+            self._space_for(job_type)
+        if not self._spaces:
+            logging.info("No hay Spaces configurados para el precalentamiento.")
+            return
+        logging.info(f"Programador de precalentamiento iniciado para {len(self._spaces)} Spaces.")
+        while True:
+            due = self._due_spaces()
+            if due:
+                await asyncio.gather(*(self._ping(space) for space in due))
+            await asyncio.sleep(WARMUP_TICK_SECONDS)
+
+    def snapshot(self) -> dict:
+        now = time.monotonic()
+        return {
+            space.source: {
+                "awake": space.is_awake(now),
+                "seconds_since_awake": round(now - space.last_awake, 1) if space.last_awake is not None else None,
+                "predicted_jobs_per_minute": round(space.predicted_rate, 3),
+                "ping_interval_seconds": round(space.ping_interval(), 1) if space.ping_interval() is not None else None,
+                "consecutive_failures": space.consecutive_failures,
+                "wake_requested": space.wake_requested,
+            }
+            for space in self._spaces.values()
+        }
+
+space_warmup = SpaceWarmupScheduler()
+
+async def space_warmup_scheduler():
+    await space_warmup.run()
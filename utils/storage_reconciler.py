@@ -0,0 +1,106 @@
+"""
+Busca y elimina archivos huérfanos: blobs de users/{uid}/generations/ que no
+aparecen en el storage_manifest de ningún documento de Firestore, y entradas de
+users/{uid}/inputs/ sin documento de referencias, además de subidas directas
+(users/{uid}/uploads/) que nunca llegaron a usarse. Los candidatos 2D pendientes
+(text2d_candidates) se respetan hasta que superan la antigüedad mínima.
+
+Uso:
+    python -m utils.storage_reconciler [--user UID] [--min-age-hours 24] [--apply]
+
+Sin --apply solo informa de lo que se eliminaría.
+"""
+import argparse
+import datetime
+import logging
+from config.firebase_config import db, bucket
+from services import SERVICE_INSTANCE_MAP
+from utils.storage_utils import delete_blobs
+from utils.input_store import INPUT_REFS_COLLECTION
+from services.textimg3d_service import CANDIDATES_COLLECTION
+
+# Margen para no tocar archivos de trabajos que todavía están en curso.
+DEFAULT_MIN_AGE_HOURS = 24
+
+def _referenced_paths(user_uid: str, cutoff: datetime.datetime):
+    referenced = set()
+    legacy_folders = []
+    expired_candidates = []
+
+    for service in SERVICE_INSTANCE_MAP.values():
+        generations_ref = db.collection('predictions').document(user_uid).collection(service.collection_name)
+        for snapshot in generations_ref.select(["storage_manifest"]).stream():
+            storage_manifest = snapshot.to_dict().get("storage_manifest")
+            if storage_manifest is None:
+                # Documento sin manifiesto: se considera referenciada toda su carpeta.
+                legacy_folders.append(f"users/{user_uid}/generations/{service.collection_name}/{snapshot.id}/")
+            else:
+                referenced.update(storage_manifest)
+
+    input_refs = db.collection('predictions').document(user_uid).collection(INPUT_REFS_COLLECTION)
+    for snapshot in input_refs.select(["path"]).stream():
+        referenced.add(snapshot.get("path"))
+
+    candidates = db.collection('predictions').document(user_uid).collection(CANDIDATES_COLLECTION)
+    for snapshot in candidates.stream():
+        data = snapshot.to_dict()
+        if datetime.datetime.fromisoformat(data["timestamp"]) > cutoff:
+            referenced.update(data.get("storage_manifest", []))
+        else:
+            expired_candidates.append(snapshot.reference)
+
+    return referenced, tuple(legacy_folders), expired_candidates
+
+def _find_orphans(user_uid: str, min_age_hours: float):
+    cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=min_age_hours)
+    referenced, legacy_folders, expired_candidates = _referenced_paths(user_uid, cutoff)
+
+    orphans = []
+    for prefix in (f"users/{user_uid}/generations/", f"users/{user_uid}/inputs/", f"users/{user_uid}/uploads/"):
+        for blob in bucket.list_blobs(prefix=prefix):
+            if blob.name in referenced or blob.name.startswith(legacy_folders):
+                continue
+            if blob.time_created and blob.time_created > cutoff:
+                continue
+            orphans.append(blob.name)
+    return orphans, expired_candidates
+
+def find_orphans(user_uid: str, min_age_hours: float = DEFAULT_MIN_AGE_HOURS) -> list:
+    return _find_orphans(user_uid, min_age_hours)[0]
+
+def reconcile_user(user_uid: str, apply: bool = False, min_age_hours: float = DEFAULT_MIN_AGE_HOURS) -> dict:
+    orphans, expired_candidates = _find_orphans(user_uid, min_age_hours)
+    deleted = delete_blobs(orphans) if apply and orphans else 0
+    if apply:
+        # Sus archivos ya se han borrado como huérfanos.
+        for candidates_ref in expired_candidates:
+            candidates_ref.delete()
+    return {"user_uid": user_uid, "orphans": orphans, "deleted": deleted}
+
+def _list_user_uids():
+    iterator = bucket.list_blobs(prefix="users/", delimiter="/")
+    for page in iterator.pages:
+        for prefix in page.prefixes:
+            yield prefix.split("/")[1]
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconciliación de archivos huérfanos en Storage.")
+    parser.add_argument("--user", help="UID de un único usuario. Por defecto se revisan todos.")
+    parser.add_argument("--min-age-hours", type=float, default=DEFAULT_MIN_AGE_HOURS)
+    parser.add_argument("--apply", action="store_true", help="Elimina los huérfanos encontrados.")
+    args = parser.parse_args()
+
+    user_uids = [args.user] if args.user else _list_user_uids()
+    total_orphans = total_deleted = 0
+    for user_uid in user_uids:
+        report = reconcile_user(user_uid, apply=args.apply, min_age_hours=args.min_age_hours)
+        for blob_name in report["orphans"]:
+            logging.info(f"Huérfano: {blob_name}")
+        total_orphans += len(report["orphans"])
+        total_deleted += report["deleted"]
+
+    logging.info(f"Huérfanos encontrados: {total_orphans}. Eliminados: {total_deleted}.")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    main()
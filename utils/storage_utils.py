@@ -1,5 +1,24 @@
 from config.firebase_config import bucket
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import Callable, Iterable, Optional, Tuple, Union
+from urllib.parse import urlparse, unquote
+import datetime
+import hashlib
+import logging
+import mimetypes
 import os
+import threading
+
+# Las peticiones batch de GCS admiten hasta 100 operaciones por llamada.
+DELETE_BATCH_SIZE = 100
+DELETE_MAX_WORKERS = int(os.getenv("STORAGE_DELETE_WORKERS", "8"))
+
+# Los objetos con nombre derivado de su contenido nunca cambian.
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+HASH_CHUNK_SIZE = 1024 * 1024
+SIGNED_UPLOAD_EXPIRATION = datetime.timedelta(minutes=int(os.getenv("SIGNED_UPLOAD_EXPIRATION_MINUTES", "30")))
+DOWNLOAD_CHUNK_SIZE = 8 * 1024 * 1024
 
 def upload_to_storage(file_source, destination_blob_name):
     blob = bucket.blob(destination_blob_name)
@@ -14,4 +33,196 @@ def upload_to_storage(file_source, destination_blob_name):
         blob.upload_from_file(file_source)
 
     blob.make_public()
-    return blob.public_url
\ No newline at end of file
+    return blob.public_url
+
+def file_sha256(file_source) -> str:
+    digest = hashlib.sha256()
+    if isinstance(file_source, str):
+        with open(file_source, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+                digest.update(chunk)
+    else:
+        file_source.seek(0)
+        for chunk in iter(lambda: file_source.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+        file_source.seek(0)
+    return digest.hexdigest()
+
+def content_addressed_name(filename: str, sha256: str) -> str:
+    stem, ext = os.path.splitext(filename)
+    return f"{stem}.{sha256[:16]}{ext}"
+
+def guess_content_type(filename: str) -> Optional[str]:
+    if filename.lower().endswith(".glb"):
+        return "model/gltf-binary"
+    return mimetypes.guess_type(filename)[0]
+
+# Blobs con un borrado diferido pendiente (cola de limpieza) y blobs que se están
+# borrando en este momento. Como los nombres direccionados por contenido se
+# reutilizan, una subida del mismo contenido debe cancelar el borrado pendiente y
+# esperar al que ya está en curso antes de dar el blob por existente.
+_pending_cleanups = set()
+_deleting = set()
+_cleanup_condition = threading.Condition()
+
+def mark_pending_cleanup(blob_paths: Iterable[str]):
+    with _cleanup_condition:
+        _pending_cleanups.update(blob_paths)
+
+def delete_pending_blobs(blob_paths: Iterable[str]) -> int:
+    """Borra los blobs de una limpieza diferida que nadie ha vuelto a reclamar."""
+    with _cleanup_condition:
+        claimed = [path for path in blob_paths if path in _pending_cleanups]
+        _pending_cleanups.difference_update(claimed)
+        _deleting.update(claimed)
+    try:
+        return delete_blobs(claimed) if claimed else 0
+    except Exception:
+        # Se devuelven a pendientes para el reintento, salvo que alguien los haya reclamado.
+        mark_pending_cleanup(claimed)
+        raise
+    finally:
+        with _cleanup_condition:
+            _deleting.difference_update(claimed)
+            _cleanup_condition.notify_all()
+
+def _claim_blob_path(blob_path: str):
+    with _cleanup_condition:
+        _cleanup_condition.wait_for(lambda: blob_path not in _deleting)
+        _pending_cleanups.discard(blob_path)
+
+def upload_immutable(file_source, folder: str, filename: str, content_type: Optional[str] = None):
+    """
+    Sube `file_source` como {folder}/{nombre}.{sha256[:16]}{ext} con Cache-Control
+    inmutable. Si el objeto ya existe (mismo contenido) no se vuelve a subir.
+    Devuelve (url_pública, ruta_del_blob).
+    """
+    blob_path = f"{folder}/{content_addressed_name(filename, file_sha256(file_source))}"
+    blob = bucket.blob(blob_path)
+    _claim_blob_path(blob_path)
+
+    if blob.exists():
+        logging.info(f"El archivo {blob_path} ya existe en Storage; se omite la subida.")
+        return blob.public_url, blob_path
+
+    blob.cache_control = IMMUTABLE_CACHE_CONTROL
+    content_type = content_type or guess_content_type(filename)
+    if isinstance(file_source, str):
+        blob.upload_from_filename(file_source, content_type=content_type)
+    else:
+        file_source.seek(0)
+        blob.upload_from_file(file_source, content_type=content_type)
+
+    blob.make_public()
+    return blob.public_url, blob_path
+
+def content_length_range(max_bytes: int) -> str:
+    return f"0,{max_bytes}"
+
+def generate_resumable_upload_url(blob_path: str, max_bytes: int, content_type: Optional[str] = None) -> str:
+    """
+    URL firmada (v4) para iniciar una subida reanudable directamente a GCS. El
+    cliente hace POST con las cabeceras `x-goog-resumable: start` y
+    `x-goog-content-length-range` (firmada, GCS rechaza objetos de más de
+    `max_bytes`) y sube los datos a la URL de sesión devuelta en Location.
+    """
+    return bucket.blob(blob_path).generate_signed_url(
+        version="v4",
+        expiration=SIGNED_UPLOAD_EXPIRATION,
+        method="RESUMABLE",
+        content_type=content_type,
+        headers={"x-goog-content-length-range": content_length_range(max_bytes)},
+    )
+
+def blob_head(blob_path: str, length: int) -> Optional[Tuple[int, bytes]]:
+    """Devuelve (tamaño, primeros `length` bytes) del blob o None si no existe."""
+    blob = bucket.get_blob(blob_path)
+    if blob is None:
+        return None
+    if not blob.size:
+        return 0, b""
+    return blob.size, blob.download_as_bytes(start=0, end=length - 1)
+
+def write_job_input(source: Union[bytes, dict], destination_path: str):
+    """
+    Escribe una entrada de trabajo en disco. `source` son los bytes recibidos en la
+    petición o {"storage_path": ...} para archivos subidos directamente a Storage,
+    que se descargan por partes solo cuando el trabajo empieza.
+    """
+    if isinstance(source, dict):
+        blob = bucket.blob(source["storage_path"])
+        blob.chunk_size = DOWNLOAD_CHUNK_SIZE
+        blob.download_to_filename(destination_path)
+        return
+
+    with open(destination_path, "wb") as f:
+        f.write(source)
+
+def blob_path_from_url(public_url: str) -> Optional[str]:
+    """
+    Convierte una URL pública (https://storage.googleapis.com/{bucket}/{ruta})
+    en la ruta del blob. Devuelve None si la URL no pertenece a nuestro bucket.
+    """
+    if not public_url:
+        return None
+    parsed = urlparse(public_url)
+    bucket_prefix = f"/{bucket.name}/"
+    if parsed.netloc != "storage.googleapis.com" or not parsed.path.startswith(bucket_prefix):
+        return None
+    return unquote(parsed.path[len(bucket_prefix):])
+
+def _delete_batch(blob_names: list) -> int:
+    """
+    Borra un lote y devuelve cuántos blobs se eliminaron. Un 404 (el blob ya no
+    existe) cuenta como borrado; cualquier otro error se lanza para que la cola de
+    limpieza reintente el lote.
+    """
+    with bucket.client.batch(raise_exception=False) as batch:
+        for blob_name in blob_names:
+            bucket.delete_blob(blob_name)
+
+    deleted, failures = 0, []
+    # Con raise_exception=False las respuestas de cada borrado quedan en _responses.
+    for blob_name, response in zip(blob_names, batch._responses):
+        if 200 <= response.status_code < 300:
+            deleted += 1
+        elif response.status_code != 404:
+            failures.append(f"{blob_name} ({response.status_code})")
+    if failures:
+        raise RuntimeError(f"No se pudieron borrar {len(failures)} de {len(blob_names)} archivos: {', '.join(failures[:5])}")
+    return deleted
+
+def delete_blobs(blob_names: Iterable[str], progress_callback: Optional[Callable[[int], None]] = None) -> int:
+    """
+    Elimina blobs en lotes de DELETE_BATCH_SIZE con como máximo DELETE_MAX_WORKERS
+    lotes en vuelo. Consume `blob_names` de forma perezosa, así que puede recibir
+    directamente el iterador paginado de list_blobs.
+    """
+    names = iter(blob_names)
+    deleted = 0
+    pending = set()
+
+    with ThreadPoolExecutor(max_workers=DELETE_MAX_WORKERS) as executor:
+        while True:
+            while len(pending) < DELETE_MAX_WORKERS:
+                chunk = list(islice(names, DELETE_BATCH_SIZE))
+                if not chunk:
+                    break
+                pending.add(executor.submit(_delete_batch, chunk))
+
+            if not pending:
+                break
+
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                deleted += future.result()
+            if progress_callback:
+                progress_callback(deleted)
+
+    return deleted
+
+def delete_prefix(prefix: str, progress_callback: Optional[Callable[[int], None]] = None) -> int:
+    blobs = bucket.list_blobs(prefix=prefix, fields="items(name),nextPageToken")
+    deleted = delete_blobs((blob.name for blob in blobs), progress_callback)
+    logging.info(f"Se eliminaron {deleted} archivos de Storage con el prefijo {prefix}.")
+    return deleted
@@ -0,0 +1,296 @@
+import asyncio
+import datetime
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import random
+import secrets
+import socket
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from config.firebase_config import db, firestore
+from utils.firestore_utils import WRITE_BATCH_SIZE
+from utils.cache_utils import get_or_load, invalidate_key
+from utils.http_client import get_webhook_http_client
+
+load_dotenv()
+
+WEBHOOKS_COLLECTION = "webhooks"
+WEBHOOK_DELIVERIES_COLLECTION = "webhook_deliveries"
+WEBHOOK_SIGNATURE_HEADER = "X-Instant3D-Signature"
+WEBHOOK_MAX_ATTEMPTS = int(os.getenv("WEBHOOK_MAX_ATTEMPTS", "8"))
+WEBHOOK_BACKOFF_BASE_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_BASE_SECONDS", "10"))
+WEBHOOK_BACKOFF_MAX_SECONDS = float(os.getenv("WEBHOOK_BACKOFF_MAX_SECONDS", "3600"))
+WEBHOOK_TIMEOUT_SECONDS = float(os.getenv("WEBHOOK_TIMEOUT_SECONDS", "10"))
+WEBHOOK_POLL_SECONDS = float(os.getenv("WEBHOOK_POLL_SECONDS", "15"))
+WEBHOOK_CONCURRENCY = int(os.getenv("WEBHOOK_CONCURRENCY", "10"))
+# Los envíos se borran por la política TTL de Firestore sobre `expire_at`
+# (firestore.indexes.json) pasado este tiempo desde que terminan.
+WEBHOOK_DELIVERY_RETENTION = datetime.timedelta(days=float(os.getenv("WEBHOOK_DELIVERY_RETENTION_DAYS", "7")))
+WEBHOOK_ALLOW_HTTP = os.getenv("WEBHOOK_ALLOW_HTTP", "false").lower() == "true"
+# Solo para desarrollo y pruebas locales: permite webhooks a direcciones internas.
+WEBHOOK_ALLOW_PRIVATE_HOSTS = os.getenv("WEBHOOK_ALLOW_PRIVATE_HOSTS", "false").lower() == "true"
+
+# Los trabajos de borrado de cuenta no notifican: el usuario ya no existe.
+WEBHOOK_EXCLUDED_JOB_TYPES = {'EliminarCuenta'}
+
+_wakeup: Optional[asyncio.Event] = None
+
+def _webhook_key(user_uid: str) -> str:
+    return f"webhook:{user_uid}"
+
+def _resolve_public_address(host: str, port: int):
+    """
+    Resuelve el host y devuelve una de sus direcciones. Falla si alguna no es
+    pública (loopback, red privada, link-local, metadatos de la nube...).
+    """
+    try:
+        infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"No se pudo resolver el host del webhook: {host}")
+    addresses = []
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not WEBHOOK_ALLOW_PRIVATE_HOSTS and (not address.is_global or address.is_multicast):
+            raise ValueError("La URL del webhook apunta a una dirección interna o reservada.")
+        addresses.append(address)
+    if not addresses:
+        raise ValueError(f"No se pudo resolver el host del webhook: {host}")
+    return addresses[0]
+
+def _default_port(parsed) -> int:
+    return parsed.port or (443 if parsed.scheme == "https" else 80)
+
+def validate_webhook_url(url: Any) -> str:
+    parsed = urlparse(url) if isinstance(url, str) else None
+    allowed_schemes = ("https", "http") if WEBHOOK_ALLOW_HTTP else ("https",)
+    if parsed is None or parsed.scheme not in allowed_schemes or not parsed.hostname:
+        raise ValueError("La URL del webhook debe ser una URL https válida.")
+    if parsed.username or parsed.password:
+        raise ValueError("La URL del webhook no puede incluir credenciales.")
+    try:
+        port = _default_port(parsed)
+    except ValueError:
+        raise ValueError("La URL del webhook tiene un puerto no válido.")
+    _resolve_public_address(parsed.hostname, port)
+    return url
+
+def _pinned_request(url: str):
+    """
+    Vuelve a validar el destino en el momento del envío (la resolución DNS puede
+    haber cambiado) y devuelve la URL dirigida a la IP comprobada, con la cabecera
+    Host y el SNI del host original.
+    """
+    parsed = urlparse(url)
+    address = _resolve_public_address(parsed.hostname, _default_port(parsed))
+    host = f"[{address}]" if address.version == 6 else str(address)
+    pinned_url = parsed._replace(netloc=f"{host}:{parsed.port}" if parsed.port else host).geturl()
+    host_header = f"{parsed.hostname}:{parsed.port}" if parsed.port else parsed.hostname
+    extensions = {"sni_hostname": parsed.hostname} if parsed.scheme == "https" else {}
+    return pinned_url, host_header, extensions
+
+def get_webhook(user_uid: str) -> Optional[dict]:
+    def load():
+        snapshot = db.collection(WEBHOOKS_COLLECTION).document(user_uid).get()
+        return snapshot.to_dict() if snapshot.exists else None
+
+    return get_or_load(_webhook_key(user_uid), load)
+
+def register_webhook(user_uid: str, url: Optional[str]) -> dict:
+    """
+    Guarda la URL de notificación del usuario (None para usar solo webhooks por
+    trabajo) y devuelve el secreto con el que se firman los envíos. El secreto se
+    conserva entre registros.
+    """
+    if url is not None:
+        validate_webhook_url(url)
+    current = get_webhook(user_uid) or {}
+    webhook = {
+        "url": url,
+        "secret": current.get("secret") or secrets.token_hex(32),
+        "updated_at": datetime.datetime.now(datetime.timezone.utc),
+    }
+    db.collection(WEBHOOKS_COLLECTION).document(user_uid).set(webhook)
+    invalidate_key(_webhook_key(user_uid))
+    return webhook
+
+def delete_webhook(user_uid: str):
+    db.collection(WEBHOOKS_COLLECTION).document(user_uid).delete()
+    invalidate_key(_webhook_key(user_uid))
+
+def delete_user_deliveries(user_uid: str) -> int:
+    """Borra todos los envíos del usuario, pendientes o no (purga de la cuenta)."""
+    query = db.collection(WEBHOOK_DELIVERIES_COLLECTION).where("user_uid", "==", user_uid).select([])
+    deleted = 0
+    batch = db.batch()
+    for snapshot in query.stream():
+        batch.delete(snapshot.reference)
+        deleted += 1
+        if deleted % WRITE_BATCH_SIZE == 0:
+            batch.commit()
+            batch = db.batch()
+    batch.commit()
+    return deleted
+
+def sign_payload(secret: str, timestamp: int, body: bytes) -> str:
+    digest = hmac.new(secret.encode("utf-8"), f"{timestamp}.".encode("utf-8") + body, hashlib.sha256).hexdigest()
+    return f"t={timestamp},v1={digest}"
+
+def _job_event(job_id: str, job: Dict[str, Any]) -> dict:
+    event = {
+        "event": f"job.{job['status']}",
+        "job_id": job_id,
+        "job_type": job["job_type"],
+        "batch_id": job.get("batch_id"),
+        "status": job["status"],
+    }
+    if job["status"] == "completed":
+        event["result"] = job["result"]
+    else:
+        event["error"] = job["error"]
+    return event
+
+def queue_job_deliveries(job_id: str, job: Dict[str, Any], job_url: Optional[str], include_user_url: bool = True) -> int:
+    """
+    Escribe en la cola persistente un envío por cada destino del trabajo: la URL
+    registrada para ese trabajo y, si se pide, la del usuario.
+    """
+    if job["job_type"] in WEBHOOK_EXCLUDED_JOB_TYPES:
+        return 0
+    webhook = get_webhook(job["user_id"])
+    if not webhook:
+        return 0
+
+    urls = {url for url in (job_url, webhook.get("url") if include_user_url else None) if url}
+    if not urls:
+        return 0
+
+    payload = json.dumps(_job_event(job_id, job), default=str)
+    now = datetime.datetime.now(datetime.timezone.utc)
+    batch = db.batch()
+    for url in urls:
+        batch.set(db.collection(WEBHOOK_DELIVERIES_COLLECTION).document(), {
+            "user_uid": job["user_id"],
+            "job_id": job_id,
+            "url": url,
+            "payload": payload,
+            "status": "pending",
+            "attempts": 0,
+            "next_attempt_at": now,
+            "created_at": now,
+            "last_error": None,
+            "expire_at": now + WEBHOOK_DELIVERY_RETENTION,
+        })
+    batch.commit()
+    return len(urls)
+
+async def notify_job_finished(job_id: str, job: Dict[str, Any], job_url: Optional[str] = None, include_user_url: bool = True):
+    try:
+        queued = await asyncio.get_running_loop().run_in_executor(
+            None, queue_job_deliveries, job_id, job, job_url, include_user_url
+        )
+    except Exception as e:
+        logging.error(f"No se pudieron encolar los webhooks del trabajo {job_id}: {e}", exc_info=True)
+        return
+    if queued and _wakeup is not None:
+        _wakeup.set()
+
+def _backoff_seconds(attempts: int) -> float:
+    delay = min(WEBHOOK_BACKOFF_BASE_SECONDS * (2 ** (attempts - 1)), WEBHOOK_BACKOFF_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+def _due_deliveries(limit: int):
+    # Necesita el índice compuesto (status, next_attempt_at) de firestore.indexes.json.
+    now = datetime.datetime.now(datetime.timezone.utc)
+    query = (
+        db.collection(WEBHOOK_DELIVERIES_COLLECTION)
+        .where("status", "==", "pending")
+        .where("next_attempt_at", "<=", now)
+        .order_by("next_attempt_at")
+        .limit(limit)
+    )
+    return list(query.stream())
+
+async def _deliver(snapshot, semaphore: asyncio.Semaphore):
+    delivery = snapshot.to_dict()
+    loop = asyncio.get_running_loop()
+    attempts = delivery["attempts"] + 1
+    error = None
+
+    async with semaphore:
+        try:
+            webhook = await loop.run_in_executor(None, get_webhook, delivery["user_uid"])
+            if not webhook:
+                raise PermissionError("El usuario ya no tiene un webhook registrado.")
+
+            pinned_url, host_header, extensions = await loop.run_in_executor(None, _pinned_request, delivery["url"])
+            body = delivery["payload"].encode("utf-8")
+            timestamp = int(time.time())
+            # Las redirecciones no se siguen: un 3xx cuenta como fallo del envío.
+            response = await get_webhook_http_client().post(
+                pinned_url,
+                content=body,
+                headers={
+                    "Host": host_header,
+                    "Content-Type": "application/json",
+                    WEBHOOK_SIGNATURE_HEADER: sign_payload(webhook["secret"], timestamp, body),
+                    "X-Instant3D-Delivery": snapshot.id,
+                },
+                extensions=extensions,
+                timeout=WEBHOOK_TIMEOUT_SECONDS,
+            )
+            if response.status_code >= 300:
+                error = f"HTTP {response.status_code}"
+        except PermissionError as e:
+            error = str(e)
+            attempts = WEBHOOK_MAX_ATTEMPTS
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+
+    now = datetime.datetime.now(datetime.timezone.utc)
+    # En un estado final ya no hace falta el payload (lleva el resultado completo).
+    final = {"payload": firestore.DELETE_FIELD, "expire_at": now + WEBHOOK_DELIVERY_RETENTION}
+    if error is None:
+        changes = {"status": "delivered", "attempts": attempts, "delivered_at": now, **final}
+    elif attempts >= WEBHOOK_MAX_ATTEMPTS:
+        logging.warning(f"Webhook {snapshot.id} descartado tras {attempts} intentos: {error}")
+        changes = {"status": "failed", "attempts": attempts, "last_error": error, **final}
+    else:
+        next_attempt = now + datetime.timedelta(seconds=_backoff_seconds(attempts))
+        changes = {"attempts": attempts, "last_error": error, "next_attempt_at": next_attempt}
+    await loop.run_in_executor(None, snapshot.reference.update, changes)
+
+async def webhook_delivery_worker():
+    """
+    Consume la cola persistente de envíos. Los pendientes sobreviven a reinicios
+    (entrega al menos una vez); los reintentos usan backoff exponencial con jitter.
+    """
+    global _wakeup
+    _wakeup = asyncio.Event()
+    semaphore = asyncio.Semaphore(WEBHOOK_CONCURRENCY)
+    loop = asyncio.get_running_loop()
+    logging.info("Worker de webhooks iniciado.")
+    try:
+        while True:
+            _wakeup.clear()
+            try:
+                due = await loop.run_in_executor(None, _due_deliveries, WEBHOOK_CONCURRENCY * 5)
+                await asyncio.gather(*(_deliver(snapshot, semaphore) for snapshot in due))
+            except Exception as e:
+                logging.error(f"Error en el worker de webhooks: {e}", exc_info=True)
+                due = []
+
+            if len(due) < WEBHOOK_CONCURRENCY * 5:
+                try:
+                    await asyncio.wait_for(_wakeup.wait(), timeout=WEBHOOK_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+    finally:
+        _wakeup = None